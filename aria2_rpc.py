@@ -0,0 +1,215 @@
+import os
+import json
+import time
+import uuid
+import socket
+import asyncio
+import logging
+import threading
+import subprocess
+from concurrent.futures import Future, TimeoutError
+import aiohttp
+import requests
+
+
+class Aria2Error(Exception):
+    """aria2 rejected an RPC call or a download ended without completing"""
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Aria2Daemon:
+    """One long-lived aria2c with JSON-RPC on localhost, shared by all downloads.
+
+    Downloads are submitted with add(), which returns a Future resolved from
+    aria2's websocket notifications (complete/error/stop), so connections and
+    DNS/TLS sessions are reused across files and no process is spawned per
+    file. A slow reconciliation poll covers notifications missed while the
+    websocket reconnects, and pending downloads fail if the daemon exits.
+    """
+    FINAL_STATES = ('complete', 'error', 'removed')
+
+    def __init__(self, max_concurrent=16, logger=None):
+        self.max_concurrent = max_concurrent
+        self.logger = logger or logging.getLogger(__name__)
+        self.port = _free_port()
+        self.secret = uuid.uuid4().hex
+        self.rpc_url = f"http://127.0.0.1:{self.port}/jsonrpc"
+        self._http = requests.Session()
+        self._process = None
+        self._pending = {}
+        self._finished = {}
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._loop = None
+
+    def start(self, timeout=10):
+        """Launch the daemon and wait until it answers RPC calls"""
+        self._process = subprocess.Popen([
+            "aria2c", "--enable-rpc", f"--rpc-listen-port={self.port}", "--rpc-listen-all=false",
+            f"--rpc-secret={self.secret}", f"--max-concurrent-downloads={self.max_concurrent}",
+            "--continue=true", "--file-allocation=none", "--auto-file-renaming=false",
+            "--allow-overwrite=true", "--max-download-result=1000", "--quiet"
+        ])
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                version = self.call("aria2.getVersion")['version']
+                break
+            except Exception:
+                if self._process.poll() is not None or time.monotonic() > deadline:
+                    self._process.kill()
+                    raise Aria2Error("aria2c RPC daemon did not start")
+                time.sleep(0.2)
+
+        threading.Thread(target=self._listen_thread, daemon=True).start()
+        threading.Thread(target=self._reconcile_loop, daemon=True).start()
+        self.logger.info(f"aria2c {version} RPC daemon listening on port {self.port}")
+
+    def call(self, method, *params):
+        response = self._http.post(self.rpc_url, timeout=10, json={
+            'jsonrpc': '2.0', 'id': uuid.uuid4().hex, 'method': method,
+            'params': [f"token:{self.secret}", *params]
+        })
+        result = response.json()
+        if 'error' in result:
+            raise Aria2Error(result['error'].get('message', str(result['error'])))
+        return result['result']
+
+    def add(self, url, file_path, segments=16):
+        """Start a download; the Future resolves to aria2's final status dict"""
+        gid = self.call("aria2.addUri", [url], {
+            'dir': os.path.dirname(os.path.abspath(file_path)),
+            'out': os.path.basename(file_path),
+            'split': str(segments),
+            'max-connection-per-server': str(min(segments, 16)),
+            'min-split-size': '1M'
+        })
+        future = Future()
+        with self._lock:
+            # The notification may already have arrived before we got the gid back
+            if gid in self._finished:
+                future.set_result(self._finished.pop(gid))
+            else:
+                self._pending[gid] = future
+        future.gid = gid
+        return future
+
+    def wait(self, future, poll_interval=30):
+        """Wait for a download's final status, asking aria2 directly if no notification turns up"""
+        while True:
+            try:
+                return future.result(timeout=poll_interval)
+            except TimeoutError:
+                if not self.alive():
+                    self._fail_pending("aria2c RPC daemon exited")
+                else:
+                    self._finish(future.gid)
+
+    def alive(self):
+        return self._process is not None and self._process.poll() is None and not self._closed.is_set()
+
+    def _fail_pending(self, message):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(Aria2Error(message))
+
+    def set_download_limit(self, rate):
+        """Cap the combined speed of all downloads in bytes per second, 0 for unlimited"""
+        self.call("aria2.changeGlobalOption", {'max-overall-download-limit': str(int(rate))})
+
+    def remove(self, gid):
+        try:
+            self.call("aria2.forceRemove", gid)
+        except Exception:
+            pass
+
+    def active(self):
+        """Live progress of running downloads: gid -> completed bytes, total bytes and speed"""
+        try:
+            downloads = self.call("aria2.tellActive", ['gid', 'completedLength', 'totalLength', 'downloadSpeed'])
+        except Exception:
+            return {}
+        return {
+            item['gid']: {
+                'completed': int(item['completedLength']),
+                'total': int(item['totalLength']),
+                'speed': int(item['downloadSpeed'])
+            }
+            for item in downloads
+        }
+
+    def _finish(self, gid):
+        try:
+            status = self.call("aria2.tellStatus", gid, ['gid', 'status', 'errorCode', 'errorMessage',
+                                                         'completedLength', 'totalLength'])
+        except Exception as e:
+            self.logger.warning(f"aria2 status lookup failed for {gid}: {str(e)}")
+            return
+        if status['status'] not in self.FINAL_STATES:
+            return
+        with self._lock:
+            future = self._pending.pop(gid, None)
+            if future is None:
+                self._finished[gid] = status
+        if future is not None:
+            future.set_result(status)
+
+    def _listen_thread(self):
+        self._loop = asyncio.new_event_loop()
+        self._loop.run_until_complete(self._listen())
+
+    async def _listen(self):
+        ws_url = self.rpc_url.replace("http://", "ws://")
+        async with aiohttp.ClientSession() as session:
+            while not self._closed.is_set():
+                try:
+                    async with session.ws_connect(ws_url, heartbeat=30) as ws:
+                        async for message in ws:
+                            if message.type != aiohttp.WSMsgType.TEXT:
+                                continue
+                            event = json.loads(message.data)
+                            if event.get('method') in ('aria2.onDownloadComplete', 'aria2.onDownloadError',
+                                                       'aria2.onDownloadStop'):
+                                for param in event.get('params', []):
+                                    self._loop.run_in_executor(None, self._finish, param['gid'])
+                except Exception as e:
+                    if not self._closed.is_set():
+                        self.logger.warning(f"aria2 notification socket dropped: {str(e)}")
+                await asyncio.sleep(1)
+
+    def _reconcile_loop(self):
+        while not self._closed.wait(15):
+            if self._process.poll() is not None:
+                self.logger.error(f"aria2c RPC daemon exited with code {self._process.returncode}")
+                self._fail_pending("aria2c RPC daemon exited")
+                continue
+            with self._lock:
+                gids = list(self._pending)
+            for gid in gids:
+                self._finish(gid)
+
+    def shutdown(self):
+        """Stop the daemon; unfinished downloads keep their .aria2 control files and resume next time"""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        try:
+            self.call("aria2.forceShutdown")
+        except Exception:
+            pass
+        if self._process:
+            try:
+                self._process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for gid, future in pending.items():
+            future.set_result({'gid': gid, 'status': 'removed', 'errorMessage': 'aria2c daemon stopped'})
@@ -0,0 +1,132 @@
+import time
+import asyncio
+import logging
+import threading
+
+
+class RateLimiter:
+    """Token bucket in bytes per second, shared by every transfer in one direction.
+
+    reserve() books the bytes right away and returns how long the caller has
+    to wait for them, so concurrent callers queue up behind each other rather
+    than all sleeping the same amount. rate=0 means unlimited.
+    """
+    def __init__(self, rate=0):
+        self.rate = rate
+        self._tokens = 0
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def set_rate(self, rate):
+        with self._lock:
+            self.rate = rate
+
+    def reserve(self, size):
+        if not self.rate:
+            return 0
+        with self._lock:
+            now = time.monotonic()
+            # At most a second's worth of unused bandwidth carries over
+            self._tokens = min(self.rate, self._tokens + (now - self._last) * self.rate) - size
+            self._last = now
+            return -self._tokens / self.rate if self._tokens < 0 else 0
+
+    def wait(self, size):
+        delay = self.reserve(size)
+        if delay:
+            time.sleep(delay)
+
+    async def wait_async(self, size):
+        delay = self.reserve(size)
+        if delay:
+            await asyncio.sleep(delay)
+
+
+class BandwidthAllocator:
+    """Splits bandwidth between downloads and uploads by how much is waiting to be uploaded.
+
+    With a total budget, downloads get 80% of it while the upload backlog is
+    empty, shrinking to 20% as the backlog reaches twice backlog_target, and
+    uploads get the rest; per-direction limits cap each side on top. With only
+    per-direction limits, the download limit is scaled down once the backlog
+    passes backlog_target. Listeners registered with on_change() are told the
+    new rates, for backends that enforce limits themselves.
+    """
+    def __init__(self, download_limit=0, upload_limit=0, total_limit=0, backlog_target=1024 * 1024 * 1024,
+                 interval=5, logger=None):
+        self.download_limit = download_limit
+        self.upload_limit = upload_limit
+        self.total_limit = total_limit
+        self.backlog_target = backlog_target
+        self.interval = interval
+        self.logger = logger or logging.getLogger(__name__)
+        self.download = RateLimiter()
+        self.upload = RateLimiter()
+        self._share = 0.8  # Download share of a total budget, starting from an empty backlog
+        self._listeners = []
+        self._stop = threading.Event()
+        self._apply(*self._split(0))
+
+    @property
+    def enabled(self):
+        return bool(self.download_limit or self.upload_limit or self.total_limit)
+
+    def on_change(self, callback):
+        """Call callback(download_rate, upload_rate) now and whenever the split changes"""
+        self._listeners.append(callback)
+        callback(self.download.rate, self.upload.rate)
+
+    def start(self, backlog):
+        """Rebalance periodically from backlog(), the number of bytes waiting to be uploaded"""
+        if self.enabled:
+            threading.Thread(target=self._run, args=(backlog,), daemon=True).start()
+
+    def per_download(self, slots):
+        """Rate for one download process out of `slots` concurrent ones, 0 for unlimited"""
+        return int(self.download.rate / max(slots, 1)) if self.download.rate else 0
+
+    def _rates(self, backlog):
+        """Move the split towards the current backlog and return (download, upload)"""
+        pressure = min(backlog / self.backlog_target, 2) if self.backlog_target else 0
+        self._share = 0.5 * self._share + 0.5 * (0.8 - 0.3 * pressure)
+        return self._split(pressure)
+
+    def _split(self, pressure):
+        if self.total_limit:
+            download = self.total_limit * self._share
+            upload = self.total_limit - download
+            if self.download_limit:
+                download = min(download, self.download_limit)
+            if self.upload_limit:
+                upload = min(upload, self.upload_limit)
+            return int(download), int(upload)
+        download = self.download_limit * max(0.25, min(1, 2 - pressure))
+        return int(download), self.upload_limit
+
+    def _apply(self, download, upload):
+        changed = (abs(download - self.download.rate) > 0.05 * max(self.download.rate, 1)
+                   or abs(upload - self.upload.rate) > 0.05 * max(self.upload.rate, 1))
+        if not changed:
+            return False
+        self.download.set_rate(download)
+        self.upload.set_rate(upload)
+        for callback in self._listeners:
+            try:
+                callback(download, upload)
+            except Exception as e:
+                self.logger.warning(f"Failed to apply bandwidth limits: {str(e)}")
+        return True
+
+    def _run(self, backlog):
+        while not self._stop.wait(self.interval):
+            try:
+                pending = backlog()
+            except Exception:
+                continue
+            download, upload = self._rates(pending)
+            if self._apply(download, upload):
+                self.logger.info(f"Bandwidth: download {download / 1024:.0f} KB/s, upload {upload / 1024:.0f} KB/s "
+                                 f"({pending / 1024 / 1024:.0f} MB waiting to upload)")
+
+    def stop(self):
+        self._stop.set()
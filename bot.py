@@ -1,11 +1,14 @@
 import os
 import time
 import json
-import logging
 import argparse
 import subprocess
 import requests
 import re
+import queue
+import shutil
+import threading
+import functools
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
@@ -16,68 +19,158 @@ from selenium.common.exceptions import TimeoutException, NoSuchElementException
 from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from urllib.parse import urlparse, parse_qs
-from bs4 import BeautifulSoup
+from card_parser import CardParserPool, CARD_SELECTOR
+from scheduling import PriorityTaskQueue
+from concurrency import AdjustableLimiter, TransferStats
+from url_resolver import UrlResolver, LinkExpired, find_video_source, find_pdf_link, normalize_source
+from streams import StreamDownloader, is_stream_manifest
+from aria2_rpc import Aria2Daemon
+from stall_watchdog import Watchdog
+from planner import load_planned_sizes
+from sharding import shard_for, shard_suffix
+from progress import TransferProgress
+from bandwidth import BandwidthAllocator
+from selection import Selection, LANGUAGES, KINDS, natural_key
+from daemon import SyncDaemon
+from logging_setup import queued_logger
+
+# Per-card INFO lines are rate-limited together (see logging_setup.SampleFilter)
+CARD_LOG = {'sample': 'card'}
+
+def uses_driver(method):
+    """Serialize access to the shared WebDriver between the crawl and download threads"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.driver_lock:
+            return method(self, *args, **kwargs)
+    return wrapper
 
 class UdvashDownloader:
     def __init__(self, user_id, password, max_parallel_downloads=3, download_dir="downloads", 
                 download_archive=True, download_marathon=True, download_bangla=True,
-                download_english=True, create_json=True):
+                download_english=True, create_json=True, parse_workers=2,
+                queue_policy="fifo", queue_aging=None, max_download_workers=None, segments=64,
+                cookies_file=None, url_expiry_margin=120, download_backend="process",
+                stall_window=300, stall_min_rate=1024, dedup_languages=False, dedup_head=False,
+                shard_index=0, shard_count=1, progress=None, bandwidth=None, selection=None,
+                content_types=None):
         # Setup logging
         self.setup_logger()
         
+        # One aggregate progress line for all transfers (shared with the uploader when there is one)
+        self._owns_progress = progress is None
+        self.progress = progress or TransferProgress()
+        
         # Login credentials
         self.user_id = user_id
         self.password = password
+        self.cookies_file = cookies_file
         
         # Download settings
         self.download_dir = download_dir
         self.max_parallel_downloads = max_parallel_downloads
+        # Worker threads are started up to the configured upper bound; the limiter decides how many run
+        self.max_download_workers = max(max_download_workers or 0, max_parallel_downloads)
+        self.download_limiter = AdjustableLimiter(max_parallel_downloads)
+        self.download_stats = TransferStats()
+        self.segments = segments
         self.active_downloads = 0
-        self.download_queue = []
+        self.download_queue = PriorityTaskQueue(queue_policy, queue_aging)
+        self.in_flight_downloads = {}
+        self.download_offsets = {}
+        self.download_lock = threading.Lock()
+        self.catalog_order = 0
+        self.http = requests.Session()
+        
+        # Download bandwidth budget (split with uploads by the allocator when there are any)
+        self.bandwidth = bandwidth or BandwidthAllocator(logger=self.logger)
+        
+        # HLS/DASH lectures are fetched segment by segment over the pooled session
+        self.stream_downloader = StreamDownloader(self.http, logger=self.logger, limiter=self.bandwidth.download)
+        
+        # Download URLs are resolved just before each download starts
+        self.url_resolver = UrlResolver(self.resolve_url, margin=url_expiry_margin, logger=self.logger)
+        
+        # Language variants that resolve to the same object are fetched once
+        self.dedup_languages = dedup_languages
+        self.dedup_head = dedup_head
+        self.sources = {}        # (card, fingerprint) -> file path of the variant being fetched
+        self.source_done = set() # those of them that finished
+        self.duplicates = {}     # file path -> tasks waiting on it
         
-        # Content options
-        self.download_archive = download_archive
-        self.download_marathon = download_marathon
-        self.download_bangla = download_bangla
-        self.download_english = download_english
+        # Shutdown state and running download subprocesses (so they can be stopped on a signal)
+        self.shutdown_requested = False
+        # Set at runtime by admin commands: chapters to leave out, and no new chapters once draining
+        self.skipped_chapters = set()  # (subject, chapter), lowercase
+        self.chapter_names = {}  # chapter index -> (subject, name)
+        self.draining = False
+        self.active_processes = set()
+        self.file_processes = {}
+        
+        # Downloads that make no progress for stall_window seconds are killed and requeued
+        self.watchdog = Watchdog(window=stall_window, min_rate=stall_min_rate, logger=self.logger)
+        
+        # "rpc" shares one aria2c daemon across all downloads instead of a process per file.
+        # A download budget also uses it, since the daemon applies limit changes to running downloads.
+        self.aria2 = None
+        self.active_gids = {}
+        if download_backend != "rpc" and (self.bandwidth.download_limit or self.bandwidth.total_limit):
+            self.logger.info("Download bandwidth is limited, using the aria2c RPC daemon")
+            download_backend = "rpc"
+        if download_backend == "rpc":
+            try:
+                self.aria2 = Aria2Daemon(max_concurrent=self.max_download_workers, logger=self.logger)
+                self.aria2.start()
+                if self.bandwidth.enabled:
+                    self.bandwidth.on_change(lambda download, upload: self.aria2.set_download_limit(download))
+            except Exception as e:
+                self.logger.error(f"aria2c RPC daemon unavailable, using one process per file: {str(e)}")
+                self.aria2 = None
+        
+        # What to crawl; each filter is applied before the page below it is loaded
+        self.selection = selection or Selection.from_flags(download_archive, download_marathon, download_bangla,
+                                                           download_english, content_types)
         self.create_json = create_json
         
         # Topic structure for JSON output
         self.topic_structure = {}
         
+        # With several shards, each runner takes the chapters that hash to its index
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        self.shard_suffix = shard_suffix(shard_index, shard_count)
+        self.catalog = {}
+        
         # Create download directory
         os.makedirs(download_dir, exist_ok=True)
         
+        # Sizes from the last plan run let size-aware queue policies work without probing
+        self.plan_path = os.path.join(download_dir, "plan.json")
+        self.planned_sizes = load_planned_sizes(self.plan_path, download_dir)
+        
+        # Card pages are parsed in worker processes, off the crawl thread
+        self.card_parser = CardParserPool(max_workers=parse_workers)
+        
         # Configure Chrome webdriver
+        self.driver_lock = threading.RLock()
         self.setup_webdriver()
         
         # Wait conditions
         self.wait = WebDriverWait(self.driver, 20)
         self.short_wait = WebDriverWait(self.driver, 5)
         
-        # Login to the website
-        if not self.login():
+        # Login to the website, reusing saved session cookies while the site accepts them
+        if not (self.restore_session() or self.login()):
             self.logger.error("Login failed! Exiting...")
             self.cleanup()
             exit(1)
+        
+        self.start_download_workers()
     
     def setup_logger(self):
         """Set up logging configuration"""
-        self.logger = logging.getLogger("udvash_downloader")
-        self.logger.setLevel(logging.INFO)
-        
-        # Create formatter
-        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-        
-        # Create console handler
-        console_handler = logging.StreamHandler()
-        console_handler.setFormatter(formatter)
-        self.logger.addHandler(console_handler)
-        
-        # Create file handler
-        file_handler = logging.FileHandler("udvash_downloader.log")
-        file_handler.setFormatter(formatter)
-        self.logger.addHandler(file_handler)
+        # Records are queued and written by a listener thread, so the crawl never waits on log I/O
+        self.logger = queued_logger("udvash_downloader", "udvash_downloader.log")
     
     def setup_webdriver(self):
         """Configure and initialize Chrome webdriver"""
@@ -93,12 +186,12 @@ class UdvashDownloader:
         self.driver.set_page_load_timeout(60)
         self.logger.info("WebDriver initialized successfully")
     
+    @uses_driver
     def login(self):
         """Handle login process"""
         self.logger.info("Attempting login...")
         try:
             self.driver.get("https://online.udvash-unmesh.com/Account/Login")
-            time.sleep(1)
             
             # Enter registration number
             reg_input = self.wait.until(EC.presence_of_element_located((By.ID, "RegistrationNumber")))
@@ -107,7 +200,6 @@ class UdvashDownloader:
             # Click continue
             continue_btn = self.wait.until(EC.element_to_be_clickable((By.ID, "btnSubmit")))
             continue_btn.click()
-            time.sleep(1)
             
             # Enter password
             pass_input = self.wait.until(EC.presence_of_element_located((By.ID, "Password")))
@@ -120,11 +212,92 @@ class UdvashDownloader:
             # Wait for dashboard
             self.wait.until(EC.url_contains("Dashboard"))
             self.logger.info("Login successful!")
+            self.save_session()
             return True
         except Exception as e:
             self.logger.error(f"Login failed: {str(e)}")
             return False
     
+    def _sync_http_cookies(self):
+        """Share the browser's session cookies with the HTTP session"""
+        for cookie in self.driver.get_cookies():
+            self.http.cookies.set(cookie['name'], cookie['value'], domain=cookie.get('domain'), path=cookie.get('path', '/'))
+    
+    def save_session(self):
+        """Store the session cookies so the next run can skip the login flow"""
+        self._sync_http_cookies()
+        if not self.cookies_file:
+            return
+        try:
+            with open(self.cookies_file, 'w', encoding='utf-8') as f:
+                json.dump(self.driver.get_cookies(), f)
+            os.chmod(self.cookies_file, 0o600)
+        except Exception as e:
+            self.logger.warning(f"Could not save session cookies: {str(e)}")
+    
+    @uses_driver
+    def restore_session(self):
+        """Reuse stored session cookies if the site still accepts them"""
+        if not self.cookies_file or not os.path.exists(self.cookies_file):
+            return False
+        try:
+            with open(self.cookies_file, encoding='utf-8') as f:
+                cookies = json.load(f)
+            
+            # Cookies can only be added for the domain that is currently loaded
+            self.driver.get("https://online.udvash-unmesh.com/Account/Login")
+            for cookie in cookies:
+                self.driver.add_cookie(cookie)
+            
+            # A rejected session redirects back to the login page
+            self.driver.get("https://online.udvash-unmesh.com/Dashboard")
+            if "Dashboard" in self.driver.current_url and "Login" not in self.driver.current_url:
+                self.logger.info("Reusing saved session, login skipped")
+                self._sync_http_cookies()
+                return True
+            self.logger.info("Saved session was rejected, logging in again")
+        except Exception as e:
+            self.logger.warning(f"Could not restore saved session: {str(e)}")
+        return False
+    
+    def ensure_session(self):
+        """Log in again if the site session expired; returns False if that failed"""
+        try:
+            response = self.http.get("https://online.udvash-unmesh.com/Dashboard", timeout=30)
+            if "Account/Login" not in response.url:
+                return True
+        except Exception as e:
+            # A network error says nothing about the session
+            self.logger.warning(f"Session check failed: {str(e)}")
+            return True
+        self.logger.info("Session expired, logging in again")
+        return self.login()
+    
+    @uses_driver
+    def recycle_driver(self):
+        """Restart Chrome, which grows steadily over a long run, and restore the session in it"""
+        self.logger.info("Restarting the browser...")
+        try:
+            self.driver.quit()
+        except Exception:
+            pass
+        self.setup_webdriver()
+        self.wait = WebDriverWait(self.driver, 20)
+        self.short_wait = WebDriverWait(self.driver, 5)
+        if not (self.restore_session() or self.login()):
+            self.logger.error("Login failed after restarting the browser")
+    
+    def end_poll(self):
+        """Called by the daemon after each poll cycle has queued its cards"""
+    
+    def trim_caches(self):
+        """Forget per-file bookkeeping of finished work while nothing is in flight (daemon mode)"""
+        with self.download_lock:
+            if self.in_flight_downloads or self.duplicates or self.download_queue.unfinished_tasks:
+                return
+            self.sources = {}
+            self.source_done = set()
+    
     def wait_for_elements(self, css_selector, timeout=20):
         """Wait for elements to be present and return them"""
         try:
@@ -136,6 +309,7 @@ class UdvashDownloader:
             self.logger.warning(f"Timeout waiting for elements: {css_selector}")
             return []
     
+    @uses_driver
     def get_subjects(self, course_type_id=2, master_course_id=11):
         """Get all subject links and names"""
         self.logger.info("Getting subjects...")
@@ -167,6 +341,7 @@ class UdvashDownloader:
         
         return subjects
     
+    @uses_driver
     def get_chapters(self, subject_url, subject_name):
         """Get all chapter links and names for a subject"""
         self.logger.info(f"Getting chapters for subject: {subject_name}")
@@ -189,6 +364,7 @@ class UdvashDownloader:
                     
                     chapters.append({
                         'index': f"{subject_name.split()[0]}.{idx}",
+                        'number': idx,
                         'name': chapter_name,
                         'url': href,
                         'id': chapter_id,
@@ -203,97 +379,38 @@ class UdvashDownloader:
             self.logger.error(f"Error getting chapters: {str(e)}")
             return []
     
+    @uses_driver
     def get_content_types(self, chapter_url, chapter_name):
         """Get content types (marathon, archive, etc.) for a chapter"""
         self.logger.info(f"Getting content types for chapter: {chapter_name}")
+        kinds = [(name, type_id) for name, type_id in KINDS.items() if self.selection.kind(name)]
+        if not kinds:
+            return [], '', '', ''
         try:
-            self.driver.get(chapter_url)
-            time.sleep(2)
-            
-            # Extract parameters from the current URL
-            url_parts = urlparse(self.driver.current_url)
-            query_params = parse_qs(url_parts.query)
+            # The card page URLs only need the IDs in the chapter link; the chapter page is
+            # loaded only if the link lacks some of them
+            query_params = parse_qs(urlparse(chapter_url).query)
+            if not all(query_params.get(key) for key in ('masterCourseId', 'subjectId', 'masterChapterId')):
+                self.driver.get(chapter_url)
+                time.sleep(2)
+                query_params = parse_qs(urlparse(self.driver.current_url).query)
             master_course_id = query_params.get('masterCourseId', [''])[0]
             subject_id = query_params.get('subjectId', [''])[0]
             master_chapter_id = query_params.get('masterChapterId', [''])[0]
             
-            content_types = []
-            
-            # Marathon content (masterContentTypeId=2)
-            if self.download_marathon:
-                marathon_url = f"https://online.udvash-unmesh.com/Content/DisplayContentCard?masterCourseId={master_course_id}" + \
-                              f"&subjectId={subject_id}&masterChapterId={master_chapter_id}&masterContentTypeId=2"
-                content_types.append({
-                    'name': 'Marathon',
-                    'url': marathon_url,
-                    'type_id': '2'
-                })
-            
-            # Archive content (masterContentTypeId=9)
-            if self.download_archive:
-                archive_url = f"https://online.udvash-unmesh.com/Content/DisplayContentCard?masterCourseId={master_course_id}" + \
-                             f"&subjectId={subject_id}&masterChapterId={master_chapter_id}&masterContentTypeId=9"
-                content_types.append({
-                    'name': 'Archive',
-                    'url': archive_url,
-                    'type_id': '9'
-                })
+            content_types = [{
+                'name': name,
+                'url': f"https://online.udvash-unmesh.com/Content/DisplayContentCard?masterCourseId={master_course_id}"
+                       f"&subjectId={subject_id}&masterChapterId={master_chapter_id}&masterContentTypeId={type_id}",
+                'type_id': type_id
+            } for name, type_id in kinds]
             
             return content_types, master_course_id, subject_id, master_chapter_id
         except Exception as e:
             self.logger.error(f"Error getting content types: {str(e)}")
             return [], '', '', ''
     
-    def get_topic_from_content_card(self, card_element):
-        """Extract topic name from content card HTML"""
-        try:
-            # Find the content div
-            content_div = card_element.find_element(By.CSS_SELECTOR, "div.content")
-            if not content_div:
-                return None
-                
-            # Get the HTML content
-            content_html = content_div.get_attribute('innerHTML')
-            
-            # Parse with BeautifulSoup
-            soup = BeautifulSoup(content_html, 'html.parser')
-            
-            # Try to find a strong tag with topic information (look for the second one, which is typically the topic)
-            # First, look for all strong tags or spans with strong inside
-            strong_elements = soup.find_all('strong')
-            if len(strong_elements) >= 2:
-                # The second strong element often contains the topic name
-                topic_text = strong_elements[1].get_text(strip=True)
-                self.logger.info(f"Extracted topic from strong element: {topic_text}")
-                return topic_text
-                
-            # If we couldn't find the topic in strong tags, try looking for it in the table cells
-            # Get all table cells
-            all_cells = soup.find_all('td')
-            
-            # Look for the cell that contains the "◾" character or has topic-like content
-            for cell in all_cells:
-                cell_text = cell.get_text(strip=True)
-                if "◾" in cell_text or (len(cell_text) > 5 and not cell_text.startswith("🔸")):
-                    # Process to clean up the text
-                    topic_text = re.sub(r'^\s*◾\s*', '', cell_text)
-                    self.logger.info(f"Extracted topic from cell: {topic_text}")
-                    return topic_text
-            
-            # If we still can't find a topic, look for the last non-empty cell as a fallback
-            non_empty_cells = [cell for cell in all_cells if cell.get_text(strip=True)]
-            if non_empty_cells:
-                topic_text = non_empty_cells[-1].get_text(strip=True)
-                topic_text = re.sub(r'^\s*◾\s*', '', topic_text)
-                self.logger.info(f"Extracted topic from last non-empty cell: {topic_text}")
-                return topic_text
-                
-            # If all else fails, return a default topic
-            return "General"
-        except Exception as e:
-            self.logger.error(f"Error extracting topic name: {str(e)}")
-            return "Unknown Topic"  # Return a default value instead of None
-    
+    @uses_driver
     def get_content_cards(self, content_type_url, content_type_name):
         """Get content cards from a content type page"""
         self.logger.info(f"Getting content cards for {content_type_name}...")
@@ -301,65 +418,36 @@ class UdvashDownloader:
             self.driver.get(content_type_url)
             time.sleep(2)
             
-            cards = []
-            card_elements = self.wait_for_elements("div.col-xl-3.col-lg-4.col-md-6.d-flex .card")
+            # Wait for the cards to render, then hand the raw HTML to the parser pool
+            if not self.wait_for_elements(CARD_SELECTOR):
+                return []
             
-            for idx, card in enumerate(card_elements, 1):
-                try:
-                    # Get card title
-                    title_elem = card.find_element(By.CSS_SELECTOR, "h2.uuu-wrap-title")
-                    title = title_elem.text.strip()
-                    
-                    # Get video and note links
-                    video_link = card.find_element(By.CSS_SELECTOR, "a.btn-video").get_attribute("href")
-                    note_link = card.find_element(By.CSS_SELECTOR, "a.btn-note").get_attribute("href")
-                    
-                    # Extract content ID from the link
-                    url_parts = urlparse(video_link)
-                    query_params = parse_qs(url_parts.query)
-                    content_id = query_params.get('masterContentId', [''])[0]
-                    
-                    # Extract topic information
-                    topic = self.get_topic_from_content_card(card)
-                    
-                    cards.append({
-                        'index': idx,
-                        'title': title,
-                        'video_link': video_link,
-                        'note_link': note_link,
-                        'content_id': content_id,
-                        'topic': topic
-                    })
-                    self.logger.info(f"Found content card {idx}: {title} (ID: {content_id}, Topic: {topic})")
-                except NoSuchElementException:
-                    self.logger.warning(f"Skipping a card that doesn't have all required elements")
-                except Exception as e:
-                    self.logger.error(f"Error processing content card: {str(e)}")
+            cards, skipped = self.card_parser.parse(self.driver.page_source, self.driver.current_url)
+            
+            for card in cards:
+                self.logger.info(f"Found content card {card['index']}: {card['title']} (ID: {card['content_id']}, Topic: {card['topic']})",
+                                 extra=CARD_LOG)
+            if skipped:
+                self.logger.warning(f"Skipped {skipped} cards that don't have all required elements")
             
             return cards
         except Exception as e:
             self.logger.error(f"Error getting content cards: {str(e)}")
             return []
     
+    @uses_driver
     def extract_video_url(self, video_page_url):
         """Extract video download URL from video page"""
-        self.logger.info(f"Extracting video URL from: {video_page_url}")
+        self.logger.info(f"Extracting video URL from: {video_page_url}", extra=CARD_LOG)
         try:
             self.driver.get(video_page_url)
             time.sleep(2)
             
             # Get page source and find video source
-            page_source = self.driver.page_source
-            video_src_match = re.search(r'<source src="([^"]+)" type="video/mp4">', page_source)
+            video_url = find_video_source(self.driver.page_source)
             
-            if video_src_match:
-                # Get the raw URL and decode HTML entities like &amp;
-                raw_video_url = video_src_match.group(1)
-                
-                # Replace HTML entities with proper characters
-                video_url = raw_video_url.replace("&amp;", "&")
-                
-                self.logger.info(f"Found video URL: {video_url[:100]}...")
+            if video_url:
+                self.logger.info(f"Found video URL: {video_url[:100]}...", extra=CARD_LOG)
                 return video_url
             else:
                 self.logger.warning("No video source found in the page")
@@ -368,9 +456,10 @@ class UdvashDownloader:
             self.logger.error(f"Error extracting video URL: {str(e)}")
             return None
     
+    @uses_driver
     def extract_pdf_url(self, pdf_page_url):
         """Extract PDF download URL from PDF/note page"""
-        self.logger.info(f"Extracting PDF URL from: {pdf_page_url}")
+        self.logger.info(f"Extracting PDF URL from: {pdf_page_url}", extra=CARD_LOG)
         try:
             self.driver.get(pdf_page_url)
             time.sleep(2)
@@ -383,7 +472,7 @@ class UdvashDownloader:
             pdf_url = raw_pdf_url.replace("&amp;", "&") if raw_pdf_url else None
             
             if pdf_url:
-                self.logger.info(f"Found PDF URL: {pdf_url[:100]}...")
+                self.logger.info(f"Found PDF URL: {pdf_url[:100]}...", extra=CARD_LOG)
                 return pdf_url
             else:
                 self.logger.warning("No PDF download link found")
@@ -395,25 +484,171 @@ class UdvashDownloader:
             self.logger.error(f"Error extracting PDF URL: {str(e)}")
             return None
     
+    def _run_process(self, args, file_path=None):
+        """Run a download subprocess, keeping track of it so a shutdown or the watchdog can stop it"""
+        process = subprocess.Popen(args)
+        with self.download_lock:
+            self.active_processes.add(process)
+            if file_path:
+                self.file_processes[file_path] = process
+        try:
+            returncode = process.wait()
+        finally:
+            with self.download_lock:
+                self.active_processes.discard(process)
+                self.file_processes.pop(file_path, None)
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, args)
+    
+    def _aria2_download(self, file_path, url):
+        """Download with aria2c, through the RPC daemon when it is running"""
+        if not self.aria2:
+            self._run_process(self._aria2c_args(file_path, url), file_path)
+            return
+        
+        future = self.aria2.add(url, file_path, self.segments)
+        with self.download_lock:
+            self.active_gids[file_path] = future.gid
+        try:
+            status = self.aria2.wait(future)
+        finally:
+            with self.download_lock:
+                self.active_gids.pop(file_path, None)
+        if status['status'] != 'complete':
+            raise RuntimeError(f"aria2c {status['status']}: {status.get('errorMessage') or status.get('errorCode')}")
+    
+    def _download_progress(self, file_path):
+        """Bytes on disk for a running download (yt-dlp writes a .part file, streams a .segments dir or .part.mp4)"""
+        total = sum(os.path.getsize(path) for path in (file_path, f"{file_path}.part", f"{file_path}.part.mp4")
+                    if os.path.exists(path))
+        segments_dir = f"{file_path}.segments"
+        if os.path.isdir(segments_dir):
+            total += sum(entry.stat().st_size for entry in os.scandir(segments_dir))
+        return total
+    
+    def _cancel_download(self, file_path):
+        """Stop a running download; it keeps its partial data and resumes when retried"""
+        with self.download_lock:
+            process = self.file_processes.get(file_path)
+            gid = self.active_gids.get(file_path)
+        if process:
+            process.kill()
+        if gid and self.aria2:
+            self.aria2.remove(gid)
+        # Segment fetches and ffmpeg of an HLS/DASH download
+        self.stream_downloader.cancel(file_path)
+    
+    def is_completed(self, file_path):
+        """Check whether a file was already fully downloaded"""
+        # aria2c keeps a .aria2 control file next to partial downloads
+        return os.path.exists(file_path) and not os.path.exists(f"{file_path}.aria2")
+    
+    def resolve_url(self, page_url, file_type):
+        """Resolve a video/note page to its download URL, over HTTP when the session allows it"""
+        try:
+            response = self.http.get(page_url, timeout=30)
+            # An expired session lands on the login page; the browser path below logs in again
+            if response.ok and "Account/Login" not in response.url:
+                if file_type == "video":
+                    url = find_video_source(response.text)
+                else:
+                    url = find_pdf_link(response.text, response.url)
+                if url:
+                    self.logger.info(f"Resolved {file_type} URL: {url[:100]}...", extra=CARD_LOG)
+                    return url
+        except Exception as e:
+            self.logger.warning(f"HTTP resolution failed, using the browser: {str(e)}")
+        
+        if file_type == "video":
+            return self.extract_video_url(page_url)
+        return self.extract_pdf_url(page_url)
+    
+    def _link_expired(self, url):
+        """Check whether the CDN rejects a signed URL"""
+        try:
+            response = self.http.head(url, allow_redirects=True, timeout=10)
+            return response.status_code in (401, 403, 410)
+        except Exception:
+            return False
+    
+    def _aria2c_args(self, file_path, url):
+        # -x is capped at 16 connections per server by aria2c; -s splits the file into segments.
+        # No preallocation, so the file size on disk tracks the bytes actually downloaded.
+        # Its own console readout is off; progress is reported by the aggregate progress line.
+        # A process keeps the cap it started with: an equal share for each download slot, so
+        # together they stay within the budget (the RPC daemon is used when it's available).
+        return ["aria2c", "-c", "-j", str(self.segments), "-x", str(min(self.segments, 16)),
+                "-s", str(self.segments), "--file-allocation=none", "--summary-interval=0",
+                "--show-console-readout=false", "--console-log-level=warn", "--download-result=hide",
+                f"--max-download-limit={self.bandwidth.per_download(self.max_parallel_downloads)}",
+                "-o", file_path, url]
+    
+    def set_segments(self, segments):
+        """Change the per-file segment count for downloads started from now on"""
+        self.segments = segments
+    
+    def set_max_downloads(self, max_downloads):
+        """Change the number of concurrent downloads at runtime"""
+        self.max_parallel_downloads = min(max_downloads, self.max_download_workers)
+        self.download_limiter.set_limit(self.max_parallel_downloads)
+    
+    def downloaded_bytes(self):
+        """Bytes downloaded so far, including the partial files of running downloads"""
+        total = self.download_stats.snapshot()['bytes']
+        with self.download_lock:
+            offsets = list(self.download_offsets.items())
+            gids = dict(self.active_gids)
+        
+        # The daemon reports live progress, so only files it isn't handling are measured on disk
+        if self.aria2 and gids:
+            active = self.aria2.active()
+            for file_path, gid in gids.items():
+                if gid in active:
+                    total += active[gid]['completed'] - dict(offsets).get(file_path, 0)
+            offsets = [(file_path, offset) for file_path, offset in offsets
+                       if gids.get(file_path) not in active]
+        for file_path, offset in offsets:
+            try:
+                total += os.path.getsize(file_path) - offset
+            except OSError:
+                pass
+        return total
+    
     def download_file(self, url, file_path, file_type):
         """Download a file using aria2c or yt-dlp based on file type"""
-        self.logger.info(f"Downloading {file_type} from {url}")
+        self.logger.info(f"Downloading {file_type} from {url}", extra=CARD_LOG)
         
         try:
             os.makedirs(os.path.dirname(file_path), exist_ok=True)
             
-            if file_type == "video":
+            if file_type == "video" and is_stream_manifest(url):
+                # Adaptive stream: fetch segments in parallel and remux to mp4
+                if self.stream_downloader.download(url, file_path, workers=self.segments):
+                    self.logger.info(f"Downloaded video stream: {file_path}")
+                    return True
+                if not (self.shutdown_requested or self.watchdog.is_stalled(file_path)) and self._link_expired(url):
+                    raise LinkExpired(url)
+                return False
+            elif file_type == "video":
                 # First try aria2c
                 try:
-                    subprocess.run(["aria2c", "-j", "64", "-o", file_path, url], check=True)
+                    self._aria2_download(file_path, url)
                     self.logger.info(f"Downloaded video using aria2c: {file_path}")
                     return True
                 except Exception as e:
+                    # A stalled download is retried from the queue rather than by yt-dlp
+                    if self.shutdown_requested or self.watchdog.is_stalled(file_path):
+                        return False
+                    # A dead signed link fails in yt-dlp too, so get a fresh one instead
+                    if self._link_expired(url):
+                        raise LinkExpired(url)
                     self.logger.warning(f"aria2c failed, trying yt-dlp: {str(e)}")
                     
                 # If aria2c fails, try yt-dlp
                 try:
-                    subprocess.run(["yt-dlp", "-N", "64", "-o", file_path, url], check=True)
+                    limit = self.bandwidth.per_download(self.max_parallel_downloads)
+                    self._run_process(["yt-dlp", "--no-progress", "-N", str(self.segments),
+                                       *(["-r", str(limit)] if limit else []), "-o", file_path, url], file_path)
                     self.logger.info(f"Downloaded video using yt-dlp: {file_path}")
                     return True
                 except Exception as e:
@@ -421,38 +656,284 @@ class UdvashDownloader:
                     return False
             else:  # PDF
                 try:
-                    subprocess.run(["aria2c", "-j", "64", "-o", file_path, url], check=True)
+                    self._aria2_download(file_path, url)
                     self.logger.info(f"Downloaded PDF: {file_path}")
                     return True
                 except Exception as e:
+                    if self.shutdown_requested or self.watchdog.is_stalled(file_path):
+                        return False
+                    if self._link_expired(url):
+                        raise LinkExpired(url)
                     self.logger.error(f"PDF download failed: {str(e)}")
                     return False
+        except LinkExpired:
+            raise
         except Exception as e:
             self.logger.error(f"Error in download_file: {str(e)}")
             return False
-        finally:
-            # Decrease active downloads count
-            self.active_downloads -= 1
-            # Process any queued downloads
-            self.process_download_queue()
-    
-    def queue_download(self, url, file_path, file_type):
-        """Queue a download or start it if under the limit"""
-        if self.active_downloads < self.max_parallel_downloads:
-            self.active_downloads += 1
-            with ThreadPoolExecutor(max_workers=1) as executor:
-                executor.submit(self.download_file, url, file_path, file_type)
-        else:
-            self.download_queue.append((url, file_path, file_type))
-            self.logger.info(f"Queued {file_type} download: {os.path.basename(file_path)}")
-    
-    def process_download_queue(self):
-        """Process any queued downloads if under the limit"""
-        if self.download_queue and self.active_downloads < self.max_parallel_downloads:
-            url, file_path, file_type = self.download_queue.pop(0)
-            self.active_downloads += 1
-            with ThreadPoolExecutor(max_workers=1) as executor:
-                executor.submit(self.download_file, url, file_path, file_type)
+    
+    def start_download_workers(self):
+        """Start the worker threads that drain the download queue"""
+        for _ in range(self.max_download_workers):
+            threading.Thread(target=self._download_worker, daemon=True).start()
+    
+    def _download_worker(self):
+        while not self.shutdown_requested:
+            if not self.download_limiter.acquire(timeout=1):
+                continue
+            try:
+                task = self.download_queue.get(timeout=1)
+            except queue.Empty:
+                self.download_limiter.release()
+                continue
+            
+            if self._rerank(task):
+                self.download_queue.task_done()
+                self.download_limiter.release()
+                continue
+            
+            file_path = task['file_path']
+            offset = os.path.getsize(file_path) if os.path.exists(file_path) else 0
+            with self.download_lock:
+                self.active_downloads += 1
+                self.in_flight_downloads[file_path] = task
+                self.download_offsets[file_path] = offset
+            success = False
+            self.watchdog.track(file_path, functools.partial(self._cancel_download, file_path),
+                                functools.partial(self._download_progress, file_path))
+            self.progress.start('download', file_path, task.get('size') or 0,
+                                lambda: max(self._download_progress(file_path) - offset, 0))
+            try:
+                success = self._run_download(task)
+            except Exception as e:
+                self.logger.error(f"Download worker error: {str(e)}")
+            finally:
+                self.watchdog.untrack(file_path)
+                self.progress.finish('download', file_path, success)
+                stalled = self.watchdog.stalled(file_path)
+                with self.download_lock:
+                    self.in_flight_downloads.pop(file_path, None)
+                    self.download_offsets.pop(file_path, None)
+                    self.active_downloads -= 1
+                size = os.path.getsize(file_path) if os.path.exists(file_path) else offset
+                if success:
+                    self.download_stats.add(bytes=size - offset, completed=1)
+                else:
+                    self.download_stats.add(bytes=max(size - offset, 0), errors=0 if self.shutdown_requested else 1)
+                # Put interrupted downloads back so they are checkpointed and resumed
+                if self.shutdown_requested and not success:
+                    self.download_queue.put(task)
+                elif not success and stalled and task.get('stalls', 0) < 3:
+                    task['stalls'] = task.get('stalls', 0) + 1
+                    self.logger.info(f"Requeued stalled download ({task['stalls']}/3): {os.path.basename(file_path)}")
+                    self.download_queue.put(task)
+                else:
+                    if not success:
+                        self.download_failed(task)
+                    if self.dedup_languages:
+                        self._release_duplicates(file_path, success)
+                self.download_queue.task_done()
+                self.download_limiter.release()
+    
+    def _rerank(self, task):
+        """For size-aware policies, size a task once its URL is resolved and put it back at its real rank"""
+        if not self.download_queue.policy.needs_size or task.get('size') or task.get('sized'):
+            return False
+        task['sized'] = True
+        try:
+            url = self.url_resolver.ensure(task)
+        except Exception:
+            return False
+        # Streams have no Content-Length; they keep the assumed size
+        task['size'] = self.probe_size(url) if url and not is_stream_manifest(url) else None
+        if not task['size']:
+            return False
+        self.download_queue.put(task)
+        return True
+    
+    def _run_download(self, task):
+        """Resolve the task's URL just in time and download it, re-resolving once if the link expired"""
+        for attempt in range(2):
+            url = self.url_resolver.ensure(task)
+            if not url:
+                self.logger.warning(f"No {task['file_type']} URL found for {os.path.basename(task['file_path'])}")
+                return False
+            if self.dedup_languages and not task.get('no_dedup') and self._defer_duplicate(task, url):
+                return True
+            try:
+                return self.download_file(url, task['file_path'], task['file_type'])
+            except LinkExpired:
+                self.logger.warning(f"Download link expired, resolving again: {os.path.basename(task['file_path'])}")
+                self.url_resolver.mark_failed(task)
+        return False
+    
+    def download_failed(self, task):
+        """Called when a download fails for good (not on shutdown)"""
+        pass
+    
+    def _source_fingerprints(self, url):
+        """Keys identifying the object behind a URL: the unsigned URL, and optionally ETag/length"""
+        fingerprints = [normalize_source(url)]
+        if self.dedup_head:
+            try:
+                response = self.http.head(url, allow_redirects=True, timeout=10)
+                etag = response.headers.get('ETag', '').strip('W/"')
+                if response.ok and etag:
+                    fingerprints.append(f"etag:{etag}:{response.headers.get('Content-Length', '')}")
+            except Exception:
+                pass
+        return fingerprints
+    
+    def _defer_duplicate(self, task, url):
+        """If another language variant of the card resolves to the same object, wait for it instead of downloading"""
+        file_path = task['file_path']
+        card = os.path.splitext(file_path)[0].rsplit('_', 1)[0]
+        keys = [(card, fingerprint) for fingerprint in self._source_fingerprints(url)]
+        with self.download_lock:
+            primary = next((self.sources[key] for key in keys if key in self.sources), None)
+            if primary is None or primary == file_path:
+                for key in keys:
+                    self.sources.setdefault(key, file_path)
+                return False
+            done = primary in self.source_done
+            if not done:
+                self.duplicates.setdefault(primary, []).append(task)
+        
+        self.logger.info(f"{os.path.basename(file_path)} is the same file as {os.path.basename(primary)}, fetching once")
+        if done:
+            self.duplicate_ready(task, primary)
+        return True
+    
+    def _release_duplicates(self, file_path, success):
+        """Hand the finished file to the variants waiting on it, or let them download it themselves"""
+        with self.download_lock:
+            if success:
+                self.source_done.add(file_path)
+            else:
+                self.sources = {key: path for key, path in self.sources.items() if path != file_path}
+            waiting = self.duplicates.pop(file_path, [])
+        for task in waiting:
+            if success:
+                self.duplicate_ready(task, file_path)
+            else:
+                self.download_queue.put(dict(task, no_dedup=True))
+    
+    def duplicate_ready(self, task, source_path):
+        """A duplicate's source is downloaded; here it becomes a hard link (or copy) of it"""
+        try:
+            if not os.path.exists(task['file_path']):
+                try:
+                    os.link(source_path, task['file_path'])
+                except OSError:
+                    shutil.copyfile(source_path, task['file_path'])
+        except Exception as e:
+            self.logger.error(f"Failed to link duplicate {task['file_path']}: {str(e)}")
+    
+    def probe_size(self, url):
+        """Get Content-Length with a HEAD request, or None if the server doesn't say"""
+        try:
+            response = self.http.head(url, allow_redirects=True, timeout=10)
+            return int(response.headers['Content-Length']) if response.ok else None
+        except Exception:
+            return None
+    
+    def _next_order(self):
+        """Next catalog sequence number"""
+        with self.download_lock:
+            self.catalog_order += 1
+            return self.catalog_order
+    
+    def queue_download(self, url, file_path, file_type, **extra):
+        """Add a download to the priority queue"""
+        with self.download_lock:
+            if file_path in self.in_flight_downloads or file_path in self.download_queue:
+                self.logger.info(f"Already queued, skipping: {os.path.basename(file_path)}")
+                return
+        task = {'url': url, 'file_path': file_path, 'file_type': file_type, 'order': self._next_order()}
+        task.update(extra)
+        
+        if not task.get('size') and file_path in self.planned_sizes:
+            task['size'] = self.planned_sizes[file_path]
+        elif self.download_queue.policy.needs_size and url and not task.get('size'):
+            task['size'] = self.probe_size(url)
+        
+        self.download_queue.put(task)
+        self.logger.info(f"Queued {file_type} download: {os.path.basename(file_path)}")
+    
+    def pending_downloads(self):
+        """Snapshot of in-flight and queued download tasks"""
+        with self.download_lock:
+            in_flight = list(self.in_flight_downloads.values())
+            in_flight += [task for tasks in self.duplicates.values() for task in tasks]
+        # Copy, since workers update tasks while resolving their URLs
+        return [dict(task) for task in in_flight + self.download_queue.snapshot()]
+    
+    def drop_downloads(self, predicate):
+        """Remove queued downloads matching predicate, along with variants waiting on them; returns how many"""
+        removed = self.download_queue.remove(predicate)
+        removed_paths = {task['file_path'] for task in removed}
+        with self.download_lock:
+            for file_path in removed_paths:
+                removed += self.duplicates.pop(file_path, [])
+            self.sources = {key: path for key, path in self.sources.items() if path not in removed_paths}
+        for task in removed:
+            self.download_failed(task)
+        return len(removed)
+    
+    def chapter_skipped(self, subject_name, chapter_name):
+        return (subject_name.lower(), chapter_name.lower()) in self.skipped_chapters
+    
+    def task_skipped(self, task):
+        path_parts = Path(task['file_path']).parts
+        return self.chapter_skipped(path_parts[-4], path_parts[-3])
+    
+    def resolve_chapter(self, chapter):
+        """(subject, name) for a chapter index such as "Physics.3", "Subject/Chapter" or a chapter name"""
+        if chapter.lower() in self.chapter_names:
+            return self.chapter_names[chapter.lower()]
+        subject_name, _, chapter_name = chapter.rpartition('/')
+        if subject_name:
+            return subject_name.strip(), chapter_name.strip()
+        subjects = [subject for subject, names in self.catalog.items()
+                    if chapter.lower() in (name.lower() for name in names)]
+        if len(subjects) != 1:
+            found = f"in {', '.join(subjects)}" if subjects else "not found"
+            raise ValueError(f"Chapter {chapter} is {found}; use its index or Subject/Chapter")
+        return subjects[0], chapter
+    
+    def skip_chapter(self, chapter):
+        """Leave one subject's chapter out of the rest of the run"""
+        subject_name, chapter_name = self.resolve_chapter(chapter)
+        self.skipped_chapters.add((subject_name.lower(), chapter_name.lower()))
+        dropped = self.drop_downloads(self.task_skipped)
+        self.logger.info(f"Skipping chapter {subject_name}/{chapter_name}: {dropped} queued downloads dropped")
+        return dropped
+    
+    def prioritize_subject(self, subject):
+        """Download a subject's files before everything else queued"""
+        promoted = self.download_queue.promote(
+            lambda task: Path(task['file_path']).parts[-4].lower() == subject.lower())
+        self.logger.info(f"Prioritizing {subject}: {promoted} queued downloads moved to the front")
+        return promoted
+    
+    def drain(self):
+        """Crawl no new chapters; the run ends once queued work is done"""
+        self.draining = True
+        self.logger.info("Draining: no new chapters will be started")
+    
+    def request_shutdown(self):
+        """Stop crawling and starting downloads, and terminate running download processes"""
+        self.shutdown_requested = True
+        self.stream_downloader.cancel()
+        if self.aria2:
+            self.aria2.shutdown()
+        with self.download_lock:
+            processes = list(self.active_processes)
+        for process in processes:
+            try:
+                process.terminate()
+            except Exception:
+                pass
     
     def add_to_topic_structure(self, subject_name, chapter_name, content_type_name, topic_name, card_title):
         """Add a topic to the topic structure for JSON output"""
@@ -489,93 +970,53 @@ class UdvashDownloader:
         # Add to topic structure
         self.add_to_topic_structure(subject_name, chapter_name, content_type_name, topic, title)
         
-        # Process Bangla version
-        if self.download_bangla:
+        # Queue the selected languages; download URLs are resolved just before each download starts
+        for code in self.selection.languages:
+            language = LANGUAGES[code]
             try:
-                self.logger.info(f"Processing Bangla content for: {title}")
+                self.logger.info(f"Processing {language} content for: {title}")
+                other = "En" if code == "Bn" else "Bn"
                 
                 # Process video
-                video_url = content_card['video_link'].replace("ln=En", "ln=Bn") if "ln=En" in content_card['video_link'] else content_card['video_link']
-                video_download_url = self.extract_video_url(video_url)
-                
-                if video_download_url:
-                    video_filename = f"{clean_title}_Bn.mp4"
+                if self.selection.file_type("video"):
+                    video_page_url = content_card['video_link'].replace(f"ln={other}", f"ln={code}")
+                    video_filename = f"{clean_title}_{code}.mp4"
                     video_path = os.path.join(base_dir, video_filename)
                     
                     # Check if file already exists
-                    if os.path.exists(video_path):
+                    if self.is_completed(video_path):
                         self.logger.info(f"Video already exists, skipping: {video_filename}")
                     else:
-                        self.queue_download(video_download_url, video_path, "video")
-                else:
-                    self.logger.warning(f"No Bangla video URL found for {title}")
+                        self.queue_download(None, video_path, "video", page_url=video_page_url)
                 
                 # Process PDF/note
-                pdf_url = content_card['note_link'].replace("ln=En", "ln=Bn") if "ln=En" in content_card['note_link'] else content_card['note_link']
-                pdf_download_url = self.extract_pdf_url(pdf_url)
-                
-                if pdf_download_url:
-                    pdf_filename = f"{clean_title}_Bn.pdf"
+                if self.selection.file_type("pdf"):
+                    pdf_page_url = content_card['note_link'].replace(f"ln={other}", f"ln={code}")
+                    pdf_filename = f"{clean_title}_{code}.pdf"
                     pdf_path = os.path.join(base_dir, pdf_filename)
                     
                     # Check if file already exists
-                    if os.path.exists(pdf_path):
+                    if self.is_completed(pdf_path):
                         self.logger.info(f"PDF already exists, skipping: {pdf_filename}")
                     else:
-                        self.queue_download(pdf_download_url, pdf_path, "pdf")
-                else:
-                    self.logger.warning(f"No Bangla PDF URL found for {title}")
+                        self.queue_download(None, pdf_path, "pdf", page_url=pdf_page_url)
             except Exception as e:
-                self.logger.error(f"Error processing Bangla content: {str(e)}")
-        
-        # Process English version
-        if self.download_english:
-            try:
-                self.logger.info(f"Processing English content for: {title}")
-                
-                # Process video
-                video_url = content_card['video_link'].replace("ln=Bn", "ln=En") if "ln=Bn" in content_card['video_link'] else content_card['video_link']
-                video_download_url = self.extract_video_url(video_url)
-                
-                if video_download_url:
-                    video_filename = f"{clean_title}_En.mp4"
-                    video_path = os.path.join(base_dir, video_filename)
-                    
-                    # Check if file already exists
-                    if os.path.exists(video_path):
-                        self.logger.info(f"Video already exists, skipping: {video_filename}")
-                    else:
-                        self.queue_download(video_download_url, video_path, "video")
-                else:
-                    self.logger.warning(f"No English video URL found for {title}")
-                
-                # Process PDF/note
-                pdf_url = content_card['note_link'].replace("ln=Bn", "ln=En") if "ln=Bn" in content_card['note_link'] else content_card['note_link']
-                pdf_download_url = self.extract_pdf_url(pdf_url)
-                
-                if pdf_download_url:
-                    pdf_filename = f"{clean_title}_En.pdf"
-                    pdf_path = os.path.join(base_dir, pdf_filename)
-                    
-                    # Check if file already exists
-                    if os.path.exists(pdf_path):
-                        self.logger.info(f"PDF already exists, skipping: {pdf_filename}")
-                    else:
-                        self.queue_download(pdf_download_url, pdf_path, "pdf")
-                else:
-                    self.logger.warning(f"No English PDF URL found for {title}")
-            except Exception as e:
-                self.logger.error(f"Error processing English content: {str(e)}")
+                self.logger.error(f"Error processing {language} content: {str(e)}")
     
     def save_topic_structure(self):
         """Save the topic structure to a JSON file"""
         if self.create_json:
-            json_path = os.path.join(self.download_dir, "topic_structure.json")
+            json_path = os.path.join(self.download_dir, f"topic_structure{self.shard_suffix}.json")
             self.logger.info(f"Saving topic structure to: {json_path}")
             
+            # A shard writes a fragment with the full chapter order, for merging with sharding.py
+            data = self.topic_structure
+            if self.shard_count > 1:
+                data = {'catalog': self.catalog, 'topic_structure': self.topic_structure}
+            
             try:
                 with open(json_path, 'w', encoding='utf-8') as f:
-                    json.dump(self.topic_structure, f, indent=2, ensure_ascii=False)
+                    json.dump(data, f, indent=2, ensure_ascii=False)
                 self.logger.info("Topic structure saved successfully")
             except Exception as e:
                 self.logger.error(f"Error saving topic structure: {str(e)}")
@@ -583,14 +1024,34 @@ class UdvashDownloader:
     def wait_for_downloads_to_complete(self):
         """Wait for all downloads to complete"""
         self.logger.info("Waiting for all downloads to complete...")
-        while self.active_downloads > 0 or self.download_queue:
+        # unfinished_tasks counts queued and in-flight downloads
+        while self.download_queue.unfinished_tasks and not self.shutdown_requested:
             time.sleep(1)
         self.logger.info("All downloads completed!")
     
+    def process_cards(self, chapter, content_type_name, cards, master_course_id, subject_id, master_chapter_id):
+        """Queue the selected cards of one content type page"""
+        for card in cards:
+            if self.shutdown_requested:
+                return
+            if not self.selection.card(card):
+                continue
+            self.process_content(
+                chapter['subject_name'],
+                chapter['name'],
+                card,
+                master_course_id,
+                subject_id,
+                master_chapter_id,
+                content_type_name
+            )
+    
     def process_chapter(self, chapter):
         """Process a single chapter"""
         self.logger.info(f"Processing chapter: {chapter['index']} {chapter['name']}")
-        subject_name = chapter['subject_name']
+        
+        if self.shutdown_requested or self.draining or self.chapter_skipped(chapter['subject_name'], chapter['name']):
+            return
         
         try:
             # Get content types (marathon, archive)
@@ -612,16 +1073,8 @@ class UdvashDownloader:
                     continue
                 
                 # Process each content card
-                for card in content_cards:
-                    self.process_content(
-                        subject_name,
-                        chapter['name'], 
-                        card, 
-                        master_course_id, 
-                        subject_id, 
-                        master_chapter_id, 
-                        content_type['name']
-                    )
+                self.process_cards(chapter, content_type['name'], content_cards,
+                                   master_course_id, subject_id, master_chapter_id)
             
             # Save topic structure after processing each chapter
             self.save_topic_structure()
@@ -629,57 +1082,52 @@ class UdvashDownloader:
         except Exception as e:
             self.logger.error(f"Error processing chapter {chapter['name']}: {str(e)}")
     
+    def discover_chapters(self):
+        """Selected chapters of the selected subjects, in catalog order"""
+        # Get all subjects
+        subjects = self.get_subjects()
+        
+        if not subjects:
+            self.logger.error("No subjects found!")
+            return []
+        
+        # Only selected subjects get their chapter list loaded
+        subjects = [subject for subject in subjects if self.selection.subject(subject['name'])]
+        self.logger.info(f"Selection: {self.selection.describe()} ({len(subjects)} subjects)")
+        
+        all_chapters = []
+        
+        # Get chapters for each subject
+        for subject in subjects:
+            chapters = self.get_chapters(subject['url'], subject['name'])
+            for chapter in chapters:
+                all_chapters.append(chapter)
+        
+        # Sort chapters by index for consistent ordering ("Phy.2" before "Phy.10")
+        all_chapters.sort(key=lambda x: natural_key(x['index']))
+        self.catalog = {}
+        for chapter in all_chapters:
+            self.catalog.setdefault(chapter['subject_name'], []).append(chapter['name'])
+            self.chapter_names[chapter['index'].lower()] = (chapter['subject_name'], chapter['name'])
+        
+        # Chapter ranges count within each subject
+        chapters_to_process = [chapter for chapter in all_chapters if self.selection.chapter(chapter)]
+        self.logger.info(f"Selected chapters: {', '.join(chapter['index'] for chapter in chapters_to_process) or 'none'}")
+        
+        if self.shard_count > 1:
+            chapters_to_process = [chapter for chapter in chapters_to_process
+                                   if shard_for(chapter, self.shard_count) == self.shard_index]
+            self.logger.info(f"Shard {self.shard_index + 1}/{self.shard_count}: taking {len(chapters_to_process)} chapters")
+        return chapters_to_process
+    
     def download_all(self, from_chapter=None, to_chapter=None, specific_subjects=None):
         """Download all content or specific chapter range"""
         try:
-            # Get all subjects
-            subjects = self.get_subjects()
-            
-            if not subjects:
-                self.logger.error("No subjects found!")
+            self.selection.narrow(specific_subjects, from_chapter, to_chapter)
+            chapters_to_process = self.discover_chapters()
+            if not chapters_to_process:
                 return
             
-            # Filter subjects if specific ones are requested
-            if specific_subjects:
-                subjects = [s for s in subjects if s['name'] in specific_subjects]
-                self.logger.info(f"Filtered to {len(subjects)} specific subjects")
-            
-            all_chapters = []
-            
-            # Get chapters for each subject
-            for subject in subjects:
-                chapters = self.get_chapters(subject['url'], subject['name'])
-                for chapter in chapters:
-                    all_chapters.append(chapter)
-            
-            # Sort chapters by index for consistent ordering
-            all_chapters.sort(key=lambda x: x['index'])
-            
-            # Determine which chapters to process
-            chapters_to_process = []
-            
-            if from_chapter is not None or to_chapter is not None:
-                from_idx = 0
-                to_idx = len(all_chapters) - 1
-                
-                if from_chapter is not None:
-                    for i, chapter in enumerate(all_chapters):
-                        chapter_num = chapter['index'].split('.')[-1]
-                        if chapter_num == str(from_chapter):
-                            from_idx = i
-                            break
-                
-                if to_chapter is not None:
-                    for i, chapter in enumerate(all_chapters):
-                        chapter_num = chapter['index'].split('.')[-1]
-                        if chapter_num == str(to_chapter):
-                            to_idx = i
-                            break
-                
-                chapters_to_process = all_chapters[from_idx:to_idx+1]
-            else:
-                chapters_to_process = all_chapters
-            
             self.logger.info(f"Processing {len(chapters_to_process)} chapters")
             
             # Process each chapter in a new thread to enable concurrent processing
@@ -700,6 +1148,18 @@ class UdvashDownloader:
         finally:
             self.cleanup()
     
+    def run_daemon(self, interval=900, jitter=0.2, full_scan_interval=6 * 3600, max_pages=30, recycle_pages=300):
+        """Keep running and queue new content as it appears, until shutdown or /drain"""
+        try:
+            SyncDaemon(self, interval=interval, jitter=jitter, full_scan_interval=full_scan_interval,
+                       max_pages=max_pages, recycle_pages=recycle_pages, logger=self.logger).run()
+            self.wait_for_downloads_to_complete()
+            self.save_topic_structure()
+        except Exception as e:
+            self.logger.error(f"Error in run_daemon: {str(e)}")
+        finally:
+            self.cleanup()
+    
     def cleanup(self):
         """Clean up resources"""
         self.logger.info("Cleaning up resources...")
@@ -707,3 +1167,10 @@ class UdvashDownloader:
             self.driver.quit()
         except:
             pass
+        self.card_parser.shutdown()
+        self.watchdog.stop()
+        self.bandwidth.stop()
+        if self._owns_progress:
+            self.progress.stop()
+        if self.aria2:
+            self.aria2.shutdown()
@@ -1,3 +1,4 @@
+import io
 import os
 import time
 import json
@@ -6,105 +7,129 @@ import subprocess
 import threading
 import re
 import asyncio
+import signal
 from pathlib import Path
 from concurrent.futures import ThreadPoolExecutor
-from pyrogram import Client, filters
+from pyrogram import Client, filters, raw, utils
 from pyrogram.types import InputMediaDocument, InputMediaVideo
 from pyrogram.errors import PeerIdInvalid, ChannelPrivate, FloodWait
-from tqdm import tqdm
 import queue
 from bot import UdvashDownloader
-from bs4 import BeautifulSoup
-from selenium.webdriver.common.by import By
-
-class ThreadSafeTqdm:
-    """Thread-safe wrapper for tqdm progress bars with n attribute"""
-    def __init__(self, *args, **kwargs):
-        self._lock = threading.Lock()
-        self._progress = None
-        self._current = 0  # Track current progress manually
-        self._args = args
-        self._kwargs = kwargs
-        
-    def __enter__(self):
-        with self._lock:
-            if self._progress is None:
-                self._progress = tqdm(*self._args, **self._kwargs)
-                self._current = 0
-            return self
-
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        with self._lock:
-            if self._progress is not None:
-                self._progress.close()
-                self._progress = None
-                self._current = 0
-
-    @property
-    def n(self):
-        with self._lock:
-            return self._current
-
-    def update(self, n: int):
-        with self._lock:
-            if self._progress is not None:
-                self._progress.update(n)
-                self._current += n
-
-    def set_description(self, desc: str):
-        with self._lock:
-            if self._progress is not None:
-                self._progress.set_description(desc)
+from checkpoint import CheckpointStore, UploadManifest
+from scheduling import PriorityTaskQueue
+from ordering import ReorderBuffer
+from concurrency import AdjustableLimiter, TransferStats, AIMDController, ConcurrencyTuner, MemoryBudget
+from url_resolver import LinkExpired
+from media import MediaProcessor, Transcoder
+from pdf_bundle import PdfBundler
+from stall_watchdog import Watchdog
+from planner import Planner, ThroughputHistory
+from sharding import shard_suffix
+from progress import TransferProgress
+from bandwidth import BandwidthAllocator
+import logging_setup
+from logging_setup import queued_logger
+from control import ControlCommands
+from parallel_upload import ParallelUploader, BIG_FILE
+from selection import Selection
 
 class TelegramUploader:
-    def __init__(self, api_id, api_hash, bot_token, chat_id, max_uploads=3):
+    def __init__(self, api_id, api_hash, bot_token, chat_id, max_uploads=3, manifest=None,
+                 queue_policy="chapter", queue_aging=None, reorder_timeout=900, max_upload_workers=None,
+                 session_string=None, session_export_file=None, max_upload_size=2000 * 1024 * 1024,
+                 media_workers=2, transcode=None, memory_budget=None, stall_window=300, stall_min_rate=1024,
+                 progress=None, bandwidth=None, upload_parallelism=4, max_transmissions=10, client_workers=50,
+                 redownload=None, holds_order=None):
         self.logger = self._setup_logger()
         self.api_id = api_id
         self.api_hash = api_hash
         self.bot_token = bot_token
         self.chat_id = chat_id
+        self.session_string = session_string
+        self.session_export_file = session_export_file
         self.max_uploads = max_uploads
+        self.max_upload_workers = max(max_upload_workers or 0, max_uploads)
+        self.upload_limiter = AdjustableLimiter(max_uploads)
+        self.upload_stats = TransferStats()
+        self.manifest = manifest
+        self.memory_budget = memory_budget
+        self._owns_progress = progress is None
+        self.progress = progress or TransferProgress()
+        self.bandwidth = bandwidth or BandwidthAllocator(logger=self.logger)
+        # Big files are uploaded over this many media connections at once (1 leaves it to save_file)
+        self.upload_parallelism = upload_parallelism
+        self.max_transmissions = max_transmissions
+        self.client_workers = client_workers
+        self.parallel = None
+        # Uploads that make no progress for stall_window seconds are cancelled and retried
+        self.watchdog = Watchdog(window=stall_window, min_rate=stall_min_rate, logger=self.logger)
         
         self._loop = None
         self._client = None
-        self._upload_queue = queue.Queue()
+        self._upload_queue = PriorityTaskQueue(queue_policy, queue_aging)
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        
+        # Language variants of the same file reuse one upload: uploaded media until the
+        # file is posted, then the posted document, plus variants waiting on either
+        self._uploaded = {}
+        self._posted = {}
+        self._duplicates = {}
+        # Sources that failed or whose post can't be reused; their variants go back to redownload(task)
+        self._lost_sources = set()
+        self.redownload = redownload
+        # Entries that could not be posted; kept for the checkpoint so the next run posts them
+        self._unposted = []
         self._active_uploads = 0
         self._shutdown_flag = False
+        self._halt_flag = False
         self._exception = None
         
+        # Videos are split/remuxed off the upload workers, so a long ffmpeg run never holds an upload slot
+        # Optional re-encode (dict of Transcoder options) ahead of the split/faststart step
+        self.transcoder = None
+        if transcode is not None:
+            self.transcoder = Transcoder(upload_rate=self.upload_rate, logger=self.logger, **transcode)
+            media_workers += self.transcoder.jobs
+        self.media = MediaProcessor(max_bytes=max_upload_size, transcoder=self.transcoder, logger=self.logger)
+        self._media_pool = ThreadPoolExecutor(max_workers=media_workers)
+        self._preparing = {}
+        
+        # Uploads finish in any order; posts are committed to the channel in catalog order
+        # Numbers still being worked on outside the uploader are reported by holds_order(order)
+        self.holds_order = holds_order
+        self._reorder = ReorderBuffer(self._post_entry, stall_timeout=reorder_timeout, holds=self._holds,
+                                      logger=self.logger)
+        
+        # Fetch missing thumbnails while the client connects
+        thumbnails_thread = threading.Thread(target=self._ensure_thumbnails, daemon=True)
+        thumbnails_thread.start()
         self._start_client()
         self._start_upload_workers()
-        self._ensure_thumbnails()
+        thumbnails_thread.join()
 
     def _setup_logger(self):
-        logger = logging.getLogger("telegram_uploader")
-        logger.setLevel(logging.INFO)
-        
-        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-        
-        console_handler = logging.StreamHandler()
-        console_handler.setFormatter(formatter)
-        logger.addHandler(console_handler)
-        
-        file_handler = logging.FileHandler("telegram_uploader.log")
-        file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
-        
-        return logger
+        # Queued, so the event loop only enqueues records
+        return queued_logger("telegram_uploader", "telegram_uploader.log")
 
     def _start_client(self):
         def client_thread():
             self._loop = asyncio.new_event_loop()
             asyncio.set_event_loop(self._loop)
             
+            # A session string from the environment skips the bot authorization round trip
+            session_kwargs = {'session_string': self.session_string, 'in_memory': True} if self.session_string else {}
             self._client = Client(
                 "udvash_uploader_bot",
                 api_id=self.api_id,
                 api_hash=self.api_hash,
                 bot_token=self.bot_token,
-                max_concurrent_transmissions=10,
-                workers=50
+                max_concurrent_transmissions=self.max_transmissions,
+                workers=self.client_workers,
+                **session_kwargs
             )
+            if self.upload_parallelism > 1:
+                self.parallel = ParallelUploader(self._client, self.upload_parallelism, logger=self.logger)
             
             @self._client.on_message(filters.command("mm"))
             async def welcome_command(client, message):
@@ -119,12 +144,23 @@ class TelegramUploader:
             async def status_command(client, message):
                 status_msg = (
                     f"📊 **Current Status**\n\n"
-                    f"Active uploads: {self._active_uploads}/{self.max_uploads}\n"
+                    f"Active uploads: {self._active_uploads}/{self.upload_limiter.limit}\n"
+                    f"Preparing: {len(self._preparing)}\n"
                     f"Queued uploads: {self._upload_queue.qsize()}\n"
+                    f"Waiting to post: {len(self._reorder)}\n\n"
+                    f"{self.progress.summary()}\n"
                 )
+                if self.transcoder:
+                    status_msg += f"Transcoded: {self.transcoder.summary()}\n"
+                if self.upload_limiter.paused:
+                    status_msg += "⏸ Paused (/resume)\n"
+
                 await message.reply_text(status_msg)
 
             with self._client:
+                if self.session_export_file:
+                    self._loop.run_until_complete(self._export_session())
+                self._reorder.start(self._loop)
                 self._loop.run_forever()
 
         self._client_thread = threading.Thread(target=client_thread, daemon=True)
@@ -133,94 +169,231 @@ class TelegramUploader:
         while not (self._loop and self._loop.is_running()):
             time.sleep(0.1)
 
+    async def _export_session(self):
+        """Write the session string for TELEGRAM_SESSION_STRING on later runs"""
+        try:
+            session_string = await self._client.export_session_string()
+            with open(self.session_export_file, 'w') as f:
+                f.write(session_string)
+            os.chmod(self.session_export_file, 0o600)
+            self.logger.info(f"Session string saved to {self.session_export_file}")
+        except Exception as e:
+            self.logger.error(f"Failed to export session string: {str(e)}")
+
     def _start_upload_workers(self):
         def upload_worker():
-            while not self._shutdown_flag or not self._upload_queue.empty():
+            while not self._halt_flag and (not self._shutdown_flag or not self._upload_queue.empty()):
+                if not self.upload_limiter.acquire(timeout=1):
+                    continue
                 try:
                     task = self._upload_queue.get(timeout=1)
                     if task is None:
                         continue
                         
-                    with threading.Lock():
+                    with self._lock:
                         self._active_uploads += 1
+                        self._in_flight[task['file_path']] = task
                         
-                    asyncio.run_coroutine_threadsafe(
-                        self._process_upload_task(task),
-                        self._loop
-                    ).result()
-                    
-                    with threading.Lock():
-                        self._active_uploads -= 1
-                        
-                    self._upload_queue.task_done()
+                    try:
+                        asyncio.run_coroutine_threadsafe(
+                            self._process_upload_task(task),
+                            self._loop
+                        ).result()
+                    finally:
+                        with self._lock:
+                            self._active_uploads -= 1
+                            self._in_flight.pop(task['file_path'], None)
+                        self._upload_queue.task_done()
                 except queue.Empty:
                     continue
                 except Exception as e:
                     self.logger.error(f"Upload worker error: {str(e)}")
                     self._exception = e
+                finally:
+                    self.upload_limiter.release()
 
-        for _ in range(self.max_uploads):
+        # Worker threads are started up to the adaptive upper bound; the limiter decides how many run
+        for _ in range(self.max_upload_workers):
             worker = threading.Thread(target=upload_worker, daemon=True)
             worker.start()
 
     async def _process_upload_task(self, task):
         file_path = task['file_path']
-        chapter_name = task['chapter_name']
-        topic_name = task['topic_name']
-        file_type = task['file_type']
         retries = task.get('retries', 3)
         
         try:
-            with ThreadSafeTqdm(
-                total=os.path.getsize(file_path),
-                unit='B',
-                unit_scale=True,
-                desc=f"Uploading {os.path.basename(file_path)}",
-                position=task.get('position', 0)
-            ) as progress:
-                def update_progress(current, total):
-                    try:
-                        delta = current - progress.n
-                        progress.update(delta)
-                    except AttributeError:
-                        pass  # Handle closed progress bar
+            # Per chunk, the callback only stores a number; the progress line and watchdog read it
+            transfer = self.progress.start('upload', file_path, self._task_size(task))
+            sent = 0  # Bytes of earlier parts, since save_file reports progress per file
+            
+            async def update_progress(current, total):
+                delta = sent + current - transfer.done
+                transfer.done = sent + current
+                # save_file awaits this between chunks, so sleeping here paces the upload
+                await self.bandwidth.upload.wait_async(delta)
 
-                caption = f"<blockquote><b>📚 {chapter_name}\n📖 {topic_name}\n📁 {os.path.basename(file_path)}</b></blockquote>"
-                
-                if file_type == "video":
-                    duration = await self._get_video_duration(file_path)
-                    await self._client.send_video(
-                        chat_id=self.chat_id,
-                        video=file_path,
-                        caption=caption,
-                        height=1280,
-                        width=720,
-                        thumb="abc.jpg",
-                        duration=int(duration),  # Ensure integer
-                        progress=update_progress
-                    )
+            # A stalled save_file never calls back, so the watchdog cancels the whole task
+            upload = asyncio.current_task()
+            self.watchdog.track(file_path, lambda: self._loop.call_soon_threadsafe(upload.cancel),
+                                lambda: transfer.done)
+            # Parts a previous run already posted (restored from the checkpoint) aren't uploaded again
+            posted = task.get('posted', 0)
+            media = [None] * posted
+            success = False
+            try:
+                if task.get('data') is not None:
+                    media.append(await self._upload_media(task, task['data'], update_progress))
                 else:
-                    await self._client.send_document(
-                        chat_id=self.chat_id,
-                        document=file_path,
-                        caption=caption,
-                        thumb="bcd.jpg",
-                        progress=update_progress
-                    )
-                
-                self.logger.info(f"Successfully uploaded {file_path}")
-                os.remove(file_path)
+                    for path in task.get('parts', [file_path])[posted:]:
+                        media.append(await self._upload_media(task, path, update_progress))
+                        sent += os.path.getsize(path)
+                success = True
+            finally:
+                self.watchdog.untrack(file_path)
+                self.progress.finish('upload', file_path, success)
+                self.upload_stats.add(bytes=transfer.done)
+            
+            # Hand over to the reorder buffer, which posts it once everything before it is posted
+            self.logger.info(f"Uploaded {file_path}, waiting to post")
+            self.upload_stats.add(completed=1)
+            entry = {'kind': 'media', 'task': task, 'media': media}
+            if posted:
+                entry.update(posted=posted, documents=[None] * posted)
+            self._reorder.ready(task['order'], entry)
+            with self._lock:
+                if not posted:
+                    self._uploaded[file_path] = media
+                waiting = self._duplicates.pop(file_path, [])
+            for duplicate in waiting:
+                self._reorder.ready(duplicate['order'], {'kind': 'media', 'task': duplicate, 'media': media})
                 
         except FloodWait as e:
             self.logger.warning(f"Flood wait: Retrying in {e.value} seconds")
+            self.upload_stats.add(flood_waits=1)
             await asyncio.sleep(e.value)
             await self._retry_upload(task)
+        except asyncio.CancelledError:
+            if not self.watchdog.stalled(file_path):
+                raise
+            self.upload_stats.add(errors=1)
+            await self._retry_upload(task)
         except Exception as e:
             self.logger.error(f"Failed to upload {file_path}: {str(e)}")
+            self.upload_stats.add(errors=1)
             if retries > 0:
                 await self._retry_upload(task)
             else:
                 self.logger.error(f"Permanent failure for {file_path}")
+                self._give_up(task)
+
+    async def _upload_media(self, task, file_path, progress):
+        """Upload a file (a path, or an in-memory buffer) to Telegram's servers without posting it"""
+        if self.parallel and isinstance(file_path, str) and os.path.getsize(file_path) > BIG_FILE:
+            file = await self.parallel.save_file(file_path, progress)
+        else:
+            file = await self._client.save_file(file_path, progress=progress)
+        file_name = os.path.basename(file_path if isinstance(file_path, str) else task['file_path'])
+        attributes = [raw.types.DocumentAttributeFilename(file_name=file_name)]
+        
+        if task['file_type'] == "video":
+            duration = await self._get_video_duration(file_path)
+            attributes.append(raw.types.DocumentAttributeVideo(
+                supports_streaming=True,
+                duration=int(duration),  # Ensure integer
+                w=720,
+                h=1280
+            ))
+            return raw.types.InputMediaUploadedDocument(
+                mime_type="video/mp4",
+                file=file,
+                thumb=await self._client.save_file("abc.jpg"),
+                attributes=attributes
+            )
+        
+        return raw.types.InputMediaUploadedDocument(
+            mime_type="application/pdf",
+            file=file,
+            thumb=await self._client.save_file("bcd.jpg"),
+            attributes=attributes,
+            force_file=True
+        )
+
+    async def _post_entry(self, entry):
+        """Post a chapter header or an uploaded file to the channel"""
+        attempts = 3
+        while True:
+            try:
+                if entry['kind'] == 'header':
+                    await self._client.send_message(
+                        chat_id=self.chat_id,
+                        text=f"<blockquote><b><u>{entry['chapter_name']}</u></b></blockquote>"
+                    )
+                    return
+                
+                task = entry['task']
+                parts = entry['media']
+                # A language variant reuses the source's posted document (file_id) once it exists
+                if task.get('source') in self._posted:
+                    parts = self._posted[task['source']]
+                documents = entry.setdefault('documents', [])
+                # Resume after the last part that made it, so a retry never posts a part twice
+                while entry.get('posted', 0) < len(parts):
+                    part = entry.get('posted', 0) + 1
+                    # PDFs that couldn't be bundled are posted under their own names
+                    name = task['parts'][part - 1] if task.get('unbundled') else task['file_path']
+                    caption = f"<blockquote><b>📚 {task['chapter_name']}\n📖 {task['topic_name']}\n📁 {os.path.basename(name)}"
+                    if len(parts) > 1 and not task.get('unbundled'):
+                        caption += f"\n🎞 Part {part}/{len(parts)}"
+                    caption += "</b></blockquote>"
+                    updates = await self._client.invoke(raw.functions.messages.SendMedia(
+                        peer=await self._client.resolve_peer(self.chat_id),
+                        media=parts[part - 1],
+                        random_id=self._client.rnd_id(),
+                        **await utils.parse_text_entities(self._client, caption, None, None)
+                    ))
+                    documents.append(self._posted_document(updates))
+                    entry['posted'] = part
+                
+                self.logger.info(f"Successfully uploaded {task['file_path']}")
+                with self._lock:
+                    self._uploaded.pop(task['file_path'], None)
+                    if all(documents):
+                        self._posted[task['file_path']] = documents
+                    else:
+                        self._lost_sources.add(task['file_path'])
+                if self.manifest is not None:
+                    self.manifest.add(task['file_path'], chapter=task['chapter_name'], topic=task['topic_name'],
+                                      file_type=task['file_type'], parts=len(parts))
+                    # Files merged into a bundle count as posted too
+                    for member in task.get('members', []):
+                        bundle = {} if task.get('unbundled') else {'bundle': task['file_path']}
+                        self.manifest.add(member, chapter=task['chapter_name'], topic=task['topic_name'],
+                                          file_type=task['file_type'], **bundle)
+                if task.get('data') is not None:
+                    self._release_memory(task)
+                elif not task.get('source'):
+                    # Bundled PDFs are kept until their bundle is in the channel
+                    for path in task.get('parts', [task['file_path']]) + task.get('members', []):
+                        if os.path.exists(path):
+                            os.remove(path)
+                return
+            except FloodWait as e:
+                self.logger.warning(f"Flood wait: Posting again in {e.value} seconds")
+                self.upload_stats.add(flood_waits=1)
+                await asyncio.sleep(e.value)
+            except Exception as e:
+                attempts -= 1
+                if attempts <= 0:
+                    self.logger.error(f"Failed to post {entry['kind']}, leaving it for the next run: {str(e)}")
+                    if entry['kind'] == 'media' and entry['task'].get('data') is not None:
+                        # The buffer goes back to the budget; the next run fetches the file again
+                        entry['task']['refetch'] = True
+                        self._release_memory(entry['task'])
+                    with self._lock:
+                        self._unposted.append(entry)
+                    return
+                self.logger.warning(f"Failed to post {entry['kind']}, retrying: {str(e)}")
+                await asyncio.sleep(5)
                     
     async def _get_video_duration(self, file_path):
         def run_ffprobe():
@@ -246,28 +419,211 @@ class TelegramUploader:
             self._upload_queue.put(task)
         else:
             self.logger.error(f"Exhausted retries for {task['file_path']}")
+            self._give_up(task)
+
+    def _give_up(self, task):
+        """Leave a task unposted, along with the language variants waiting on its upload"""
+        self._release_memory(task)
+        self._reorder.skip(task['order'])
+        with self._lock:
+            self._lost_sources.add(task['file_path'])
+            waiting = self._duplicates.pop(task['file_path'], [])
+        for duplicate in waiting:
+            self._source_lost(duplicate)
+
+    def _source_lost(self, task):
+        """A variant's source can't be shared after all; download the variant itself, or leave it out"""
+        if self.redownload:
+            self.logger.warning(f"Source of {task['file_path']} can't be reused, downloading it separately")
+            self.redownload(task)
+        else:
+            self.logger.error(f"Not posting {task['file_path']}: its source upload failed")
+            self.skip(task['order'])
 
-    def queue_upload(self, file_path, chapter_name, topic_name, file_type):
-        if not os.path.exists(file_path):
+    @staticmethod
+    def _posted_document(updates):
+        """The posted message's document as an InputMediaDocument, for reposting without an upload"""
+        for update in getattr(updates, 'updates', []):
+            document = getattr(getattr(getattr(update, 'message', None), 'media', None), 'document', None)
+            if document is not None:
+                return raw.types.InputMediaDocument(id=raw.types.InputDocument(
+                    id=document.id,
+                    access_hash=document.access_hash,
+                    file_reference=document.file_reference
+                ))
+        return None
+
+    def _release_memory(self, task):
+        """Drop an in-memory file and return its bytes to the memory budget"""
+        data = task.pop('data', None)
+        if data is not None:
+            self.memory_budget.release(data.getbuffer().nbytes)
+            data.close()
+
+    @staticmethod
+    def _task_size(task):
+        if task.get('data') is not None:
+            return task['data'].getbuffer().nbytes
+        return sum(os.path.getsize(path) for path in task.get('parts', [task['file_path']]))
+
+    def queue_upload(self, file_path, chapter_name, topic_name, file_type, order, **extra):
+        if extra.get('data') is None and not all(os.path.exists(path) for path in extra.get('parts', [file_path])):
             self.logger.error(f"File not found: {file_path}")
+            self.skip(order)
             return
 
-        self._upload_queue.put({
+        task = {
             'file_path': file_path,
             'chapter_name': chapter_name,
             'topic_name': topic_name,
             'file_type': file_type,
-            'position': self._active_uploads % self.max_uploads
-        })
+            'order': order,
+            **extra
+        }
+        task['size'] = self._task_size(task)
+        self._submit(task)
+
+    def _submit(self, task):
+        """Queue a task for upload, sending videos through the media stage first"""
+        if task['file_type'] != "video" or 'parts' in task:
+            self._upload_queue.put(task)
+            return
+        with self._lock:
+            self._preparing[task['file_path']] = task
+        self._media_pool.submit(self._prepare, task)
 
-    async def send_chapter_notification(self, chapter_name):
+    def _prepare(self, task):
         try:
-            await self._client.send_message(
-                chat_id=self.chat_id,
-                text=f"<blockquote><b><u>{chapter_name}</u></b></blockquote>"
-            )
+            parts = self.media.prepare(task['file_path'])
+            if len(parts) > 1:
+                task['parts'] = parts
         except Exception as e:
-            self.logger.error(f"Failed to send notification: {str(e)}")
+            # Try the upload anyway; it fails on its own if the file really is too big
+            self.logger.error(f"Failed to prepare {task['file_path']}: {str(e)}")
+        finally:
+            self._upload_queue.put(task)
+            with self._lock:
+                self._preparing.pop(task['file_path'], None)
+
+    def upload_rate(self):
+        """Recent upload throughput in bytes per second while uploads run, or None before any upload"""
+        return self.progress.rate('upload')
+
+    def queue_duplicate(self, source_path, file_path, chapter_name, topic_name, file_type, order, **extra):
+        """Post a language variant identical to source_path, reusing its upload instead of sending it again"""
+        task = {
+            'file_path': file_path,
+            'chapter_name': chapter_name,
+            'topic_name': topic_name,
+            'file_type': file_type,
+            'order': order,
+            'source': source_path,
+            **extra
+        }
+        with self._lock:
+            media = self._posted.get(source_path) or self._uploaded.get(source_path)
+            lost = media is None and source_path in self._lost_sources
+            if media is None and not lost:
+                self._duplicates.setdefault(source_path, []).append(task)
+                return
+        if lost:
+            self._source_lost(task)
+            return
+        self._reorder.ready_threadsafe(order, {'kind': 'media', 'task': task, 'media': media})
+
+    def add_handler(self, handler):
+        """Register an extra message handler on the running client, from any thread"""
+        # The dispatcher's handler groups belong to the client loop
+        self._loop.call_soon_threadsafe(self._client.add_handler, handler)
+
+    def drop_uploads(self, predicate):
+        """Remove queued uploads matching predicate so nothing is posted for them; returns how many"""
+        removed = self._upload_queue.remove(predicate)
+        with self._lock:
+            for task in list(removed):
+                removed += self._duplicates.pop(task['file_path'], [])
+        for task in removed:
+            self._release_memory(task)
+            self.skip(task['order'])
+        return len(removed)
+
+    def trim_caches(self, keep=1000):
+        """Keep only the most recent posted documents, which language variants may still reuse"""
+        with self._lock:
+            for file_path in list(self._posted)[:-keep]:
+                del self._posted[file_path]
+                self._lost_sources.add(file_path)
+
+    def backlog_bytes(self):
+        """Bytes downloaded and waiting for an upload slot, including those still in the media stage"""
+        with self._lock:
+            tasks = list(self._preparing.values())
+        tasks += self._upload_queue.snapshot()
+        return sum(task.get('size') or 0 for task in tasks)
+
+    def uploaded_bytes(self):
+        """Bytes uploaded so far, including running uploads"""
+        return self.progress.transferred('upload')
+
+    def set_max_uploads(self, max_uploads):
+        """Change the number of concurrent uploads at runtime"""
+        self.max_uploads = min(max_uploads, self.max_upload_workers)
+        self.upload_limiter.set_limit(self.max_uploads)
+
+    def restore_task(self, task, order):
+        """Requeue an upload task saved by a checkpoint, keeping its retry count"""
+        if not all(os.path.exists(path) for path in task.get('parts', [task['file_path']])):
+            self.logger.warning(f"Checkpointed file is gone, not restoring: {task['file_path']}")
+            self.skip(order)
+            return
+        self._submit(dict(task, order=order))
+
+    def queue_header(self, chapter_name, order):
+        """Post a chapter header at the given position in the channel"""
+        self._reorder.ready_threadsafe(order, {'kind': 'header', 'chapter_name': chapter_name, 'order': order})
+
+    def skip(self, order):
+        """Tell the reorder buffer that nothing will be posted for this sequence number"""
+        self._reorder.skip_threadsafe(order)
+
+    def pending_tasks(self):
+        """Snapshot of queued and in-flight upload tasks"""
+        with self._lock:
+            tasks = list(self._in_flight.values()) + list(self._preparing.values())
+            tasks += [task for waiting in self._duplicates.values() for task in waiting]
+            unposted = list(self._unposted)
+        tasks += self._upload_queue.snapshot()
+        tasks = [dict(task) for task in tasks]
+        # Split files remember how many parts are in the channel, so a restart posts only the rest
+        tasks += [dict(entry['task'], posted=entry.get('posted', 0))
+                  for entry in self._reorder.pending() + unposted if entry['kind'] == 'media']
+        for task in tasks:
+            # Buffers and shared uploads can't be checkpointed; the caller fetches these again
+            if task.pop('data', None) is not None or task.get('source'):
+                task['refetch'] = True
+        return tasks
+
+    def _holds(self, order):
+        """Whether a queued, preparing or in-flight upload (or the caller) still has this sequence number"""
+        with self._lock:
+            tasks = list(self._in_flight.values()) + list(self._preparing.values())
+            tasks += [task for waiting in self._duplicates.values() for task in waiting]
+        tasks += self._upload_queue.snapshot()
+        if any(task.get('order') == order for task in tasks):
+            return True
+        return bool(self.holds_order and self.holds_order(order))
+
+    def pending_headers(self):
+        """Chapter headers not posted yet, with their sequence numbers"""
+        with self._lock:
+            unposted = list(self._unposted)
+        return [{'chapter_name': entry['chapter_name'], 'order': entry['order']}
+                for entry in self._reorder.pending() + unposted if entry['kind'] == 'header']
+
+    def unposted(self):
+        """Number of entries that failed to post"""
+        with self._lock:
+            return len(self._unposted)
 
     def _ensure_thumbnails(self):
         # Video thumbnail
@@ -287,20 +643,39 @@ class TelegramUploader:
             ])
 
     def wait_for_uploads(self):
-        """Wait for all queued uploads to complete"""
+        """Wait for all queued uploads to complete and be posted"""
+        while self._preparing and not self._halt_flag:
+            time.sleep(1)
         self._upload_queue.join()
+        
+        # Nothing else is coming, so stop waiting for sequence numbers that never arrived
+        self._loop.call_soon_threadsafe(self._reorder.flush)
+        while len(self._reorder) and not self._halt_flag:
+            time.sleep(1)
 
-    def stop(self):
-        """Graceful shutdown"""
+    def stop(self, wait=True):
+        """Graceful shutdown; with wait=False queued uploads are left for the checkpoint"""
         self.logger.info("Initiating shutdown...")
         self._shutdown_flag = True
+        self._halt_flag = not wait
         
         # Wait for uploads to complete with timeout
         start_time = time.time()
-        while (not self._upload_queue.empty() and 
+        while (wait and not self._upload_queue.empty() and 
                (time.time() - start_time) < 30):
             time.sleep(1)
         
+        self._media_pool.shutdown(wait=False)
+        self.watchdog.stop()
+        if self._owns_progress:
+            self.progress.stop()
+        
+        if self.parallel and self._loop.is_running():
+            try:
+                asyncio.run_coroutine_threadsafe(self.parallel.close(), self._loop).result(timeout=10)
+            except Exception as e:
+                self.logger.warning(f"Failed to close upload connections: {str(e)}")
+        
         # Stop the event loop
         if self._loop.is_running():
             self._loop.call_soon_threadsafe(self._loop.stop)
@@ -314,7 +689,79 @@ class UdvashDownloaderUploader(UdvashDownloader):
     def __init__(self, user_id, password, api_id, api_hash, bot_token, chat_id,
                  max_downloads=3, max_uploads=3, download_dir="downloads",
                  download_archive=True, download_marathon=True, download_bangla=True,
-                 download_english=True, create_json=True, content_types=None):
+                 download_english=True, create_json=True, content_types=None, parse_workers=2,
+                 checkpoint_interval=30, queue_policy="fifo", upload_queue_policy="chapter",
+                 queue_aging=None, reorder_timeout=900, segments=None, adaptive_concurrency=False,
+                 max_downloads_limit=16, max_uploads_limit=8, max_segments=64, tune_interval=20,
+                 cookies_file=None, session_string=None, session_export_file=None, url_expiry_margin=120,
+                 max_upload_size=2000 * 1024 * 1024, media_workers=2, transcode=None, bundle_pdfs=False,
+                 memory_threshold=8 * 1024 * 1024, memory_budget=128 * 1024 * 1024, download_backend="process",
+                 stall_window=300, stall_min_rate=1024, dedup_languages=False, dedup_head=False,
+                 shard_index=0, shard_count=1, download_limit=0, upload_limit=0, total_bandwidth=0,
+                 bandwidth_backlog=1024 * 1024 * 1024, admin_ids=None, upload_parallelism=4,
+                 max_transmissions=10, client_workers=50, selection=None):
+        
+        # The tuner starts low and probes upwards; fixed concurrency keeps the old 64 segments
+        if segments is None:
+            segments = 16 if adaptive_concurrency else 64
+        
+        # Checkpoint of pending work and manifest of files already posted, one of each per shard
+        suffix = shard_suffix(shard_index, shard_count)
+        self.checkpoint = CheckpointStore(os.path.join(download_dir, f"checkpoint{suffix}.json"))
+        self.manifest = UploadManifest(os.path.join(download_dir, f"manifest{suffix}.json"), download_dir)
+        self.checkpoint_interval = checkpoint_interval
+        self.throughput = ThroughputHistory(os.path.join(download_dir, "throughput.json"))
+        self._started_at = None
+        # Videos split for upload whose original is gone: file path -> parts and how many are posted
+        self.splits = {}
+        self._checkpoint_stop = threading.Event()
+        self._cleaned_up = False
+        
+        # Small PDFs skip the disk: fetched into RAM and uploaded from there, within a total budget.
+        # Bundling needs the PDFs on disk, so it turns this off.
+        self.memory_threshold = 0 if bundle_pdfs else memory_threshold
+        self.memory_budget = MemoryBudget(memory_budget)
+        # Running in-memory fetches: file path -> response and bytes read, for the watchdog and progress
+        self.memory_fetches = {}
+        # One progress line for both directions
+        self.progress = TransferProgress()
+        # Bandwidth budgets, rebalanced towards uploads as their backlog grows
+        self.bandwidth = BandwidthAllocator(download_limit, upload_limit, total_bandwidth,
+                                            backlog_target=bandwidth_backlog,
+                                            logger=logging.getLogger("udvash_downloader"))
+        
+        # Connect to Telegram while the browser launches and logs in
+        startup = ThreadPoolExecutor(max_workers=1)
+        uploader_future = startup.submit(
+            TelegramUploader,
+            api_id=api_id,
+            api_hash=api_hash,
+            bot_token=bot_token,
+            chat_id=chat_id,
+            max_uploads=max_uploads,
+            manifest=self.manifest,
+            queue_policy=upload_queue_policy,
+            queue_aging=queue_aging,
+            reorder_timeout=reorder_timeout,
+            max_upload_workers=max_uploads_limit,
+            session_string=session_string,
+            session_export_file=session_export_file,
+            max_upload_size=max_upload_size,
+            media_workers=media_workers,
+            transcode=transcode,
+            memory_budget=self.memory_budget,
+            stall_window=stall_window,
+            stall_min_rate=stall_min_rate,
+            progress=self.progress,
+            bandwidth=self.bandwidth,
+            upload_parallelism=upload_parallelism,
+            max_transmissions=max_transmissions,
+            client_workers=client_workers,
+            redownload=self._redownload,
+            holds_order=self._holds_order
+        )
+        startup.shutdown(wait=False)
+        self.uploader = None
         
         super().__init__(
             user_id=user_id,
@@ -325,57 +772,383 @@ class UdvashDownloaderUploader(UdvashDownloader):
             download_marathon=download_marathon,
             download_bangla=download_bangla,
             download_english=download_english,
-            create_json=create_json
+            create_json=create_json,
+            parse_workers=parse_workers,
+            queue_policy=queue_policy,
+            queue_aging=queue_aging,
+            max_download_workers=max_downloads_limit,
+            segments=segments,
+            cookies_file=cookies_file,
+            url_expiry_margin=url_expiry_margin,
+            download_backend=download_backend,
+            stall_window=stall_window,
+            stall_min_rate=stall_min_rate,
+            dedup_languages=dedup_languages,
+            dedup_head=dedup_head,
+            shard_index=shard_index,
+            shard_count=shard_count,
+            progress=self.progress,
+            bandwidth=self.bandwidth,
+            selection=selection,
+            content_types=content_types
         )
+        try:
+            self.uploader = uploader_future.result()
+        except Exception:
+            # Chrome is already up and logged in; don't leave it running
+            self.logger.error("Telegram uploader failed to start, closing the browser")
+            self.cleanup()
+            raise
+        self.bandwidth.start(self.uploader.backlog_bytes)
         
-        self.uploader = TelegramUploader(
-            api_id=api_id,
-            api_hash=api_hash,
-            bot_token=bot_token,
-            chat_id=chat_id,
-            max_uploads=max_uploads
-        )
+        # /pause, /concurrency, /skip ... from the listed Telegram users
+        if admin_ids:
+            for handler in ControlCommands(self, admin_ids, logger=self.logger).handlers():
+                self.uploader.add_handler(handler)
         
-        # Set content types to download/upload (default to both if None)
-        self.content_types = content_types or ["video", "pdf"]
-        self.current_chapter = None
+        # AIMD tuning of download/upload workers and per-file segments from measured throughput
+        self.tuner = None
+        if adaptive_concurrency:
+            self.tuner = ConcurrencyTuner(interval=tune_interval, logger=self.logger)
+            self.tuner.add(
+                AIMDController("downloads", self.set_max_downloads, max_downloads, 1, max_downloads_limit),
+                self.download_stats,
+                self.downloaded_bytes
+            )
+            self.tuner.add(
+                AIMDController("segments", self.set_segments, segments, 4, max_segments, step=4),
+                self.download_stats,
+                self.downloaded_bytes
+            )
+            self.tuner.add(
+                AIMDController("uploads", self.uploader.set_max_uploads, max_uploads, 1, max_uploads_limit),
+                self.uploader.upload_stats,
+                self.uploader.uploaded_bytes
+            )
+        
+        # Chapter directories whose header is queued or already in the channel
+        self.headed_chapters = set()
         self.file_metadata = {}
         self.metadata_lock = threading.Lock()
+        
+        # Optionally post each chapter's PDFs per content type and language as one bookmarked file
+        self.bundler = None
+        self.current_dir = None
+        if bundle_pdfs:
+            self.bundler = PdfBundler(self._queue_bundle, self._skip_bundle, self._next_order,
+                                      on_failed=self._queue_unbundled,
+                                      max_bytes=max_upload_size, logger=self.logger)
+
+    def is_completed(self, file_path):
+        # Files are deleted after upload, so also consult the manifest and the split videos
+        return super().is_completed(file_path) or file_path in self.manifest or file_path in self.splits
+
+    def save_checkpoint(self):
+        """Write pending downloads, uploads and retry counts to disk"""
+        try:
+            with self.metadata_lock:
+                file_metadata = dict(self.file_metadata)
+            downloads = self.pending_downloads()
+            uploads = []
+            for task in self.uploader.pending_tasks():
+                # In-memory files and shared uploads are lost with the process, so they are fetched again on resume
+                if task.pop('refetch', False):
+                    downloads.append({'url': None, 'file_path': task['file_path'], 'file_type': task['file_type'],
+                                      'order': task['order'], 'page_url': task.get('page_url')})
+                else:
+                    uploads.append(task)
+            self.splits = {task['file_path']: {'parts': task['parts'], 'posted': task.get('posted', 0)}
+                           for task in uploads if task.get('parts') and not task.get('members')}
+            self.checkpoint.save({
+                'downloads': downloads,
+                'uploads': uploads,
+                'headers': self.uploader.pending_headers(),
+                'bundles': self.bundler.snapshot() if self.bundler else [],
+                'splits': self.splits,
+                'file_metadata': file_metadata,
+                'headed_chapters': sorted(self.headed_chapters)
+            })
+            self.logger.info(f"Checkpoint saved: {len(downloads)} downloads, {len(uploads)} uploads pending")
+        except Exception as e:
+            self.logger.error(f"Failed to save checkpoint: {str(e)}")
+
+    def restore_checkpoint(self):
+        """Requeue work saved by an interrupted run before crawling"""
+        state = self.checkpoint.load()
+        if not state:
+            return
+        
+        self.logger.info(f"Restoring checkpoint: {len(state['downloads'])} downloads, {len(state['uploads'])} uploads")
+        with self.metadata_lock:
+            self.file_metadata.update(state.get('file_metadata', {}))
+        self.headed_chapters = set(state.get('headed_chapters', []))
+        self.splits = state.get('splits', {})
+        
+        # Headers and uploads keep their relative order under new sequence numbers
+        entries = [('header', header) for header in state.get('headers', [])]
+        entries += [('upload', task) for task in state['uploads']]
+        for kind, item in sorted(entries, key=lambda entry: entry[1].get('order', 0)):
+            if kind == 'header':
+                self.uploader.queue_header(item['chapter_name'], self._next_order())
+            else:
+                self.uploader.restore_task(item, self._next_order())
+        if self.bundler:
+            self.bundler.restore(state.get('bundles', []))
+        for task in state['downloads']:
+            if not self.is_completed(task['file_path']):
+                extra = {k: v for k, v in task.items() if k not in ('url', 'file_path', 'file_type', 'order')}
+                self.queue_download(task['url'], task['file_path'], task['file_type'], **extra)
+
+    def _checkpoint_loop(self):
+        while not self._checkpoint_stop.wait(self.checkpoint_interval):
+            self.save_checkpoint()
+
+    def request_shutdown(self):
+        """Stop all work and checkpoint whatever is still pending"""
+        if self.shutdown_requested:
+            return
+        self.logger.info("Shutdown requested, checkpointing pending work...")
+        super().request_shutdown()
+        self.uploader.stop(wait=False)
+        self.save_checkpoint()
+
+    def queue_download(self, url, file_path, file_type, **extra):
+        # Reserve the chapter header's place in the channel before the chapter's first file
+        # Once per chapter: the daemon's polls and restored downloads come back to earlier chapters
+        chapter_dir = os.path.dirname(os.path.dirname(file_path))
+        if chapter_dir not in self.headed_chapters:
+            self.headed_chapters.add(chapter_dir)
+            if not self.manifest.has_under(chapter_dir):
+                self.uploader.queue_header(Path(file_path).parts[-3], self._next_order())
+        
+        if self.bundler:
+            # Groups behind the crawl won't get new files; the bundle is posted after their directory
+            directory = os.path.dirname(file_path)
+            if directory != self.current_dir:
+                self.current_dir = directory
+                self.bundler.close_except(directory)
+            if file_type == "pdf":
+                self.bundler.expect(file_path)
+        
+        super().queue_download(url, file_path, file_type, **extra)
 
     def download_file(self, url, file_path, file_type):
-        # Skip if file type is not in the specified content types
-        if file_type not in self.content_types:
-            self.logger.info(f"Skipping {file_type} file (not in selected content types): {file_path}")
-            return False
-            
+        if file_type == "pdf" and self.memory_threshold:
+            with self.download_lock:
+                task = self.in_flight_downloads[file_path]
+            data = self._fetch_to_memory(url, file_path, task.get('size'))
+            if data is None and self.watchdog.is_stalled(file_path):
+                return False
+            if data is not None:
+                self.download_stats.add(bytes=data.getbuffer().nbytes)
+                self._queue_upload(file_path, file_type, task['order'], data=data, page_url=task.get('page_url'))
+                return True
+        
         success = super().download_file(url, file_path, file_type)
         
         if success:
-            self._queue_upload(file_path, file_type)
+            with self.download_lock:
+                order = self.in_flight_downloads[file_path]['order']
+            if self.bundler and file_type == "pdf":
+                key = os.path.basename(file_path).rsplit('_', 1)[0]
+                self.bundler.done(file_path, key, self._get_topic_name(file_path))
+                self.uploader.skip(order)
+            else:
+                self._queue_upload(file_path, file_type, order)
         
         return success
 
-    def _queue_upload(self, file_path, file_type):
+    def _fetch_to_memory(self, url, file_path, size=None):
+        """Fetch a small file into a buffer under the memory budget; None means take the disk path"""
+        # Decided from the planned size or a HEAD, so a large PDF costs no GET it doesn't use
+        size = size or self.probe_size(url)
+        if not size or size > self.memory_threshold or not self.memory_budget.acquire(size, timeout=0):
+            return None
+        try:
+            # identity encoding, so Content-Length is the number of bytes we will hold
+            response = self.http.get(url, stream=True, timeout=60, headers={'Accept-Encoding': 'identity'})
+        except Exception as e:
+            self.memory_budget.release(size)
+            self.logger.warning(f"In-memory fetch failed, using the disk path: {str(e)}")
+            return None
+        
+        with response:
+            if response.status_code in (401, 403, 410):
+                self.memory_budget.release(size)
+                raise LinkExpired(url)
+            if not response.ok or int(response.headers.get('Content-Length') or 0) != size:
+                self.memory_budget.release(size)
+                return None
+            
+            data = io.BytesIO()
+            fetch = {'response': response, 'bytes': 0}
+            with self.download_lock:
+                self.memory_fetches[file_path] = fetch
+            try:
+                for chunk in response.iter_content(chunk_size=256 * 1024):
+                    self.bandwidth.download.wait(len(chunk))
+                    data.write(chunk)
+                    fetch['bytes'] = data.tell()
+                if data.tell() != size:
+                    raise IOError(f"got {data.tell()} of {size} bytes")
+            except Exception as e:
+                self.memory_budget.release(size)
+                self.logger.warning(f"In-memory fetch failed, using the disk path: {str(e)}")
+                return None
+            finally:
+                with self.download_lock:
+                    self.memory_fetches.pop(file_path, None)
+        
+        data.name = os.path.basename(file_path)
+        data.seek(0)
+        self.logger.info(f"Fetched {data.name} into memory ({size / 1024:.0f} KB)")
+        return data
+
+    def _download_progress(self, file_path):
+        # In-memory fetches have nothing on disk; count the bytes read from the response
+        with self.download_lock:
+            fetch = self.memory_fetches.get(file_path)
+        return super()._download_progress(file_path) + (fetch['bytes'] if fetch else 0)
+
+    def _cancel_download(self, file_path):
+        with self.download_lock:
+            fetch = self.memory_fetches.get(file_path)
+        if fetch:
+            fetch['response'].close()
+        super()._cancel_download(file_path)
+
+    def duplicate_ready(self, task, source_path):
+        file_path = task['file_path']
+        if self.bundler and task['file_type'] == "pdf":
+            # Bundles are merged from disk, so the variant needs its own copy
+            if os.path.exists(source_path):
+                super().duplicate_ready(task, source_path)
+            if not os.path.exists(file_path):
+                self.logger.warning(f"Source of {file_path} was already bundled and removed, downloading it separately")
+                self._redownload(task)
+                return
+            self.bundler.done(file_path, os.path.basename(file_path).rsplit('_', 1)[0], self._get_topic_name(file_path))
+            self.uploader.skip(task['order'])
+            return
+        self.uploader.queue_duplicate(source_path, file_path, Path(file_path).parts[-3],
+                                      self._get_topic_name(file_path), task['file_type'], task['order'],
+                                      page_url=task.get('page_url'))
+
+    def _holds_order(self, order):
+        """Whether a download or an unfinished bundle still has this sequence number"""
+        if any(task.get('order') == order for task in self.pending_downloads()):
+            return True
+        return bool(self.bundler and order in self.bundler.orders())
+
+    def _redownload(self, task):
+        """Download a language variant itself, in its own slot, when its source can't be shared"""
+        self.download_queue.put({'url': None, 'file_path': task['file_path'], 'file_type': task['file_type'],
+                                 'order': task['order'], 'page_url': task.get('page_url'), 'no_dedup': True})
+
+    def download_failed(self, task):
+        # Nothing will be posted for this slot; interrupted downloads keep it for the checkpoint
+        self.uploader.skip(task['order'])
+        if self.bundler and task['file_type'] == "pdf":
+            self.bundler.failed(task['file_path'])
+
+    def pause(self):
+        self.download_limiter.pause()
+        self.uploader.upload_limiter.pause()
+        self.logger.info("Paused downloads and uploads")
+
+    def resume(self):
+        self.download_limiter.resume()
+        self.uploader.upload_limiter.resume()
+        self.logger.info("Resumed downloads and uploads")
+
+    def set_concurrency(self, downloads=None, uploads=None, segments=None):
+        """Set limits by hand; with adaptive concurrency on, the tuner keeps them fixed from now on"""
+        # Limits can't go past the worker threads that were started
+        if downloads is not None:
+            downloads = min(downloads, self.max_download_workers)
+        if uploads is not None:
+            uploads = min(uploads, self.uploader.max_upload_workers)
+        knobs = {
+            'downloads': (downloads, self.set_max_downloads, lambda: self.max_parallel_downloads),
+            'uploads': (uploads, self.uploader.set_max_uploads, lambda: self.uploader.max_uploads),
+            'segments': (segments, self.set_segments, lambda: self.segments)
+        }
+        applied = {}
+        for name, (value, apply, current) in knobs.items():
+            if value is None:
+                continue
+            if not (self.tuner and self.tuner.pin(name, value)):
+                apply(value)
+            applied[name] = current()
+        self.logger.info(f"Concurrency set by admin: {applied}")
+        return applied
+
+    def skip_chapter(self, chapter):
+        dropped = super().skip_chapter(chapter)
+        return dropped + self.uploader.drop_uploads(self.task_skipped)
+
+    def _queue_upload(self, file_path, file_type, order, **extra):
         try:
             path_parts = Path(file_path).parts
             chapter_name = path_parts[-3]
+            if self.chapter_skipped(path_parts[-4], chapter_name):
+                # Finished after its chapter was skipped
+                self.uploader.skip(order)
+                return
             topic_name = self._get_topic_name(file_path)
-            
-            if chapter_name != self.current_chapter:
-                asyncio.run_coroutine_threadsafe(
-                    self.uploader.send_chapter_notification(chapter_name),
-                    self.uploader._loop
-                ).result()
-                self.current_chapter = chapter_name
                 
             self.uploader.queue_upload(
                 file_path=file_path,
                 chapter_name=chapter_name,
                 topic_name=topic_name,
-                file_type=file_type
+                file_type=file_type,
+                order=order,
+                **extra
             )
         except Exception as e:
             self.logger.error(f"Error queueing upload: {str(e)}")
+            if extra.get('data') is not None:
+                self.memory_budget.release(extra['data'].getbuffer().nbytes)
+            self.uploader.skip(order)
+
+    def _queue_bundle(self, group, paths):
+        members = [entry['file_path'] for entry in group['files']]
+        directory, language = group['key'].rsplit('|', 1)
+        bundle_path = self.bundler.bundle_path(group['key'])
+        extra = {'members': members}
+        if len(paths) > 1:
+            extra['parts'] = paths
+        
+        self.uploader.queue_upload(
+            file_path=bundle_path,
+            chapter_name=Path(bundle_path).parts[-3],
+            topic_name=f"{os.path.basename(directory)} ({len(members)} notes, {language})",
+            file_type="pdf",
+            order=group['order'],
+            **extra
+        )
+
+    def _queue_unbundled(self, group):
+        """Post the PDFs of a bundle that couldn't be merged one by one, in the bundle's place"""
+        members = [entry['file_path'] for entry in group['files'] if os.path.exists(entry['file_path'])]
+        if not members:
+            self._skip_bundle(group)
+            return
+        directory, language = group['key'].rsplit('|', 1)
+        bundle_path = self.bundler.bundle_path(group['key'])
+        self.uploader.queue_upload(
+            file_path=bundle_path,
+            chapter_name=Path(bundle_path).parts[-3],
+            topic_name=f"{os.path.basename(directory)} ({language})",
+            file_type="pdf",
+            order=group['order'],
+            parts=members,
+            members=members,
+            unbundled=True
+        )
+
+    def _skip_bundle(self, group):
+        self.uploader.skip(group['order'])
 
     def _get_topic_name(self, file_path):
         base_name = os.path.basename(file_path)
@@ -390,14 +1163,8 @@ class UdvashDownloaderUploader(UdvashDownloader):
         title = content_card['title']
         clean_title = re.sub(r'[<>:"/\\|?*]', '_', title)
         
-        # Extract topic from the content card
-        topic = content_card.get('topic', None)
-        if not topic:
-            # If topic isn't available directly, try to extract it
-            try:
-                topic = self.get_topic_from_content_card(content_card['element'])
-            except:
-                topic = "Unknown Topic"
+        # The card parser already extracted the topic
+        topic = content_card.get('topic') or "Unknown Topic"
         
         with self.metadata_lock:
             self.file_metadata[clean_title] = {
@@ -412,60 +1179,17 @@ class UdvashDownloaderUploader(UdvashDownloader):
             content_type_name
         )
 
-    def get_topic_from_content_card(self, card_element):
-        """Extract topic name from content card HTML"""
-        try:
-            # Find the content div
-            content_div = card_element.find_element(By.CSS_SELECTOR, "div.content")
-            if not content_div:
-                return None
-                
-            # Get the HTML content
-            content_html = content_div.get_attribute('innerHTML')
-            
-            # Parse with BeautifulSoup
-            soup = BeautifulSoup(content_html, 'html.parser')
-            
-            # Try to find a strong tag with topic information (look for the second one, which is typically the topic)
-            # First, look for all strong tags or spans with strong inside
-            strong_elements = soup.find_all('strong')
-            if len(strong_elements) >= 2:
-                # The second strong element often contains the topic name
-                topic_text = strong_elements[1].get_text(strip=True)
-                self.logger.info(f"Extracted topic from strong element: {topic_text}")
-                return topic_text
-                
-            # If we couldn't find the topic in strong tags, try looking for it in the table cells
-            # Get all table cells
-            all_cells = soup.find_all('td')
-            
-            # Look for the cell that contains the "◾" character or has topic-like content
-            for cell in all_cells:
-                cell_text = cell.get_text(strip=True)
-                if "◾" in cell_text or (len(cell_text) > 5 and not cell_text.startswith("🔸")):
-                    # Process to clean up the text
-                    topic_text = re.sub(r'^\s*◾\s*', '', cell_text)
-                    self.logger.info(f"Extracted topic from cell: {topic_text}")
-                    return topic_text
-            
-            # If we still can't find a topic, look for the last non-empty cell as a fallback
-            non_empty_cells = [cell for cell in all_cells if cell.get_text(strip=True)]
-            if non_empty_cells:
-                topic_text = non_empty_cells[-1].get_text(strip=True)
-                topic_text = re.sub(r'^\s*◾\s*', '', topic_text)
-                self.logger.info(f"Extracted topic from last non-empty cell: {topic_text}")
-                return topic_text
-                
-            # If all else fails, return a default topic
-            return "General"
-        except Exception as e:
-            self.logger.error(f"Error extracting topic name: {str(e)}")
-            return "Unknown Topic"  # Return a default value instead of None
+    def _start_run(self):
+        self._started_at = time.monotonic()
+        self.restore_checkpoint()
+        threading.Thread(target=self._checkpoint_loop, daemon=True).start()
+        if self.tuner:
+            self.tuner.start()
 
     def download_all(self, from_chapter=None, to_chapter=None, specific_subjects=None):
         try:
+            self._start_run()
             super().download_all(from_chapter, to_chapter, specific_subjects)
-            self.uploader.wait_for_uploads()
         except KeyboardInterrupt:
             self.logger.info("Interrupted by user. Cleaning up...")
         except Exception as e:
@@ -473,9 +1197,94 @@ class UdvashDownloaderUploader(UdvashDownloader):
         finally:
             self.cleanup()
 
+    def run_daemon(self, **options):
+        try:
+            self._start_run()
+            super().run_daemon(**options)
+        except KeyboardInterrupt:
+            self.logger.info("Interrupted by user. Cleaning up...")
+        except Exception as e:
+            self.logger.error(f"Error in run_daemon: {str(e)}")
+        finally:
+            self.cleanup()
+
+    def end_poll(self):
+        # Nothing more arrives for the polled directories until the next cycle, so their bundles go out now
+        if self.bundler:
+            self.current_dir = None
+            self.bundler.close_all()
+
+    def trim_caches(self):
+        super().trim_caches()
+        self.uploader.trim_caches()
+
     def cleanup(self):
         super().cleanup()
-        self.uploader.stop()
+        # Also called by the base constructor when login fails, before the uploader is attached
+        if self._cleaned_up or self.uploader is None:
+            return
+        
+        # Let the uploads finish unless we are shutting down on a signal
+        if not self.shutdown_requested:
+            if self.bundler:
+                self.bundler.close_all()
+                while self.bundler.busy():
+                    time.sleep(1)
+            self.uploader.wait_for_uploads()
+        self._cleaned_up = True
+        self._checkpoint_stop.set()
+        if self.tuner:
+            self.tuner.stop()
+        if self.bundler:
+            self.bundler.shutdown()
+        
+        if self.shutdown_requested:
+            self.uploader.stop(wait=False)
+            self.save_checkpoint()
+        else:
+            self.uploader.stop()
+            if self.uploader.unposted():
+                # Keep what failed to post for the next run
+                self.save_checkpoint()
+            else:
+                self.checkpoint.clear()
+            self.record_throughput()
+        self.progress.stop()
+
+    def record_throughput(self):
+        """Save this run's average rates for plan-mode ETAs, if it moved enough data to be meaningful"""
+        downloaded = self.download_stats.snapshot()['bytes']
+        if not self._started_at or downloaded < 50 * 1024 * 1024:
+            return
+        try:
+            self.throughput.record(download_rate=downloaded / (time.monotonic() - self._started_at),
+                                   upload_rate=self.uploader.upload_rate())
+        except Exception as e:
+            self.logger.error(f"Failed to record throughput: {str(e)}")
+
+
+class UdvashPlanner(UdvashDownloader):
+    """Plan mode: crawls like a real run, then sizes everything that would be downloaded"""
+    def __init__(self, *args, plan_workers=32, **kwargs):
+        self.plan_workers = plan_workers
+        self.plan_items = []
+        super().__init__(*args, **kwargs)
+        self.manifest = UploadManifest(os.path.join(self.download_dir, f"manifest{self.shard_suffix}.json"), self.download_dir)
+
+    def is_completed(self, file_path):
+        # Files already posted are gone from disk but not part of the remaining work
+        return super().is_completed(file_path) or file_path in self.manifest
+
+    def queue_download(self, url, file_path, file_type, **extra):
+        self.plan_items.append(dict(extra, url=url, file_path=file_path, file_type=file_type))
+
+    def wait_for_downloads_to_complete(self):
+        # Nothing was queued; size the collected files while the browser is still up for URL resolution
+        planner = Planner(self.http, self.resolve_url, self.download_dir, workers=self.plan_workers,
+                          logger=self.logger)
+        items = planner.size_all(self.plan_items)
+        rates = ThroughputHistory(os.path.join(self.download_dir, "throughput.json")).load()
+        planner.report(items, rates, self.plan_path)
 
 
 def main():
@@ -498,6 +1307,64 @@ def main():
     no_english = os.environ.get('NO_ENGLISH', 'false').lower() == 'true'
     no_marathon = os.environ.get('NO_MARATHON', 'false').lower() == 'true'
     no_archive = os.environ.get('NO_ARCHIVE', 'false').lower() == 'true'
+    parse_workers = int(os.environ.get('PARSE_WORKERS', '2'))
+    checkpoint_interval = int(os.environ.get('CHECKPOINT_INTERVAL', '30'))
+    queue_policy = os.environ.get('QUEUE_POLICY', 'fifo')
+    upload_queue_policy = os.environ.get('UPLOAD_QUEUE_POLICY', 'chapter')
+    queue_aging = float(os.environ['QUEUE_AGING']) if os.environ.get('QUEUE_AGING') else None
+    reorder_timeout = int(os.environ.get('REORDER_TIMEOUT', '900'))
+    adaptive_concurrency = os.environ.get('ADAPTIVE_CONCURRENCY', 'false').lower() == 'true'
+    segments = int(os.environ['SEGMENTS']) if os.environ.get('SEGMENTS') else None
+    # Upper bounds for the tuner and for /concurrency; that many idle workers are started either way
+    max_downloads_limit = int(os.environ.get('ADAPTIVE_MAX_DOWNLOADS', '16'))
+    max_uploads_limit = int(os.environ.get('ADAPTIVE_MAX_UPLOADS', '8'))
+    max_segments = int(os.environ.get('ADAPTIVE_MAX_SEGMENTS', '64'))
+    tune_interval = int(os.environ.get('TUNE_INTERVAL', '20'))
+    url_expiry_margin = int(os.environ.get('URL_EXPIRY_MARGIN', '120'))
+    cookies_file = os.environ.get('UDVASH_COOKIES_FILE', 'udvash_cookies.json')
+    session_string = os.environ.get('TELEGRAM_SESSION_STRING', '') or None
+    # A path such as telegram_session.txt, which .gitignore keeps out of the repo
+    session_export_file = os.environ.get('TELEGRAM_SESSION_EXPORT', '') or None
+    max_upload_size = int(os.environ.get('MAX_UPLOAD_SIZE_MB', '2000')) * 1024 * 1024
+    media_workers = int(os.environ.get('MEDIA_WORKERS', '2'))
+    transcode = None
+    if os.environ.get('TRANSCODE', 'false').lower() == 'true':
+        transcode = {
+            'crf': int(os.environ.get('TRANSCODE_CRF', '28')),
+            'preset': os.environ.get('TRANSCODE_PRESET', 'veryfast'),
+            'max_height': int(os.environ.get('TRANSCODE_MAX_HEIGHT', '720')),
+            'jobs': int(os.environ.get('TRANSCODE_JOBS', '0')) or None,
+            'expected_kbps': int(os.environ.get('TRANSCODE_EXPECTED_KBPS', '1000'))
+        }
+    bundle_pdfs = os.environ.get('BUNDLE_PDFS', 'false').lower() == 'true'
+    memory_threshold = int(os.environ.get('MEMORY_PATH_MB', '8')) * 1024 * 1024
+    memory_budget = int(os.environ.get('MEMORY_BUDGET_MB', '128')) * 1024 * 1024
+    download_backend = os.environ.get('DOWNLOAD_BACKEND', 'process')
+    stall_window = int(os.environ.get('STALL_WINDOW', '300'))
+    stall_min_rate = int(os.environ.get('STALL_MIN_RATE_KB', '1')) * 1024
+    dedup_languages = os.environ.get('DEDUP_LANGUAGES', 'false').lower() == 'true'
+    dedup_head = os.environ.get('DEDUP_HEAD', 'false').lower() == 'true'
+    download_limit = int(os.environ.get('DOWNLOAD_LIMIT_KB', '0')) * 1024
+    upload_limit = int(os.environ.get('UPLOAD_LIMIT_KB', '0')) * 1024
+    total_bandwidth = int(os.environ.get('TOTAL_BANDWIDTH_KB', '0')) * 1024
+    bandwidth_backlog = int(os.environ.get('BANDWIDTH_BACKLOG_MB', '1024')) * 1024 * 1024
+    upload_parallelism = int(os.environ.get('UPLOAD_PARALLELISM', '4'))
+    max_transmissions = int(os.environ.get('MAX_TRANSMISSIONS', '10'))
+    client_workers = int(os.environ.get('CLIENT_WORKERS', '50'))
+    admin_ids = [int(i) for i in os.environ.get('ADMIN_IDS', '').split(",") if i.strip()]
+
+    shard_index = int(os.environ.get('SHARD_INDEX', '0'))
+    shard_count = int(os.environ.get('SHARD_COUNT', '1'))
+    plan_only = os.environ.get('PLAN_ONLY', 'false').lower() == 'true'
+    daemon = os.environ.get('DAEMON', 'false').lower() == 'true'
+    plan_workers = int(os.environ.get('PLAN_WORKERS', '32'))
+    logging_setup.configure(
+        json=os.environ.get('LOG_FORMAT', 'json').lower() == 'json',
+        max_bytes=int(os.environ.get('LOG_MAX_MB', '20')) * 1024 * 1024,
+        backups=int(os.environ.get('LOG_BACKUPS', '5')),
+        sample_rate=float(os.environ.get('LOG_SAMPLE_RATE', '2')),
+        sample_burst=int(os.environ.get('LOG_SAMPLE_BURST', '20'))
+    )
 
     specific_subjects = None
     if subjects:
@@ -510,6 +1377,36 @@ def main():
     elif only_pdf:
         content_types = ["pdf"]
     
+    # Every filter is applied during the crawl, before the pages it rules out are loaded
+    selection = Selection(
+        subjects=specific_subjects,
+        chapters=os.environ.get('CHAPTERS', ''),
+        from_chapter=from_chapter,
+        to_chapter=to_chapter,
+        kinds=[kind for kind, skip in (("Marathon", no_marathon), ("Archive", no_archive)) if not skip],
+        languages=[code for code, skip in (("Bn", no_bangla), ("En", no_english)) if not skip],
+        content_types=content_types,
+        title_pattern=os.environ.get('TITLE_PATTERN', '') or None,
+        topic_pattern=os.environ.get('TOPIC_PATTERN', '') or None
+    )
+    
+    if plan_only:
+        # Dry run: no Telegram connection, no downloads
+        planner = UdvashPlanner(
+            user_id=user_id,
+            password=password,
+            download_dir=download_dir,
+            create_json=False,
+            parse_workers=parse_workers,
+            cookies_file=cookies_file,
+            selection=selection,
+            plan_workers=plan_workers,
+            shard_index=shard_index,
+            shard_count=shard_count
+        )
+        planner.download_all()
+        return
+    
     try:
         downloader = UdvashDownloaderUploader(
             user_id=user_id,
@@ -521,18 +1418,73 @@ def main():
             max_downloads=max_downloads,
             max_uploads=max_uploads,
             download_dir=download_dir,
-            download_archive=not no_archive,
-            download_marathon=not no_marathon,
-            download_bangla=not no_bangla,
-            download_english=not no_english,
-            content_types=content_types
+            selection=selection,
+            parse_workers=parse_workers,
+            checkpoint_interval=checkpoint_interval,
+            queue_policy=queue_policy,
+            upload_queue_policy=upload_queue_policy,
+            queue_aging=queue_aging,
+            reorder_timeout=reorder_timeout,
+            segments=segments,
+            adaptive_concurrency=adaptive_concurrency,
+            max_downloads_limit=max_downloads_limit,
+            max_uploads_limit=max_uploads_limit,
+            max_segments=max_segments,
+            tune_interval=tune_interval,
+            cookies_file=cookies_file,
+            session_string=session_string,
+            session_export_file=session_export_file,
+            url_expiry_margin=url_expiry_margin,
+            max_upload_size=max_upload_size,
+            media_workers=media_workers,
+            transcode=transcode,
+            bundle_pdfs=bundle_pdfs,
+            memory_threshold=memory_threshold,
+            memory_budget=memory_budget,
+            download_backend=download_backend,
+            stall_window=stall_window,
+            stall_min_rate=stall_min_rate,
+            dedup_languages=dedup_languages,
+            dedup_head=dedup_head,
+            shard_index=shard_index,
+            shard_count=shard_count,
+            download_limit=download_limit,
+            upload_limit=upload_limit,
+            total_bandwidth=total_bandwidth,
+            bandwidth_backlog=bandwidth_backlog,
+            admin_ids=admin_ids,
+            upload_parallelism=upload_parallelism,
+            max_transmissions=max_transmissions,
+            client_workers=client_workers
         )
         
-        downloader.download_all(
-            from_chapter=from_chapter,
-            to_chapter=to_chapter,
-            specific_subjects=specific_subjects
-        )
+        # Checkpoint pending work on SIGTERM (docker stop, Actions cancel/timeout) and Ctrl+C.
+        # The handler only records the signal; the shutdown itself runs on the main thread below.
+        received = []
+        def handle_signal(signum, frame):
+            received.append(signum)
+        
+        signal.signal(signal.SIGTERM, handle_signal)
+        signal.signal(signal.SIGINT, handle_signal)
+        
+        if daemon:
+            # Stay up and mirror new content as it is published
+            runner = threading.Thread(target=downloader.run_daemon, kwargs={
+                'interval': int(os.environ.get('POLL_INTERVAL', '900')),
+                'jitter': float(os.environ.get('POLL_JITTER', '0.2')),
+                'full_scan_interval': int(os.environ.get('FULL_SCAN_INTERVAL', '21600')),
+                'max_pages': int(os.environ.get('POLL_MAX_PAGES', '30')),
+                'recycle_pages': int(os.environ.get('BROWSER_RECYCLE_PAGES', '300'))
+            })
+        else:
+            runner = threading.Thread(target=downloader.download_all)
+        runner.start()
+        while runner.is_alive() and not received:
+            runner.join(timeout=1)
+        if received:
+            downloader.logger.info(f"Received {signal.Signals(received[0]).name}")
+            downloader.request_shutdown()
+        runner.join()
     except Exception as e:
         logging.error(f"Fatal error: {str(e)}", exc_info=True)
 
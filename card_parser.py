@@ -0,0 +1,107 @@
+import re
+import json
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urljoin, urlparse, parse_qs
+from bs4 import BeautifulSoup
+
+CARD_SELECTOR = "div.col-xl-3.col-lg-4.col-md-6.d-flex .card"
+
+
+def _text(element):
+    """Whitespace-normalized text of an element, like Selenium's .text"""
+    return " ".join(element.get_text(" ").split())
+
+
+def extract_topic(content_html):
+    """Extract topic name from the inner HTML of a card's content div"""
+    soup = BeautifulSoup(content_html, 'html.parser')
+
+    # The second strong element often contains the topic name
+    strong_elements = soup.find_all('strong')
+    if len(strong_elements) >= 2:
+        return strong_elements[1].get_text(strip=True)
+
+    # Look for the cell that contains the "◾" character or has topic-like content
+    all_cells = soup.find_all('td')
+    for cell in all_cells:
+        cell_text = cell.get_text(strip=True)
+        if "◾" in cell_text or (len(cell_text) > 5 and not cell_text.startswith("🔸")):
+            return re.sub(r'^\s*◾\s*', '', cell_text)
+
+    # Fall back to the last non-empty cell
+    non_empty_cells = [cell for cell in all_cells if cell.get_text(strip=True)]
+    if non_empty_cells:
+        return re.sub(r'^\s*◾\s*', '', non_empty_cells[-1].get_text(strip=True))
+
+    return "General"
+
+
+def parse_content_cards(html, base_url):
+    """Parse every content card on a content type page.
+
+    Runs in a worker process, so it only takes and returns plain data: the
+    result is a compact JSON string with the cards and the number of cards
+    skipped for missing elements.
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+    cards = []
+    skipped = 0
+
+    for idx, card in enumerate(soup.select(CARD_SELECTOR), 1):
+        title_elem = card.select_one("h2.uuu-wrap-title")
+        video_elem = card.select_one("a.btn-video[href]")
+        note_elem = card.select_one("a.btn-note[href]")
+        if not (title_elem and video_elem and note_elem):
+            skipped += 1
+            continue
+
+        video_link = urljoin(base_url, video_elem['href'])
+        note_link = urljoin(base_url, note_elem['href'])
+        content_id = parse_qs(urlparse(video_link).query).get('masterContentId', [''])[0]
+
+        content_div = card.select_one("div.content")
+        topic = extract_topic(content_div.decode_contents()) if content_div else "Unknown Topic"
+
+        cards.append({
+            'index': idx,
+            'title': _text(title_elem),
+            'video_link': video_link,
+            'note_link': note_link,
+            'content_id': content_id,
+            'topic': topic
+        })
+
+    return json.dumps({'cards': cards, 'skipped': skipped}, separators=(',', ':'), ensure_ascii=False)
+
+
+class CardParserPool:
+    """Process pool that parses raw card page HTML off the crawl thread"""
+    def __init__(self, max_workers=2, max_pending=4):
+        # Spawn instead of fork: the parent already runs the Pyrogram and download threads
+        self._executor = ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        # Bound the number of pages waiting for a worker so HTML doesn't pile up in memory
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def submit(self, html, base_url):
+        """Submit a page for parsing, blocking while the pending queue is full"""
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(parse_content_cards, html, base_url)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def parse(self, html, base_url):
+        """Parse a page and return (cards, skipped)"""
+        result = json.loads(self.submit(html, base_url).result())
+        return result['cards'], result['skipped']
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
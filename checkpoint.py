@@ -0,0 +1,97 @@
+import os
+import glob
+import json
+import time
+import threading
+
+
+def _write_json_atomic(path, data):
+    """Write JSON to a temp file and rename it over the target, so a crash never leaves half a file"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class CheckpointStore:
+    """Persists pending downloads and uploads so an interrupted run can resume"""
+    VERSION = 2
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def save(self, state):
+        state = dict(state, version=self.VERSION, saved_at=time.time())
+        with self._lock:
+            _write_json_atomic(self.path, state)
+
+    def load(self):
+        """Return the saved state, or None if there is no usable checkpoint"""
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if state.get('version') != self.VERSION:
+            return None
+        return state
+
+    def clear(self):
+        with self._lock:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+
+class UploadManifest:
+    """Record of files already posted to Telegram, keyed by path relative to the download dir.
+
+    The other manifests next to it (the combined manifest.json, the merged
+    manifest from earlier sharded runs and other shards' manifests) are read
+    too, but never written, so a change in sharding doesn't repost anything.
+    """
+    def __init__(self, path, download_dir):
+        self.path = path
+        self.download_dir = download_dir
+        self._lock = threading.Lock()
+        self._entries = self._load(path)
+        self._inherited = {}
+        for other in glob.glob(os.path.join(glob.escape(os.path.dirname(path) or "."), "manifest*.json")):
+            if os.path.abspath(other) != os.path.abspath(path):
+                self._inherited.update(self._load(other))
+
+    @staticmethod
+    def _load(path):
+        try:
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _key(self, file_path):
+        return os.path.relpath(file_path, self.download_dir).replace(os.sep, '/')
+
+    def __contains__(self, file_path):
+        key = self._key(file_path)
+        with self._lock:
+            return key in self._entries or key in self._inherited
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def has_under(self, directory):
+        """Whether any file in directory was posted"""
+        prefix = self._key(directory) + '/'
+        with self._lock:
+            return any(key.startswith(prefix) for key in list(self._entries) + list(self._inherited))
+
+    def add(self, file_path, **info):
+        with self._lock:
+            self._entries[self._key(file_path)] = dict(info, uploaded_at=int(time.time()))
+            _write_json_atomic(self.path, self._entries)
@@ -0,0 +1,214 @@
+import time
+import logging
+import threading
+
+
+class AdjustableLimiter:
+    """Counting semaphore whose limit can be changed while workers hold slots"""
+    def __init__(self, limit):
+        self._cond = threading.Condition()
+        self._limit = limit
+        self._active = 0
+        self._paused = False
+
+    @property
+    def limit(self):
+        return self._limit
+
+    @property
+    def paused(self):
+        return self._paused
+
+    @property
+    def active(self):
+        return self._active
+
+    def set_limit(self, limit):
+        with self._cond:
+            self._limit = max(1, int(limit))
+            self._cond.notify_all()
+
+    def pause(self):
+        """Hand out no slots until resume(); holders keep theirs"""
+        with self._cond:
+            self._paused = True
+
+    def resume(self):
+        with self._cond:
+            self._paused = False
+            self._cond.notify_all()
+
+    def acquire(self, timeout=None):
+        """Take a slot; returns False if none freed up within the timeout"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: not self._paused and self._active < self._limit, timeout):
+                return False
+            self._active += 1
+            return True
+
+    def release(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify()
+
+
+class MemoryBudget:
+    """Caps the bytes held in RAM by in-memory transfers"""
+    def __init__(self, limit):
+        self._cond = threading.Condition()
+        self.limit = limit
+        self.used = 0
+
+    def acquire(self, size, timeout=None):
+        """Reserve size bytes; returns False if they didn't fit within the timeout"""
+        with self._cond:
+            if size > self.limit:
+                return False
+            if not self._cond.wait_for(lambda: self.used + size <= self.limit, timeout):
+                return False
+            self.used += size
+            return True
+
+    def release(self, size):
+        with self._cond:
+            self.used -= size
+            self._cond.notify_all()
+
+
+class TransferStats:
+    """Cumulative counters for one transfer direction, sampled by the tuner"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.completed = 0
+        self.errors = 0
+        self.flood_waits = 0
+
+    def add(self, **counts):
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def snapshot(self):
+        with self._lock:
+            return {'bytes': self.bytes, 'completed': self.completed,
+                    'errors': self.errors, 'flood_waits': self.flood_waits}
+
+
+class AIMDController:
+    """Additive-increase/multiplicative-decrease tuning of one concurrency knob.
+
+    Each update either backs off multiplicatively (errors above the threshold or
+    any FloodWait), undoes the last probe if it made throughput worse, or probes
+    one step higher.
+    """
+    def __init__(self, name, apply, initial, minimum, maximum, step=1, backoff=0.5,
+                 error_threshold=0.1, tolerance=0.05):
+        self.name = name
+        self.apply = apply
+        self.value = max(minimum, min(maximum, initial))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.step = step
+        self.backoff = backoff
+        self.error_threshold = error_threshold
+        self.tolerance = tolerance
+        self._last_throughput = None
+        self._probed = False
+
+    def update(self, throughput, completed, errors, flood_waits):
+        """Pick the next value from one window of measurements; returns it"""
+        attempts = completed + errors
+        if flood_waits or (attempts and errors / attempts > self.error_threshold):
+            new_value = int(self.value * self.backoff)
+            self._probed = False
+        elif (self._probed and self._last_throughput is not None
+              and throughput < self._last_throughput * (1 - self.tolerance)):
+            new_value = self.value - self.step
+            self._probed = False
+        else:
+            new_value = self.value + self.step
+            self._probed = True
+
+        new_value = max(self.minimum, min(self.maximum, new_value))
+        if new_value == self.value:
+            self._probed = False
+        self._last_throughput = throughput
+        if new_value != self.value:
+            self.value = new_value
+            self.apply(new_value)
+        return self.value
+
+
+class ConcurrencyTuner:
+    """Runs AIMD controllers against measured throughput on a background thread.
+
+    Controllers are updated round-robin, one per interval, so only one knob
+    moves at a time. A controller's window spans one full round, though, so
+    it also includes the changes the other controllers made in that round.
+    """
+    def __init__(self, interval=20, logger=None):
+        self.interval = interval
+        self.logger = logger or logging.getLogger(__name__)
+        self._controllers = []
+        self._stop = threading.Event()
+
+    def add(self, controller, stats, sample_bytes=None):
+        """Tune a controller from a TransferStats; sample_bytes may add in-flight partial bytes"""
+        self._controllers.append({
+            'controller': controller,
+            'stats': stats,
+            'sample_bytes': sample_bytes,
+            'last': None,
+            'last_time': None
+        })
+
+    def _measure(self, entry):
+        counts = entry['stats'].snapshot()
+        if entry['sample_bytes']:
+            counts['bytes'] = entry['sample_bytes']()
+        return counts, time.monotonic()
+
+    def pin(self, name, value):
+        """Fix a controller at a value set by hand; returns False if there is no such controller"""
+        for entry in self._controllers:
+            controller = entry['controller']
+            if controller.name == name:
+                controller.minimum = controller.maximum = controller.value = value
+                controller.apply(value)
+                return True
+        return False
+
+    def start(self):
+        for entry in self._controllers:
+            entry['last'], entry['last_time'] = self._measure(entry)
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        turn = 0
+        while not self._stop.wait(self.interval):
+            if not self._controllers:
+                continue
+            entry = self._controllers[turn % len(self._controllers)]
+            turn += 1
+
+            try:
+                counts, now = self._measure(entry)
+                delta = {name: counts[name] - entry['last'][name] for name in counts}
+                throughput = delta['bytes'] / max(now - entry['last_time'], 1e-6)
+                entry['last'], entry['last_time'] = counts, now
+
+                controller = entry['controller']
+                previous = controller.value
+                value = controller.update(throughput, delta['completed'], delta['errors'], delta['flood_waits'])
+                if value != previous:
+                    self.logger.info(
+                        f"Concurrency: {controller.name} {previous} -> {value} "
+                        f"({throughput / 1024 / 1024:.1f} MB/s, {delta['errors']} errors, "
+                        f"{delta['flood_waits']} flood waits)"
+                    )
+            except Exception as e:
+                self.logger.error(f"Concurrency tuner error: {str(e)}")
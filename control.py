@@ -0,0 +1,98 @@
+import logging
+from pyrogram import filters
+from pyrogram.handlers import MessageHandler
+
+HELP = (
+    "/pause - start no new downloads or uploads\n"
+    "/resume - start them again\n"
+    "/concurrency downloads=N uploads=M segments=K - change limits (any subset)\n"
+    "/skip <chapter index, Subject/Chapter or name> - drop a chapter from the rest of the run\n"
+    "/prioritize <subject> - download a subject's queued files first\n"
+    "/drain - crawl no new chapters and finish once queued work is done"
+)
+
+
+def parse_settings(args):
+    """'downloads=4 uploads=2' -> {'downloads': 4, 'uploads': 2}"""
+    settings = {}
+    for arg in args:
+        name, _, value = arg.partition('=')
+        settings[name.strip().lower()] = int(value)
+    return settings
+
+
+class ControlCommands:
+    """Admin-only bot commands that steer a running job.
+
+    Commands are accepted only from the Telegram user IDs in admin_ids and
+    act on the live download scheduler and upload queue: in-flight transfers
+    always run to completion, the changes apply to what is started next.
+    """
+    def __init__(self, job, admin_ids, logger=None):
+        self.job = job
+        self.admin_ids = admin_ids
+        self.logger = logger or logging.getLogger(__name__)
+
+    def handlers(self):
+        admins = filters.user(self.admin_ids)
+        commands = {
+            'pause': self.pause,
+            'resume': self.resume,
+            'concurrency': self.concurrency,
+            'skip': self.skip,
+            'prioritize': self.prioritize,
+            'drain': self.drain,
+            'help': self.help,
+        }
+        return [MessageHandler(self._wrap(name, command), filters.command(name) & admins)
+                for name, command in commands.items()]
+
+    def _wrap(self, name, command):
+        async def handler(client, message):
+            self.logger.info(f"Admin command from {message.from_user.id}: {message.text}")
+            try:
+                reply = command(message.command[1:])
+            except Exception as e:
+                self.logger.error(f"/{name} failed: {str(e)}")
+                reply = f"❌ /{name} failed: {str(e)}"
+            await message.reply_text(reply)
+        return handler
+
+    def pause(self, args):
+        self.job.pause()
+        return "⏸ Paused. Running transfers finish; nothing new starts until /resume."
+
+    def resume(self, args):
+        self.job.resume()
+        return "▶️ Resumed."
+
+    def concurrency(self, args):
+        if not args:
+            return "Usage: /concurrency downloads=N uploads=M segments=K"
+        requested = parse_settings(args)
+        applied = self.job.set_concurrency(**requested)
+        # Say so when a value was capped at the configured maximum
+        return "⚙️ " + ", ".join(
+            f"{name}={value}" + (f" (max, asked for {requested[name]})" if value < requested[name] else "")
+            for name, value in applied.items())
+
+    def skip(self, args):
+        if not args:
+            return "Usage: /skip <chapter index, Subject/Chapter or name>"
+        chapter = " ".join(args)
+        dropped = self.job.skip_chapter(chapter)
+        return f"⏭ Skipping {chapter}: {dropped} queued files dropped."
+
+    def prioritize(self, args):
+        if not args:
+            return "Usage: /prioritize <subject>"
+        subject = " ".join(args)
+        promoted = self.job.prioritize_subject(subject)
+        return f"⏫ {subject}: {promoted} queued downloads moved to the front (posting order is unchanged)."
+
+    def drain(self, args):
+        self.job.drain()
+        return "🚰 Draining: no new chapters; the run ends when queued work is done."
+
+    def help(self, args):
+        return HELP
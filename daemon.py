@@ -0,0 +1,119 @@
+import gc
+import time
+import random
+import logging
+
+
+class SyncDaemon:
+    """Keeps a job running and mirrors new cards to the channel as they appear.
+
+    The browser, HTTP session, Telegram client and worker pools stay up
+    between polls. Each content type page has its own schedule: a page that
+    gained cards is polled again next cycle, an unchanged one backs off,
+    doubling up to full_scan_interval. After the initial sync a cycle polls
+    at most max_pages pages, most recently changed first. The subject and
+    chapter lists are rescanned every full_scan_interval to pick up new
+    chapters. Between cycles the site session is checked and renewed, and
+    the browser is restarted every recycle_pages page loads to release the
+    memory a long-lived Chrome accumulates.
+    """
+    def __init__(self, job, interval=900, jitter=0.2, full_scan_interval=6 * 3600, max_pages=30,
+                 recycle_pages=300, logger=None):
+        self.job = job
+        self.interval = interval
+        self.jitter = jitter
+        self.full_scan_interval = max(full_scan_interval, interval)
+        self.max_pages = max_pages
+        self.recycle_pages = recycle_pages
+        self.logger = logger or logging.getLogger(__name__)
+        self.pages = {}  # content type page URL -> polling state
+        self._chapters = set()
+        self._last_scan = None
+        self._page_loads = 0
+
+    def _stopping(self):
+        return self.job.shutdown_requested or self.job.draining
+
+    def run(self):
+        initial = True
+        while not self._stopping():
+            try:
+                self.job.ensure_session()
+                if self._last_scan is None or time.monotonic() - self._last_scan >= self.full_scan_interval:
+                    self.scan()
+                found = self.poll(limit=None if initial else self.max_pages)
+                initial = False
+                self.job.end_poll()
+                if found:
+                    self.job.save_topic_structure()
+                self.maintain()
+            except Exception as e:
+                self.logger.error(f"Sync cycle failed: {str(e)}")
+
+            delay = self.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+            self.logger.info(f"Next poll in {delay / 60:.1f} min ({len(self.pages)} pages tracked)")
+            deadline = time.monotonic() + delay
+            while time.monotonic() < deadline and not self._stopping():
+                time.sleep(1)
+
+    def scan(self):
+        """Register the content type pages of chapters not seen before"""
+        for chapter in self.job.discover_chapters():
+            if self._stopping():
+                return
+            if chapter['url'] in self._chapters or self.job.chapter_skipped(chapter['subject_name'], chapter['name']):
+                continue
+            content_types, *ids = self.job.get_content_types(chapter['url'], chapter['name'])
+            if not content_types:
+                continue  # Tried again on the next scan
+            self._chapters.add(chapter['url'])
+            for content_type in content_types:
+                self.pages.setdefault(content_type['url'], {
+                    'chapter': chapter,
+                    'content_type': content_type['name'],
+                    'ids': ids,
+                    'seen': None,
+                    'interval': self.interval,
+                    'next_poll': 0,
+                    'changed_at': 0,
+                    'position': len(self.pages)
+                })
+        self._last_scan = time.monotonic()
+
+    def poll(self, limit=None):
+        """Load the pages that are due and queue their new cards; returns how many were found"""
+        now = time.monotonic()
+        due = [(url, page) for url, page in self.pages.items()
+               if page['next_poll'] <= now
+               and not self.job.chapter_skipped(page['chapter']['subject_name'], page['chapter']['name'])]
+        # Recently changed pages first, then later chapters, which are the ones still being added to
+        due.sort(key=lambda item: (-item[1]['changed_at'], -item[1]['position']))
+        found = 0
+        for url, page in due[:limit]:
+            if self._stopping():
+                break
+            cards = self.job.get_content_cards(url, page['content_type'])
+            self._page_loads += 1
+            new = [card for card in cards if page['seen'] is None or card['content_id'] not in page['seen']]
+
+            if new and page['seen'] is not None:
+                self.logger.info(f"{len(new)} new cards in {page['chapter']['name']} / {page['content_type']}")
+                page['interval'] = self.interval
+                page['changed_at'] = now
+            else:
+                page['interval'] = min(page['interval'] * 2, self.full_scan_interval)
+            # A page at the base interval is due again next cycle; backed-off pages skip cycles
+            page['next_poll'] = now + page['interval'] - self.interval
+            if cards:
+                page['seen'] = (page['seen'] or set()) | {card['content_id'] for card in cards}
+
+            self.job.process_cards(page['chapter'], page['content_type'], new, *page['ids'])
+            found += len(new)
+        return found
+
+    def maintain(self):
+        if self.recycle_pages and self._page_loads >= self.recycle_pages:
+            self.job.recycle_driver()
+            self._page_loads = 0
+        self.job.trim_caches()
+        gc.collect()
@@ -0,0 +1,108 @@
+import json
+import time
+import atexit
+import logging
+import threading
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# Set once from main() before the loggers are created
+settings = {
+    'json': True,
+    'max_bytes': 20 * 1024 * 1024,
+    'backups': 5,
+    'sample_rate': 2.0,
+    'sample_burst': 20
+}
+
+_listeners = []
+
+
+def configure(**options):
+    settings.update((key, value) for key, value in options.items() if value is not None)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, for grepping and jq"""
+    def format(self, record):
+        entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage()
+        }
+        for key in ('sample', 'suppressed'):
+            if hasattr(record, key):
+                entry[key] = getattr(record, key)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class SampleFilter(logging.Filter):
+    """Rate-limits records logged with extra={'sample': key}, per key.
+
+    Each key gets a token bucket of `burst` records refilled at `rate` per
+    second; records over the limit are dropped before they reach the queue,
+    and the next one let through notes how many were dropped. Other records
+    always pass. rate=0 turns sampling off.
+    """
+    def __init__(self, rate, burst):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        key = getattr(record, 'sample', None)
+        if key is None or not self.rate:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            tokens, last, suppressed = self._buckets.get(key, (self.burst, now, 0))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now, suppressed + 1)
+                return False
+            self._buckets[key] = (tokens - 1, now, 0)
+        if suppressed:
+            record.suppressed = suppressed
+            record.msg = f"{record.msg} (+{suppressed} similar messages suppressed)"
+        return True
+
+
+def queued_logger(name, log_file):
+    """Logger whose callers only enqueue records; a listener thread formats and writes them.
+
+    The console keeps the plain text format. The file rotates by size and is
+    JSON lines unless configured otherwise.
+    """
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.INFO)
+    if logger.handlers:
+        return logger
+    logger.propagate = False
+
+    text = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(text)
+    file_handler = RotatingFileHandler(log_file, maxBytes=settings['max_bytes'],
+                                       backupCount=settings['backups'], encoding='utf-8')
+    file_handler.setFormatter(JsonFormatter() if settings['json'] else text)
+
+    records = queue.SimpleQueue()
+    queue_handler = QueueHandler(records)
+    queue_handler.addFilter(SampleFilter(settings['sample_rate'], settings['sample_burst']))
+    logger.addHandler(queue_handler)
+
+    listener = QueueListener(records, console_handler, file_handler)
+    listener.start()
+    _listeners.append(listener)
+    return logger
+
+
+@atexit.register
+def stop_logging():
+    """Flush and stop the listener threads"""
+    while _listeners:
+        _listeners.pop().stop()
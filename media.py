@@ -0,0 +1,213 @@
+import os
+import glob
+import time
+import struct
+import logging
+import threading
+import subprocess
+
+
+def probe_duration(file_path):
+    """Duration of a media file in seconds, or 0 if ffprobe can't tell"""
+    try:
+        result = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of",
+             "default=noprint_wrappers=1:nokey=1", file_path],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True
+        )
+        return float(result.stdout.strip())
+    except (OSError, ValueError):
+        return 0
+
+
+def top_level_atoms(file_path):
+    """Names of the top-level boxes of an mp4 file, in file order"""
+    atoms = []
+    size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as f:
+        offset = 0
+        while offset + 8 <= size:
+            f.seek(offset)
+            atom_size, name = struct.unpack(">I4s", f.read(8))
+            if atom_size == 1:
+                atom_size = struct.unpack(">Q", f.read(8))[0]
+            elif atom_size == 0:
+                atom_size = size - offset  # Box runs to the end of the file
+            if atom_size < 8:
+                break
+            atoms.append(name.decode('latin-1'))
+            offset += atom_size
+    return atoms
+
+
+def needs_faststart(file_path):
+    """True if the moov atom comes after mdat, so players must fetch the whole file before playing"""
+    atoms = top_level_atoms(file_path)
+    return 'moov' in atoms and 'mdat' in atoms and atoms.index('moov') > atoms.index('mdat')
+
+
+class Transcoder:
+    """Optional x264 re-encode that trades CPU time for smaller uploads.
+
+    At most `jobs` encodes run at once, each with an equal share of the cores.
+    A file is only encoded when the upload time it is expected to save exceeds
+    the expected encode time: output size is estimated from expected_kbps, and
+    encode speed and upload rate are learned as the run goes on.
+    """
+    def __init__(self, crf=28, preset="veryfast", max_height=720, jobs=None, expected_kbps=1000,
+                 upload_rate=None, logger=None):
+        cores = os.cpu_count() or 1
+        self.crf = crf
+        self.preset = preset
+        self.max_height = max_height
+        self.jobs = jobs or max(1, cores // 4)
+        self.threads = max(1, cores // self.jobs)
+        self.expected_kbps = expected_kbps
+        self.upload_rate = upload_rate
+        self.logger = logger or logging.getLogger(__name__)
+        self.speed = 3.0  # Seconds of video encoded per second, refined after each encode
+        self._slots = threading.BoundedSemaphore(self.jobs)
+        self._lock = threading.Lock()
+        self.stats = {'files': 0, 'skipped': 0, 'saved': 0, 'seconds': 0.0}
+
+    def _assumed_upload_rate(self):
+        rate = self.upload_rate() if self.upload_rate else None
+        return rate or 2 * 1024 * 1024
+
+    def worth_it(self, size, duration):
+        """True if the expected upload time saved covers the expected encode time"""
+        if not duration:
+            return False
+        saved_bytes = size - self.expected_kbps * 1000 / 8 * duration
+        return saved_bytes / self._assumed_upload_rate() > duration / self.speed
+
+    def transcode(self, file_path):
+        """Re-encode in place if it pays off; returns the bytes saved"""
+        size = os.path.getsize(file_path)
+        duration = probe_duration(file_path)
+        if not self.worth_it(size, duration):
+            with self._lock:
+                self.stats['skipped'] += 1
+            self.logger.info(f"Not transcoding {file_path}: expected savings don't cover the encode time")
+            return 0
+
+        temp_path = f"{file_path}.transcode.mp4"
+        try:
+            with self._slots:
+                start = time.monotonic()
+                subprocess.run([
+                    "ffmpeg", "-y", "-loglevel", "error", "-i", file_path,
+                    "-map", "0:v:0", "-map", "0:a:0?",
+                    "-c:v", "libx264", "-preset", self.preset, "-crf", str(self.crf),
+                    "-vf", f"scale=-2:'min(ih,{self.max_height})'", "-threads", str(self.threads),
+                    "-c:a", "copy", "-movflags", "+faststart", temp_path
+                ], check=True)
+                elapsed = time.monotonic() - start
+
+            new_size = os.path.getsize(temp_path)
+            with self._lock:
+                self.speed = 0.5 * self.speed + 0.5 * duration / max(elapsed, 1e-3)
+                self.stats['seconds'] += elapsed
+                if new_size < size:
+                    self.stats['files'] += 1
+                    self.stats['saved'] += size - new_size
+            if new_size >= size:
+                self.logger.info(f"Transcoding didn't shrink {file_path}, keeping the original")
+                return 0
+
+            os.replace(temp_path, file_path)
+            self.logger.info(
+                f"Transcoded {file_path}: {size / 1024 / 1024:.1f} MB -> {new_size / 1024 / 1024:.1f} MB, "
+                f"saved {(size - new_size) / 1024 / 1024:.1f} MB in {elapsed:.0f}s"
+            )
+            return size - new_size
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def summary(self):
+        with self._lock:
+            return (f"{self.stats['files']} files, {self.stats['saved'] / 1024 / 1024:.0f} MB saved, "
+                    f"{self.stats['seconds']:.0f}s encoding, {self.stats['skipped']} skipped")
+
+
+class MediaProcessor:
+    """Pre-upload stage: moves moov to the front and splits videos over the upload limit.
+
+    Apart from the optional transcode, everything is an ffmpeg stream copy,
+    so it costs disk I/O rather than CPU.
+    Splits happen at keyframes via the segment muxer; the segment length is
+    estimated from the average bitrate and shortened if a part still comes
+    out over the limit.
+    """
+    def __init__(self, max_bytes=2000 * 1024 * 1024, transcoder=None, logger=None):
+        self.max_bytes = max_bytes
+        self.transcoder = transcoder
+        self.logger = logger or logging.getLogger(__name__)
+
+    def prepare(self, file_path):
+        """Make a video ready to upload; returns the list of files to post, in order"""
+        if self.transcoder:
+            try:
+                self.transcoder.transcode(file_path)
+            except Exception as e:
+                self.logger.error(f"Transcode failed, uploading the original: {str(e)}")
+        
+        size = os.path.getsize(file_path)
+        if size > self.max_bytes:
+            return self.split(file_path, size)
+
+        if needs_faststart(file_path):
+            self.faststart(file_path)
+        return [file_path]
+
+    def faststart(self, file_path):
+        """Rewrite the file with moov at the front"""
+        temp_path = f"{file_path}.faststart.mp4"
+        try:
+            self._ffmpeg(["-i", file_path, "-map", "0", "-c", "copy", "-movflags", "+faststart", temp_path])
+            os.replace(temp_path, file_path)
+            self.logger.info(f"Moved moov atom to the front: {file_path}")
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def split(self, file_path, size):
+        """Split at keyframes into parts under the size limit; the original is removed once all parts exist"""
+        duration = probe_duration(file_path)
+        if not duration:
+            raise ValueError(f"Can't split {file_path}: unknown duration")
+
+        stem, ext = os.path.splitext(file_path)
+        # Aim below the limit since parts can only end on a keyframe
+        segment_time = duration * self.max_bytes / size * 0.9
+        for _ in range(4):
+            parts = self._segment(file_path, stem, ext, segment_time)
+            largest = max(os.path.getsize(part) for part in parts)
+            if largest <= self.max_bytes:
+                break
+            for part in parts:
+                os.remove(part)
+            segment_time *= self.max_bytes / largest * 0.9
+        else:
+            raise ValueError(f"Can't split {file_path} under {self.max_bytes} bytes")
+
+        os.remove(file_path)
+        self.logger.info(f"Split {file_path} into {len(parts)} parts of up to {int(segment_time)}s")
+        return parts
+
+    def _segment(self, file_path, stem, ext, segment_time):
+        for stale in glob.glob(glob.escape(stem) + ".part*" + ext):
+            os.remove(stale)
+        self._ffmpeg([
+            "-i", file_path, "-map", "0", "-c", "copy",
+            "-f", "segment", "-segment_time", f"{segment_time:.3f}", "-reset_timestamps", "1",
+            "-segment_start_number", "1", "-segment_format_options", "movflags=+faststart",
+            f"{stem}.part%02d{ext}"
+        ])
+        return sorted(glob.glob(glob.escape(stem) + ".part*" + ext))
+
+    def _ffmpeg(self, args):
+        subprocess.run(["ffmpeg", "-y", "-loglevel", "error"] + args, check=True)
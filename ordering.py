@@ -0,0 +1,111 @@
+import time
+import asyncio
+import logging
+
+
+class ReorderBuffer:
+    """Commits entries strictly by sequence number, whatever order they become ready in.
+
+    Every sequence number handed out must eventually be marked ready or skipped.
+    If the next number holds up later ready entries for longer than
+    stall_timeout and holds(seq) says nothing is still working on it, it is
+    given up on so one lost item can't hold the channel forever; if it turns
+    up afterwards it is committed late.
+    All methods except the *_threadsafe ones must run on the event loop.
+    """
+    def __init__(self, commit, stall_timeout=900, holds=None, logger=None):
+        self._commit = commit
+        self.stall_timeout = stall_timeout
+        self.holds = holds
+        self.logger = logger or logging.getLogger(__name__)
+        self._loop = None
+        self._ready = {}
+        self._skipped = set()
+        self._next = 1
+        # When the missing next number started holding up a ready entry
+        self._blocked_since = None
+        self._changed = None
+        self._committing = None
+
+    def ready(self, seq, entry):
+        if seq < self._next:
+            self.logger.warning(f"Sequence {seq} arrived after it was given up on, committing it late")
+        self._ready[seq] = entry
+        self._changed.set()
+
+    def skip(self, seq):
+        if seq >= self._next:
+            self._skipped.add(seq)
+            self._changed.set()
+
+    def ready_threadsafe(self, seq, entry):
+        self._loop.call_soon_threadsafe(self.ready, seq, entry)
+
+    def skip_threadsafe(self, seq):
+        self._loop.call_soon_threadsafe(self.skip, seq)
+
+    def flush(self):
+        """Stop waiting for missing sequence numbers and commit everything that is ready"""
+        if self._ready:
+            self._skipped.update(seq for seq in range(self._next, max(self._ready)) if seq not in self._ready)
+        self._changed.set()
+
+    def pending(self):
+        """Entries that are ready but not yet committed, in commit order"""
+        ready = self._ready.copy()  # May be called from other threads
+        entries = [ready[seq] for seq in sorted(ready)]
+        if self._committing is not None:
+            entries.insert(0, self._committing)
+        return entries
+
+    def __len__(self):
+        return len(self._ready) + (self._committing is not None)
+
+    def start(self, loop):
+        """Start committing on the given event loop (call from that loop's thread)"""
+        self._loop = loop
+        self._changed = asyncio.Event()
+        return loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            # Late arrivals for numbers we already gave up on
+            for seq in [seq for seq in self._ready if seq < self._next]:
+                await self._commit_entry(self._ready.pop(seq))
+
+            while self._next in self._ready or self._next in self._skipped:
+                if self._next in self._skipped:
+                    self._skipped.discard(self._next)
+                else:
+                    await self._commit_entry(self._ready.pop(self._next))
+                self._next += 1
+                self._blocked_since = None
+
+            if not self._ready:
+                self._blocked_since = None
+            elif self._blocked_since is None:
+                self._blocked_since = time.monotonic()
+            elif time.monotonic() - self._blocked_since > self.stall_timeout:
+                if self.holds and self.holds(self._next):
+                    # Still queued or in flight; it gets a full timeout once it is let go of
+                    self._blocked_since = time.monotonic()
+                else:
+                    self.logger.warning(f"Sequence {self._next} missing for {self.stall_timeout}s, posting past it")
+                    self._next += 1
+                    self._blocked_since = None
+                    continue
+
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=min(5, self.stall_timeout))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _commit_entry(self, entry):
+        self._committing = entry
+        try:
+            await self._commit(entry)
+        except Exception as e:
+            self.logger.error(f"Failed to commit entry: {str(e)}")
+        finally:
+            self._committing = None
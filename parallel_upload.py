@@ -0,0 +1,107 @@
+import os
+import math
+import asyncio
+import inspect
+import logging
+from pyrogram import raw
+from pyrogram.errors import FloodWait
+from pyrogram.session import Session
+
+PART_SIZE = 512 * 1024  # Largest part Telegram accepts
+BIG_FILE = 10 * 1024 * 1024  # Files above this are uploaded with SaveBigFilePart
+WORKERS_PER_CONNECTION = 2
+
+
+class ParallelUploader:
+    """Uploads the parts of one big file over several media DC connections at once.
+
+    Client.save_file sends all parts of a file through a single media
+    session, so a multi-GB lecture is bound by one connection's round trips.
+    Here a pool of media sessions is opened once and shared by all uploads;
+    each file's parts are handed out to workers spread over the pool, sent
+    with upload.SaveBigFilePart in whatever order they finish, and the
+    returned InputFileBig is posted by reference once every part is
+    acknowledged.
+    """
+    def __init__(self, client, connections=4, logger=None):
+        self.client = client
+        self.connections = connections
+        self.logger = logger or logging.getLogger(__name__)
+        self._sessions = []
+        self._lock = asyncio.Lock()
+
+    async def _get_sessions(self):
+        async with self._lock:
+            if not self._sessions:
+                dc_id = await self.client.storage.dc_id()
+                auth_key = await self.client.storage.auth_key()
+                test_mode = await self.client.storage.test_mode()
+                for _ in range(self.connections):
+                    session = Session(self.client, dc_id, auth_key, test_mode, is_media=True)
+                    await session.start()
+                    self._sessions.append(session)
+                self.logger.info(f"Opened {self.connections} media connections for parallel uploads")
+            return self._sessions
+
+    async def save_file(self, path, progress=None):
+        """Upload a file's parts in parallel; returns the InputFileBig to send"""
+        size = os.path.getsize(path)
+        total_parts = math.ceil(size / PART_SIZE)
+        file_id = int.from_bytes(os.urandom(8), 'big', signed=True)
+        sessions = await self._get_sessions()
+        loop = asyncio.get_running_loop()
+        parts = asyncio.Queue()
+        for part in range(total_parts):
+            parts.put_nowait(part)
+        sent = 0
+
+        def read_part(f, part):
+            f.seek(part * PART_SIZE)
+            return f.read(PART_SIZE)
+
+        async def worker(session):
+            nonlocal sent
+            with open(path, 'rb') as f:
+                while not parts.empty():
+                    part = parts.get_nowait()
+                    chunk = await loop.run_in_executor(None, read_part, f, part)
+                    await self._save_part(session, file_id, part, total_parts, chunk)
+                    sent += len(chunk)
+                    if progress:
+                        result = progress(sent, size)
+                        if inspect.isawaitable(result):
+                            await result
+
+        workers = [asyncio.ensure_future(worker(sessions[i % len(sessions)]))
+                   for i in range(len(sessions) * WORKERS_PER_CONNECTION)]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            # One failed part fails the file; stop the other workers with it
+            for task in workers:
+                task.cancel()
+        return raw.types.InputFileBig(id=file_id, parts=total_parts, name=os.path.basename(path))
+
+    async def _save_part(self, session, file_id, part, total_parts, chunk, attempts=3):
+        for attempt in range(attempts):
+            try:
+                if await session.invoke(raw.functions.upload.SaveBigFilePart(
+                        file_id=file_id, file_part=part, file_total_parts=total_parts, bytes=chunk)):
+                    return
+                raise IOError(f"part {part} not acknowledged")
+            except FloodWait as e:
+                await asyncio.sleep(e.value)
+            except Exception as e:
+                if attempt == attempts - 1:
+                    raise
+                self.logger.warning(f"Retrying part {part}/{total_parts}: {str(e)}")
+                await asyncio.sleep(1 + attempt)
+        raise IOError(f"part {part} failed after {attempts} attempts")
+
+    async def close(self):
+        sessions, self._sessions = self._sessions, []
+        for session in sessions:
+            try:
+                await session.stop()
+            except Exception:
+                pass
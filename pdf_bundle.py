@@ -0,0 +1,229 @@
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pypdf import PdfReader, PdfWriter
+
+# PdfWriter holds every appended page until write(), so volumes are also capped by what fits in memory
+VOLUME_MEMORY = 256 * 1024 * 1024
+VOLUME_PAGES = 2000
+
+
+def _page_count(file_path):
+    try:
+        return len(PdfReader(file_path).pages)
+    except Exception:
+        return 0  # Left out (and logged) when the volume is written
+
+
+def merge_pdfs(entries, output_path, max_bytes=None, logger=None, memory_bytes=VOLUME_MEMORY,
+               max_pages=VOLUME_PAGES):
+    """Merge PDFs into bookmarked volumes, one outline entry per topic with the card titles under it.
+
+    entries are dicts with 'file_path', 'title' and 'topic', in posting order.
+    A writer keeps the pages of its volume in memory until it is written, so
+    a new volume is started whenever the inputs would pass max_bytes (the
+    upload limit), memory_bytes or max_pages, and each volume is written to
+    disk and released before the next one is built. Returns the paths of the
+    written volumes; a volume none of whose PDFs could be read is left out.
+    """
+    logger = logger or logging.getLogger(__name__)
+    stem, ext = os.path.splitext(output_path)
+    byte_limit = min(max_bytes, memory_bytes) if max_bytes else memory_bytes
+    volumes = []
+    current = []
+    current_bytes = current_pages = 0
+    for entry in entries:
+        size = os.path.getsize(entry['file_path'])
+        pages = _page_count(entry['file_path'])
+        if current and (current_bytes + size > byte_limit or current_pages + pages > max_pages):
+            volumes.append(current)
+            current, current_bytes, current_pages = [], 0, 0
+        current.append(entry)
+        current_bytes += size
+        current_pages += pages
+    if current:
+        volumes.append(current)
+
+    paths = []
+    for number, volume in enumerate(volumes, 1):
+        path = output_path if len(volumes) == 1 else f"{stem}.part{number:02d}{ext}"
+        writer = PdfWriter()
+        topic_item = None
+        topic = None
+        appended = 0
+        for entry in volume:
+            try:
+                page = len(writer.pages)
+                writer.append(PdfReader(entry['file_path']), import_outline=False)
+            except Exception as e:
+                logger.error(f"Leaving {entry['file_path']} out of the bundle: {str(e)}")
+                continue
+            appended += 1
+            if entry['topic'] != topic or topic_item is None:
+                topic = entry['topic']
+                topic_item = writer.add_outline_item(topic, page)
+            writer.add_outline_item(entry['title'], page, parent=topic_item)
+        if not appended:
+            writer.close()
+            logger.error(f"No PDF of {path} could be read, not writing it")
+            continue
+
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'wb') as f:
+            writer.write(f)
+        writer.close()
+        os.replace(temp_path, path)
+        paths.append(path)
+    return paths
+
+
+class PdfBundler:
+    """Collects the PDFs of each chapter/content type/language and merges them once all have arrived.
+
+    A group is keyed by its directory and language suffix. It takes a
+    sequence number from reserve_order() when it is closed (the crawl has
+    moved past its directory), so the bundle is posted after everything
+    queued for that directory and doesn't hold up those posts while its PDFs
+    download. A group is merged once it is closed and none of its downloads
+    are outstanding; on_ready(group, paths) gets the volumes, or
+    on_empty(group) is called if nothing usable arrived. If merging fails,
+    on_failed(group) gets the group so its PDFs can be posted on their own.
+    """
+    def __init__(self, on_ready, on_empty, reserve_order, on_failed=None, max_bytes=None, logger=None):
+        self.on_ready = on_ready
+        self.on_empty = on_empty
+        self.on_failed = on_failed or on_empty
+        self.reserve_order = reserve_order
+        self.max_bytes = max_bytes
+        self.logger = logger or logging.getLogger(__name__)
+        self._groups = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=1)
+        self._merging = {}  # key -> sequence number of groups being merged
+
+    @staticmethod
+    def group_key(file_path):
+        directory, name = os.path.split(file_path)
+        language = os.path.splitext(name)[0].rsplit('_', 1)[-1]
+        return f"{directory}|{language}"
+
+    @staticmethod
+    def bundle_path(key):
+        directory, language = key.rsplit('|', 1)
+        chapter, content_type = os.path.split(directory)
+        return os.path.join(directory, f"{os.path.basename(chapter)} - {content_type}_{language}.pdf")
+
+    def expect(self, file_path):
+        """Register a queued PDF"""
+        key = self.group_key(file_path)
+        with self._lock:
+            group = self._groups.get(key)
+            if group is None:
+                group = self._groups[key] = {'key': key, 'order': None, 'closed': False,
+                                             'pending': [], 'files': []}
+            if file_path not in group['pending']:
+                group['pending'].append(file_path)
+
+    def done(self, file_path, title, topic):
+        """A PDF finished downloading"""
+        self._update(file_path, {'file_path': file_path, 'title': title, 'topic': topic})
+
+    def failed(self, file_path):
+        """A PDF won't arrive; the bundle goes out without it"""
+        self._update(file_path, None)
+
+    def _update(self, file_path, entry):
+        key = self.group_key(file_path)
+        with self._lock:
+            group = self._groups.get(key)
+            if group is None or file_path not in group['pending']:
+                return
+            # Keep catalog order regardless of which download finished first
+            position = group['pending'].index(file_path)
+            group['pending'][position] = entry
+        self._check(key)
+
+    def close_except(self, directory):
+        """Close every group outside the directory the crawl is now in"""
+        with self._lock:
+            keys = [key for key, group in self._groups.items()
+                    if not group['closed'] and key.rsplit('|', 1)[0] != directory]
+        for key in keys:
+            self._close(key)
+
+    def close_all(self):
+        with self._lock:
+            keys = list(self._groups)
+        for key in keys:
+            self._close(key)
+
+    def _close(self, key):
+        with self._lock:
+            group = self._groups.get(key)
+            if group and not group['closed']:
+                group['closed'] = True
+                group['order'] = self.reserve_order()
+        self._check(key)
+
+    def _check(self, key):
+        with self._lock:
+            group = self._groups.get(key)
+            if not group or not group['closed'] or any(isinstance(item, str) for item in group['pending']):
+                return
+            del self._groups[key]
+            group['files'] += [item for item in group['pending'] if item]
+            group['pending'] = []
+            if group['files']:
+                self._merging[key] = group['order']
+        if not group['files']:
+            self.on_empty(group)
+            return
+        self._pool.submit(self._merge, group)
+
+    def _merge(self, group):
+        try:
+            path = self.bundle_path(group['key'])
+            try:
+                paths = merge_pdfs(group['files'], path, self.max_bytes, logger=self.logger)
+            except Exception as e:
+                self.logger.error(f"Failed to bundle {group['key']}, posting its PDFs separately: {str(e)}")
+                self.on_failed(group)
+                return
+            if not paths:
+                self.on_empty(group)
+                return
+            self.logger.info(f"Bundled {len(group['files'])} PDFs into {len(paths)} file(s): {path}")
+            self.on_ready(group, paths)
+        finally:
+            with self._lock:
+                self._merging.pop(group['key'], None)
+
+    def busy(self):
+        """True while any group is still collecting or merging"""
+        with self._lock:
+            return bool(self._groups or self._merging)
+
+    def orders(self):
+        """Sequence numbers reserved by closed groups that haven't been posted yet"""
+        with self._lock:
+            orders = {group['order'] for group in self._groups.values() if group['order'] is not None}
+            return orders | set(self._merging.values())
+
+    def snapshot(self):
+        """Open groups for the checkpoint"""
+        with self._lock:
+            return [dict(group, pending=list(group['pending']), files=list(group['files']))
+                    for group in self._groups.values()]
+
+    def restore(self, groups):
+        """Reopen checkpointed groups; they get new sequence numbers when they close again"""
+        with self._lock:
+            for group in groups:
+                # Downloads that were outstanding are requeued and registered again
+                files = [item for item in group['files'] + group['pending']
+                         if isinstance(item, dict) and os.path.exists(item['file_path'])]
+                self._groups[group['key']] = dict(group, order=None, closed=False, pending=[], files=files)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
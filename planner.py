@@ -0,0 +1,158 @@
+import os
+import json
+import time
+import shutil
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from checkpoint import _write_json_atomic
+
+
+def format_size(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.2f} TB"
+
+
+def format_duration(seconds):
+    hours, rest = divmod(int(seconds), 3600)
+    return f"{hours}h{rest // 60:02d}m"
+
+
+class ThroughputHistory:
+    """Download/upload rates measured by previous runs, used for plan ETAs"""
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def record(self, download_rate=None, upload_rate=None):
+        rates = self.load()
+        if download_rate:
+            rates['download'] = download_rate
+        if upload_rate:
+            rates['upload'] = upload_rate
+        rates['measured_at'] = int(time.time())
+        _write_json_atomic(self.path, rates)
+
+
+def load_planned_sizes(path, download_dir):
+    """File sizes from a saved plan, keyed by file path as the downloader builds it"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            files = json.load(f)['files']
+    except (OSError, ValueError, KeyError):
+        return {}
+    return {os.path.join(download_dir, *key.split('/')): info['size'] for key, info in files.items() if info.get('size')}
+
+
+class Planner:
+    """Dry run: resolves every queued file and sizes it with concurrent HEAD requests.
+
+    Nothing is downloaded. Servers that omit Content-Length on HEAD are asked
+    for a single byte with a Range GET and the total is read from
+    Content-Range. HLS/DASH manifests can't be sized this way and are
+    reported as unknown.
+    """
+    def __init__(self, session, resolve, download_dir, workers=32, logger=None):
+        self.session = session
+        self.resolve = resolve
+        self.download_dir = download_dir
+        self.workers = workers
+        self.logger = logger or logging.getLogger(__name__)
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def probe(self, url):
+        try:
+            response = self.session.head(url, allow_redirects=True, timeout=15)
+            if response.ok and response.headers.get('Content-Length'):
+                return int(response.headers['Content-Length'])
+            response = self.session.get(url, headers={'Range': 'bytes=0-0'}, stream=True, timeout=15)
+            with response:
+                content_range = response.headers.get('Content-Range', '')
+                if response.status_code == 206 and '/' in content_range and not content_range.endswith('*'):
+                    return int(content_range.rsplit('/', 1)[1])
+        except Exception as e:
+            self.logger.warning(f"Sizing failed for {url[:80]}: {str(e)}")
+        return None
+
+    def _size_item(self, item):
+        try:
+            url = item.get('url') or self.resolve(item['page_url'], item['file_type'])
+        except Exception as e:
+            self.logger.warning(f"Couldn't resolve {os.path.basename(item['file_path'])}: {str(e)}")
+            url = None
+        is_manifest = bool(url) and url.split('?', 1)[0].endswith(('.m3u8', '.mpd'))
+        item['size'] = self.probe(url) if url and not is_manifest else None
+        return item
+
+    def size_all(self, items):
+        self.logger.info(f"Sizing {len(items)} files with {self.workers} concurrent requests...")
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(self._size_item, items))
+
+    def report(self, items, rates, plan_path):
+        """Log a per-subject/chapter size table with an ETA, and save the sizes for scheduling"""
+        rows = {}
+        for item in items:
+            subject, chapter = os.path.relpath(item['file_path'], self.download_dir).split(os.sep)[:2]
+            row = rows.setdefault((subject, chapter), {'video': [0, 0], 'pdf': [0, 0], 'unknown': 0})
+            row[item['file_type']][0] += 1
+            row[item['file_type']][1] += item['size'] or 0
+            row['unknown'] += item['size'] is None
+
+        lines = [f"{'Subject / Chapter':<50} {'Videos':>16} {'PDFs':>16} {'Total':>10}"]
+        totals = {'video': [0, 0], 'pdf': [0, 0], 'unknown': 0}
+        for (subject, chapter), row in rows.items():
+            name = f"{subject} / {chapter}"[:50]
+            lines.append(f"{name:<50} {row['video'][0]:>4} {format_size(row['video'][1]):>11} "
+                         f"{row['pdf'][0]:>4} {format_size(row['pdf'][1]):>11} "
+                         f"{format_size(row['video'][1] + row['pdf'][1]):>10}")
+            for kind in ('video', 'pdf'):
+                totals[kind][0] += row[kind][0]
+                totals[kind][1] += row[kind][1]
+            totals['unknown'] += row['unknown']
+        total_bytes = totals['video'][1] + totals['pdf'][1]
+        lines.append(f"{'Total':<50} {totals['video'][0]:>4} {format_size(totals['video'][1]):>11} "
+                     f"{totals['pdf'][0]:>4} {format_size(totals['pdf'][1]):>11} {format_size(total_bytes):>10}")
+        if totals['unknown']:
+            lines.append(f"Unknown size: {totals['unknown']} files")
+
+        # Downloads and uploads overlap, so the slower side bounds the run
+        etas = []
+        for direction in ('download', 'upload'):
+            if rates.get(direction):
+                seconds = total_bytes / rates[direction]
+                etas.append(seconds)
+                lines.append(f"ETA {direction}: {format_duration(seconds)} at {format_size(rates[direction])}/s")
+        if etas:
+            lines.append(f"ETA: ~{format_duration(max(etas))} (from the rates measured by the last run)")
+        else:
+            lines.append("ETA: unknown until a full run has measured throughput")
+        free = shutil.disk_usage(self.download_dir).free
+        lines.append(f"Disk: {format_size(free)} free for {format_size(total_bytes)} of downloads")
+
+        for line in lines:
+            self.logger.info(line)
+
+        _write_json_atomic(plan_path, {
+            'generated_at': int(time.time()),
+            'total_bytes': total_bytes,
+            'files': {
+                os.path.relpath(item['file_path'], self.download_dir).replace(os.sep, '/'): {
+                    'size': item['size'],
+                    'file_type': item['file_type']
+                }
+                for item in items
+            }
+        })
+        self.logger.info(f"Plan saved to {plan_path}")
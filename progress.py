@@ -0,0 +1,144 @@
+import sys
+import time
+import threading
+
+DIRECTIONS = ('download', 'upload')
+
+
+def _size(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.2f} TB"
+
+
+class Transfer:
+    """One running transfer. Its owner writes `done` directly (a plain attribute store, no lock),
+    or the renderer calls `sample` to measure it."""
+    __slots__ = ('name', 'total', 'done', 'sample')
+
+    def __init__(self, name, total=0, sample=None):
+        self.name = name
+        self.total = total
+        self.done = 0
+        self.sample = sample
+
+    def transferred(self):
+        if self.sample:
+            try:
+                return self.sample()
+            except Exception:
+                return self.done
+        return self.done
+
+
+class TransferProgress:
+    """Aggregate progress of every download and upload, rendered as one throttled summary line.
+
+    Transfers are only registered and finished under the lock; per-chunk
+    progress is a bare attribute write. A background thread reads the
+    counters and redraws at most every `interval` seconds: in place on a TTY,
+    as plain log lines otherwise (CI).
+    """
+    def __init__(self, interval=None, stream=None):
+        self.stream = stream or sys.stderr
+        self.tty = hasattr(self.stream, 'isatty') and self.stream.isatty()
+        self.interval = interval or (0.5 if self.tty else 30)
+        self._lock = threading.Lock()
+        self._active = {direction: {} for direction in DIRECTIONS}
+        self._files = {direction: 0 for direction in DIRECTIONS}
+        self._bytes = {direction: 0 for direction in DIRECTIONS}
+        self._rates = {direction: 0.0 for direction in DIRECTIONS}
+        self._busy_rates = {direction: None for direction in DIRECTIONS}
+        self._last = None
+        self._stop = threading.Event()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def start(self, direction, key, total=0, sample=None):
+        transfer = Transfer(key, total, sample)
+        with self._lock:
+            self._active[direction][key] = transfer
+        return transfer
+
+    def finish(self, direction, key, success=True):
+        with self._lock:
+            transfer = self._active[direction].pop(key, None)
+            if transfer is not None:
+                self._bytes[direction] += transfer.transferred()
+                self._files[direction] += success
+
+    def transferred(self, direction):
+        """Bytes moved so far in one direction, including running transfers"""
+        with self._lock:
+            active = list(self._active[direction].values())
+            finished = self._bytes[direction]
+        return finished + sum(transfer.transferred() for transfer in active)
+
+    def rate(self, direction):
+        """Smoothed rate over the time transfers in that direction were running, or None before any"""
+        return self._busy_rates[direction]
+
+    def _direction_stats(self, direction):
+        with self._lock:
+            active = list(self._active[direction].values())
+        done = sum(transfer.transferred() for transfer in active)
+        total = sum(transfer.total for transfer in active)
+        return len(active), done, total
+
+    def line(self):
+        parts = []
+        for direction, arrow in zip(DIRECTIONS, ('↓', '↑')):
+            count, done, total = self._direction_stats(direction)
+            sizes = f"{_size(done)}/{_size(total)}" if total else _size(done)
+            parts.append(f"{arrow} {count} active {sizes} {_size(self._rates[direction])}/s "
+                         f"({self._files[direction]} done)")
+        return " | ".join(parts)
+
+    def summary(self):
+        """Multi-line form for /status"""
+        lines = []
+        for direction in DIRECTIONS:
+            count, done, total = self._direction_stats(direction)
+            lines.append(f"{direction.capitalize()}s: {count} active, {_size(done)}"
+                         f"{'/' + _size(total) if total else ''} in flight, "
+                         f"{_size(self._rates[direction])}/s, {self._files[direction]} finished")
+        return "\n".join(lines)
+
+    def _run(self):
+        while not self._stop.wait(min(self.interval, 1)):
+            now = time.monotonic()
+            with self._lock:
+                busy = {direction: bool(self._active[direction]) for direction in DIRECTIONS}
+            totals = {direction: self.transferred(direction) for direction in DIRECTIONS}
+            if self._last:
+                elapsed = max(now - self._last[0], 1e-6)
+                for direction in DIRECTIONS:
+                    rate = max(totals[direction] - self._last[1][direction], 0) / elapsed
+                    self._rates[direction] = 0.7 * self._rates[direction] + 0.3 * rate
+                    # Idle time (crawling, waiting for downloads) doesn't drag this one down
+                    if busy[direction] and rate:
+                        previous = self._busy_rates[direction]
+                        self._busy_rates[direction] = rate if previous is None else 0.9 * previous + 0.1 * rate
+            if self._last and now - self._last[2] < self.interval:
+                self._last = (now, totals, self._last[2])
+                continue
+            self._last = (now, totals, now)
+
+            with self._lock:
+                idle = not any(self._active.values())
+            if idle:
+                continue
+            try:
+                if self.tty:
+                    self.stream.write(f"\r\033[K{self.line()}")
+                else:
+                    self.stream.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')} - PROGRESS - {self.line()}\n")
+                self.stream.flush()
+            except Exception:
+                pass
+
+    def stop(self):
+        self._stop.set()
+        if self.tty:
+            self.stream.write("\n")
@@ -0,0 +1,136 @@
+import time
+import heapq
+import queue
+import itertools
+
+MB = 1024 * 1024
+
+
+class FifoPolicy:
+    """First come, first served: retries and requeued tasks go to the back"""
+    default_aging = 0.0
+    needs_size = False
+    ties_by_order = False
+
+    def priority(self, task):
+        return 0
+
+
+class ShortestJobFirstPolicy:
+    """Smallest Content-Length first; priority is the size in MB"""
+    default_aging = 1.0  # A task gains 1 MB worth of priority per second it waits
+    needs_size = True
+    ties_by_order = True
+    assumed_sizes = {'video': 500 * MB, 'pdf': 5 * MB}
+
+    def priority(self, task):
+        size = task.get('size') or self.assumed_sizes.get(task.get('file_type'), 100 * MB)
+        return size / MB
+
+
+class ChapterOrderPolicy:
+    """Strict catalog (chapter/topic) order"""
+    default_aging = 0.0
+    needs_size = False
+    ties_by_order = True
+
+    def priority(self, task):
+        return task.get('order', 0)
+
+
+class PdfFirstPolicy:
+    """PDFs before videos, each in catalog order"""
+    default_aging = 1.0  # A waiting video overtakes new PDFs after 10 minutes
+    needs_size = False
+    ties_by_order = True
+    video_penalty = 600
+
+    def priority(self, task):
+        return 0 if task.get('file_type') == 'pdf' else self.video_penalty
+
+
+POLICIES = {
+    'fifo': FifoPolicy,
+    'sjf': ShortestJobFirstPolicy,
+    'chapter': ChapterOrderPolicy,
+    'pdf_first': PdfFirstPolicy,
+}
+
+
+def get_policy(name):
+    try:
+        return POLICIES[name]()
+    except KeyError:
+        raise ValueError(f"Unknown queue policy '{name}', expected one of: {', '.join(POLICIES)}")
+
+
+class PriorityTaskQueue(queue.Queue):
+    """Thread-safe heap of task dicts ordered by a pluggable policy, with aging.
+
+    A task's effective priority is ``policy.priority(task) - aging * waited``.
+    Since every queued task ages at the same rate, that ordering equals sorting
+    by ``priority + aging * enqueue_time``, which is fixed at insertion, so the
+    heap never has to be rebuilt. Lower values are served first; ties fall back
+    to catalog order (unless the policy is FIFO), then insertion order.
+    """
+    PROMOTED = -1e12  # Key offset that puts promoted tasks ahead of everything else
+
+    def __init__(self, policy='fifo', aging=None, maxsize=0):
+        self.policy = get_policy(policy) if isinstance(policy, str) else policy
+        self.aging = self.policy.default_aging if aging is None else aging
+        self._epoch = time.monotonic()
+        self._counter = itertools.count()
+        self._promoted = []
+        super().__init__(maxsize)
+
+    # queue.Queue storage hooks, called with self.mutex held
+    def _init(self, maxsize):
+        self.queue = []
+
+    def _qsize(self):
+        return len(self.queue)
+
+    def _put(self, task):
+        key = self.policy.priority(task) + self.aging * (time.monotonic() - self._epoch)
+        if any(matches(task) for matches in self._promoted):
+            key += self.PROMOTED
+        order = task.get('order', 0) if self.policy.ties_by_order else 0
+        heapq.heappush(self.queue, (key, order, next(self._counter), task))
+
+    def _get(self):
+        return heapq.heappop(self.queue)[-1]
+
+    def snapshot(self):
+        """Queued tasks in the order they would be served"""
+        with self.mutex:
+            return [entry[-1] for entry in sorted(self.queue)]
+
+    def remove(self, predicate):
+        """Take matching tasks out of the queue and return them; they count as done for join()"""
+        with self.mutex:
+            removed = [entry[-1] for entry in self.queue if predicate(entry[-1])]
+            if not removed:
+                return []
+            self.queue = [entry for entry in self.queue if not predicate(entry[-1])]
+            heapq.heapify(self.queue)
+            self.unfinished_tasks -= len(removed)
+            if not self.unfinished_tasks:
+                self.all_tasks_done.notify_all()
+            self.not_full.notify_all()
+        return removed
+
+    def promote(self, predicate):
+        """Serve matching tasks, queued now or later, before all others (keeping their relative order)"""
+        with self.mutex:
+            self._promoted.append(predicate)
+            promoted = 0
+            for i, (key, order, count, task) in enumerate(self.queue):
+                if key > self.PROMOTED / 2 and predicate(task):
+                    self.queue[i] = (key + self.PROMOTED, order, count, task)
+                    promoted += 1
+            heapq.heapify(self.queue)
+        return promoted
+
+    def __contains__(self, file_path):
+        with self.mutex:
+            return any(entry[-1].get('file_path') == file_path for entry in self.queue)
@@ -0,0 +1,111 @@
+import re
+
+LANGUAGES = {'Bn': "Bangla", 'En': "English"}
+KINDS = {'Marathon': '2', 'Archive': '9'}  # content type name -> masterContentTypeId
+
+
+def natural_key(text):
+    """Sort key that orders embedded numbers by value: "Phy.2" before "Phy.10" """
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r'(\d+)', str(text))]
+
+
+def parse_chapter_spec(spec):
+    """'1-5,8,Vector' -> ([(1, 5), (8, 8)], ['vector']): chapter number ranges and name fragments"""
+    ranges, names = [], []
+    for item in (part.strip() for part in spec.split(",")):
+        if not item:
+            continue
+        match = re.fullmatch(r'(\d+)\s*-\s*(\d+)|(\d+)', item)
+        if match and match.group(3):
+            ranges.append((int(match.group(3)), int(match.group(3))))
+        elif match:
+            ranges.append((int(match.group(1)), int(match.group(2))))
+        else:
+            names.append(item.lower())
+    return ranges, names
+
+
+class Selection:
+    """What a run covers, checked at each crawl level before the page below it is loaded.
+
+    Subjects are matched by name (case-insensitive). Chapters by their
+    number within the subject, as ranges, or by a fragment of the name;
+    a from/to window narrows that further. Then content kinds (Marathon/Archive), card title and topic patterns,
+    languages and file types. An unset filter selects everything.
+    """
+    def __init__(self, subjects=None, chapters="", from_chapter=None, to_chapter=None, kinds=None,
+                 languages=None, content_types=None, title_pattern=None, topic_pattern=None):
+        self.subjects = {subject.strip().lower() for subject in subjects} if subjects else None
+        self.chapter_ranges, self.chapter_names = parse_chapter_spec(chapters or "")
+        self.chapter_window = None
+        self._narrow_window(from_chapter, to_chapter)
+        self.kinds = list(KINDS) if kinds is None else list(kinds)
+        self.languages = list(LANGUAGES) if languages is None else list(languages)
+        self.content_types = content_types or ["video", "pdf"]
+        self.title_pattern = re.compile(title_pattern, re.IGNORECASE) if title_pattern else None
+        self.topic_pattern = re.compile(topic_pattern, re.IGNORECASE) if topic_pattern else None
+
+    @classmethod
+    def from_flags(cls, download_archive=True, download_marathon=True, download_bangla=True,
+                   download_english=True, content_types=None):
+        """Selection from the downloader's older on/off options"""
+        return cls(
+            kinds=[kind for kind, wanted in (("Marathon", download_marathon), ("Archive", download_archive)) if wanted],
+            languages=[code for code, wanted in (("Bn", download_bangla), ("En", download_english)) if wanted],
+            content_types=content_types
+        )
+
+    def narrow(self, subjects=None, from_chapter=None, to_chapter=None):
+        """Apply the older download_all() arguments on top of the selection"""
+        if subjects:
+            self.subjects = {subject.strip().lower() for subject in subjects}
+        self._narrow_window(from_chapter, to_chapter)
+
+    def _narrow_window(self, from_chapter, to_chapter):
+        """Intersect the from/to chapter window with the one already set"""
+        if not (from_chapter or to_chapter):
+            return
+        low, high = from_chapter or 1, to_chapter or float('inf')
+        if self.chapter_window:
+            low, high = max(low, self.chapter_window[0]), min(high, self.chapter_window[1])
+        self.chapter_window = (low, high)
+
+    def subject(self, name):
+        return self.subjects is None or name.strip().lower() in self.subjects
+
+    def chapter(self, chapter):
+        if self.chapter_window and not self.chapter_window[0] <= chapter['number'] <= self.chapter_window[1]:
+            return False
+        if not self.chapter_ranges and not self.chapter_names:
+            return True
+        if any(low <= chapter['number'] <= high for low, high in self.chapter_ranges):
+            return True
+        return any(name in chapter['name'].lower() for name in self.chapter_names)
+
+    def kind(self, name):
+        return name in self.kinds
+
+    def card(self, card):
+        if self.title_pattern and not self.title_pattern.search(card['title']):
+            return False
+        return not self.topic_pattern or bool(self.topic_pattern.search(card.get('topic') or ''))
+
+    def file_type(self, file_type):
+        return file_type in self.content_types
+
+    def describe(self):
+        parts = []
+        if self.subjects:
+            parts.append(f"subjects={sorted(self.subjects)}")
+        if self.chapter_ranges or self.chapter_names:
+            ranges = [f"{low}-{high}" if low != high else str(low) for low, high in self.chapter_ranges]
+            parts.append(f"chapters={','.join(ranges + self.chapter_names)}")
+        if self.chapter_window:
+            low, high = self.chapter_window
+            parts.append(f"from={low}, to={'end' if high == float('inf') else high}")
+        parts.append(f"kinds={self.kinds}, languages={self.languages}, types={self.content_types}")
+        if self.title_pattern:
+            parts.append(f"title=/{self.title_pattern.pattern}/")
+        if self.topic_pattern:
+            parts.append(f"topic=/{self.topic_pattern.pattern}/")
+        return ", ".join(parts)
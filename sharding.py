@@ -0,0 +1,94 @@
+import os
+import sys
+import glob
+import json
+import hashlib
+import argparse
+
+# Combined manifest of every run so far, cached between workflow runs
+MERGED_MANIFEST = "manifest.merged.json"
+
+
+def shard_for(chapter, shard_count):
+    """Stable shard number for a chapter, the same on every runner and every run"""
+    key = f"{chapter['subject_name']}:{chapter.get('id') or chapter['name']}"
+    return int(hashlib.sha1(key.encode('utf-8')).hexdigest(), 16) % shard_count
+
+
+def shard_suffix(shard_index, shard_count):
+    """File name suffix for per-shard state, empty when not sharding"""
+    return f".shard{shard_index}-of-{shard_count}" if shard_count > 1 else ""
+
+
+def merge_topic_structures(fragments):
+    """Combine shard fragments into one topic structure, with chapters in catalog order"""
+    catalog = {}
+    for fragment in fragments:
+        for subject, chapters in fragment.get('catalog', {}).items():
+            catalog.setdefault(subject, [])
+            catalog[subject] += [chapter for chapter in chapters if chapter not in catalog[subject]]
+
+    merged = {}
+    for fragment in fragments:
+        for subject, chapters in fragment['topic_structure'].items():
+            for chapter, content_types in chapters.items():
+                target = merged.setdefault(subject, {}).setdefault(chapter, {})
+                for content_type, topics in content_types.items():
+                    for topic, titles in topics.items():
+                        existing = target.setdefault(content_type, {}).setdefault(topic, [])
+                        existing += [title for title in titles if title not in existing]
+
+    def chapter_position(subject, chapter):
+        order = catalog.get(subject, [])
+        return order.index(chapter) if chapter in order else len(order)
+
+    subjects = sorted(merged, key=lambda subject: list(catalog).index(subject) if subject in catalog else len(catalog))
+    return {
+        subject: {chapter: merged[subject][chapter]
+                  for chapter in sorted(merged[subject], key=lambda chapter: chapter_position(subject, chapter))}
+        for subject in subjects
+    }
+
+
+def merge_manifests(manifests):
+    merged = {}
+    for manifest in manifests:
+        merged.update(manifest)
+    return merged
+
+
+def _load(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Merge per-shard topic structures and upload manifests")
+    parser.add_argument("download_dir", nargs="?", default=os.environ.get('DOWNLOAD_DIR', 'downloads'))
+    args = parser.parse_args(argv)
+
+    fragment_paths = sorted(glob.glob(os.path.join(args.download_dir, "**", "topic_structure.shard*.json"), recursive=True))
+    # Shard manifests, unsharded ones and the merged manifest restored from the cache
+    manifest_paths = sorted(glob.glob(os.path.join(args.download_dir, "**", "manifest*.json"), recursive=True))
+    if not fragment_paths and not manifest_paths:
+        # A first run, or one that posted nothing: nothing to merge is not an error
+        print(f"No shard fragments found under {args.download_dir}, nothing to merge")
+        return 0
+
+    if fragment_paths:
+        structure = merge_topic_structures([_load(path) for path in fragment_paths])
+        with open(os.path.join(args.download_dir, "topic_structure.json"), 'w', encoding='utf-8') as f:
+            json.dump(structure, f, indent=2, ensure_ascii=False)
+        print(f"Merged {len(fragment_paths)} topic structure fragments")
+
+    if manifest_paths:
+        merged = merge_manifests([_load(path) for path in manifest_paths])
+        for name in ("manifest.json", MERGED_MANIFEST):
+            with open(os.path.join(args.download_dir, name), 'w', encoding='utf-8') as f:
+                json.dump(merged, f, ensure_ascii=False)
+        print(f"Merged {len(manifest_paths)} manifests")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
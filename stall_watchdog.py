@@ -0,0 +1,97 @@
+import time
+import logging
+import threading
+
+
+class Watchdog:
+    """Cancels transfers whose throughput stays below min_rate for a whole window.
+
+    Each tracked transfer has a cancel callback and either reports its byte
+    count through update() or is sampled with a progress callable. Every
+    window the bytes moved since the last check are compared against
+    min_rate; a transfer that falls short is cancelled and flagged, so its
+    owner can tell a stall from an ordinary failure and requeue it.
+    """
+    def __init__(self, window=300, min_rate=1024, interval=10, logger=None):
+        self.window = window
+        self.min_rate = min_rate
+        self.interval = interval
+        self.logger = logger or logging.getLogger(__name__)
+        self._transfers = {}
+        self._stalled = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        if window:
+            threading.Thread(target=self._run, daemon=True).start()
+
+    def track(self, key, cancel, progress=None):
+        now = time.monotonic()
+        with self._lock:
+            self._stalled.discard(key)
+            self._transfers[key] = {
+                'cancel': cancel,
+                'progress': progress,
+                'bytes': 0,
+                'mark_time': now,
+                'mark_bytes': None
+            }
+
+    def update(self, key, transferred):
+        """Report the bytes a transfer has moved so far"""
+        with self._lock:
+            if key in self._transfers:
+                self._transfers[key]['bytes'] = transferred
+
+    def untrack(self, key):
+        with self._lock:
+            self._transfers.pop(key, None)
+
+    def stalled(self, key):
+        """True (once) if the watchdog cancelled this transfer"""
+        with self._lock:
+            if key in self._stalled:
+                self._stalled.discard(key)
+                return True
+            return False
+
+    def is_stalled(self, key):
+        """Like stalled(), without clearing the flag"""
+        with self._lock:
+            return key in self._stalled
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                transfers = list(self._transfers.items())
+            now = time.monotonic()
+            for key, transfer in transfers:
+                try:
+                    transferred = transfer['progress']() if transfer['progress'] else transfer['bytes']
+                except Exception:
+                    continue
+                if transfer['mark_bytes'] is None:
+                    transfer['mark_bytes'] = transferred
+                    transfer['mark_time'] = now
+                    continue
+
+                elapsed = now - transfer['mark_time']
+                if elapsed < self.window:
+                    continue
+                rate = (transferred - transfer['mark_bytes']) / elapsed
+                if rate >= self.min_rate:
+                    transfer['mark_bytes'] = transferred
+                    transfer['mark_time'] = now
+                    continue
+
+                self.logger.warning(f"Transfer stalled at {rate / 1024:.1f} KB/s for {int(elapsed)}s, restarting: {key}")
+                with self._lock:
+                    if self._transfers.pop(key, None) is None:
+                        continue
+                    self._stalled.add(key)
+                try:
+                    transfer['cancel']()
+                except Exception as e:
+                    self.logger.error(f"Failed to cancel stalled transfer {key}: {str(e)}")
@@ -0,0 +1,359 @@
+import os
+import re
+import shutil
+import logging
+import threading
+import subprocess
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlparse
+from requests.adapters import HTTPAdapter
+
+
+class UnsupportedStream(Exception):
+    """The manifest uses features we don't fetch ourselves; ffmpeg has to handle it"""
+
+
+def is_stream_manifest(url):
+    """Whether a URL points at an HLS (.m3u8) or DASH (.mpd) manifest"""
+    return urlparse(url).path.lower().endswith(('.m3u8', '.mpd'))
+
+
+def _attributes(line):
+    """Parse an HLS attribute list like BANDWIDTH=1280000,RESOLUTION=1280x720,CODECS="a,b" """
+    return {key: value.strip('"') for key, value in re.findall(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)', line)}
+
+
+def parse_hls_master(text, base_url):
+    """Return (variant_uri, audio_uri) for the highest-bandwidth variant, or (None, None) for a media playlist.
+
+    audio_uri is the playlist of the variant's separate audio rendition (the
+    group's DEFAULT one, else its first), or None if the audio is muxed in.
+    """
+    best = None
+    renditions = {}
+    lines = [line.strip() for line in text.splitlines()]
+    for i, line in enumerate(lines):
+        if line.startswith('#EXT-X-MEDIA:'):
+            attrs = _attributes(line.split(':', 1)[1])
+            if attrs.get('TYPE') == 'AUDIO' and attrs.get('URI'):
+                renditions.setdefault(attrs.get('GROUP-ID'), []).append(attrs)
+        elif line.startswith('#EXT-X-STREAM-INF:'):
+            attrs = _attributes(line.split(':', 1)[1])
+            width, _, height = attrs.get('RESOLUTION', '0x0').partition('x')
+            key = (int(attrs.get('BANDWIDTH', 0) or 0), int(height or 0))
+            uri = next((l for l in lines[i + 1:] if l and not l.startswith('#')), None)
+            if uri and (best is None or key > best[0]):
+                best = (key, urljoin(base_url, uri), attrs.get('AUDIO'))
+    if not best:
+        return None, None
+
+    group = renditions.get(best[2], [])
+    audio = next((attrs for attrs in group if attrs.get('DEFAULT') == 'YES'), group[0] if group else None)
+    return best[1], urljoin(base_url, audio['URI']) if audio else None
+
+
+def parse_hls_media(text, base_url):
+    """Return (init_segment_url, segment_urls) of an unencrypted media playlist"""
+    init_url = None
+    segments = []
+    for line in (line.strip() for line in text.splitlines()):
+        if line.startswith('#EXT-X-KEY:') and 'METHOD=NONE' not in line:
+            raise UnsupportedStream("encrypted HLS")
+        if line.startswith('#EXT-X-BYTERANGE'):
+            raise UnsupportedStream("byte-range HLS")
+        if line.startswith('#EXT-X-MAP:'):
+            attrs = _attributes(line.split(':', 1)[1])
+            if 'BYTERANGE' in attrs:
+                raise UnsupportedStream("byte-range HLS")
+            init_url = urljoin(base_url, attrs['URI'])
+        elif line and not line.startswith('#'):
+            segments.append(urljoin(base_url, line))
+    return init_url, segments
+
+
+def _local(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def _children(element, name):
+    return [child for child in element if _local(child.tag) == name]
+
+
+def _child(element, name):
+    found = _children(element, name)
+    return found[0] if found else None
+
+
+def _first(*elements):
+    # Elements without children are falsy, so `a or b` can't be used to pick one
+    return next((element for element in elements if element is not None), None)
+
+
+def _parse_duration(value):
+    """ISO 8601 duration like PT1H2M3.5S to seconds"""
+    match = re.match(r'P(?:(\d+)D)?T?(?:(\d+)H)?(?:(\d+)M)?(?:([\d.]+)S)?', value or '')
+    if not match:
+        return 0
+    days, hours, minutes, seconds = match.groups()
+    return int(days or 0) * 86400 + int(hours or 0) * 3600 + int(minutes or 0) * 60 + float(seconds or 0)
+
+
+def _base_url(element, base_url):
+    base = _child(element, 'BaseURL')
+    return urljoin(base_url, base.text.strip()) if base is not None and base.text else base_url
+
+
+def _fill_template(template, representation, number=None, time=None):
+    def substitute(match):
+        name, fmt = match.group(1), match.group(2)
+        value = {'RepresentationID': representation.get('id'), 'Bandwidth': representation.get('bandwidth'),
+                 'Number': number, 'Time': time}[name]
+        return ('%' + fmt[1:]) % int(value) if fmt else str(value)
+    return re.sub(r'\$(RepresentationID|Bandwidth|Number|Time)(%0\d+d)?\$', substitute, template)
+
+
+def _representation_segments(period, adaptation, representation, base_url, total_duration):
+    """Return (init_url, segment_urls) for a DASH representation"""
+    base_url = _base_url(representation, _base_url(adaptation, _base_url(period, base_url)))
+
+    template = _first(_child(representation, 'SegmentTemplate'), _child(adaptation, 'SegmentTemplate'))
+    if template is not None:
+        init = template.get('initialization')
+        init_url = urljoin(base_url, _fill_template(init, representation)) if init else None
+        media = template.get('media')
+        start = int(template.get('startNumber', 1))
+        timescale = int(template.get('timescale', 1))
+        timeline = _child(template, 'SegmentTimeline')
+        segments = []
+        if timeline is not None:
+            number, time = start, 0
+            for s in _children(timeline, 'S'):
+                time = int(s.get('t', time))
+                for _ in range(int(s.get('r', 0)) + 1):
+                    segments.append(urljoin(base_url, _fill_template(media, representation, number, time)))
+                    number += 1
+                    time += int(s.get('d'))
+        else:
+            duration = int(template.get('duration', 0)) / timescale
+            if not duration or not total_duration:
+                raise UnsupportedStream("DASH template without duration")
+            count = int(-(-total_duration // duration))
+            segments = [urljoin(base_url, _fill_template(media, representation, start + i)) for i in range(count)]
+        return init_url, segments
+
+    segment_list = _first(_child(representation, 'SegmentList'), _child(adaptation, 'SegmentList'))
+    if segment_list is not None:
+        init = _child(segment_list, 'Initialization')
+        init_url = urljoin(base_url, init.get('sourceURL')) if init is not None and init.get('sourceURL') else None
+        return init_url, [urljoin(base_url, s.get('media')) for s in _children(segment_list, 'SegmentURL')]
+
+    if _child(representation, 'SegmentBase') is not None or _child(representation, 'BaseURL') is not None:
+        # A single progressive file per track
+        return None, [base_url]
+
+    raise UnsupportedStream("unknown DASH segment addressing")
+
+
+def parse_dash(text, base_url):
+    """Return a list of (kind, init_url, segment_urls) for the best video and audio tracks"""
+    root = ET.fromstring(text)
+    if root.get('type') == 'dynamic':
+        raise UnsupportedStream("live DASH")
+    if any(_local(el.tag) == 'ContentProtection' for el in root.iter()):
+        raise UnsupportedStream("DRM-protected DASH")
+
+    total_duration = _parse_duration(root.get('mediaPresentationDuration'))
+    period = _child(root, 'Period')
+    best = {}
+    for adaptation in _children(period, 'AdaptationSet'):
+        for representation in _children(adaptation, 'Representation'):
+            mime = representation.get('mimeType') or adaptation.get('mimeType') or ''
+            kind = adaptation.get('contentType') or mime.split('/')[0]
+            if kind not in ('video', 'audio'):
+                continue
+            key = (int(representation.get('bandwidth', 0)), int(representation.get('height', 0)))
+            if kind not in best or key > best[kind][0]:
+                best[kind] = (key, adaptation, representation)
+
+    if 'video' not in best:
+        raise UnsupportedStream("no video track in DASH manifest")
+    tracks = []
+    for kind in ('video', 'audio'):
+        if kind in best:
+            _, adaptation, representation = best[kind]
+            tracks.append((kind,) + _representation_segments(period, adaptation, representation,
+                                                             _base_url(root, base_url), total_duration))
+    return tracks
+
+
+class StreamDownloader:
+    """Downloads HLS/DASH streams: parallel segment fetches over a pooled session, remuxed to mp4 without re-encoding.
+
+    Fetched segments are kept in a '<output>.segments' directory until the
+    remux succeeds, so an interrupted download resumes where it stopped. The
+    output only appears under its final name once complete. Downloads can be
+    cancelled one at a time (stall watchdog) or all at once (shutdown).
+    """
+    def __init__(self, session, logger=None, pool_size=64, limiter=None):
+        self.session = session
+        self.limiter = limiter
+        self.logger = logger or logging.getLogger(__name__)
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._jobs = {}  # output path -> {'cancelled': Event, 'processes': set of ffmpeg processes}
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+
+    def cancel(self, output_path=None):
+        """Abort one running download, or all of them (shutdown); fetched segments are kept for resuming"""
+        with self._lock:
+            if output_path is None:
+                self._cancelled.set()
+                jobs = list(self._jobs.values())
+            else:
+                jobs = [self._jobs[output_path]] if output_path in self._jobs else []
+            for job in jobs:
+                job['cancelled'].set()
+                for process in list(job['processes']):
+                    process.terminate()
+
+    def download(self, manifest_url, output_path, workers=16):
+        """Download a manifest to output_path; returns True on success"""
+        segment_dir = f"{output_path}.segments"
+        temp_output = f"{output_path}.part.mp4"
+        os.makedirs(segment_dir, exist_ok=True)
+        job = {'cancelled': threading.Event(), 'processes': set()}
+        with self._lock:
+            self._jobs[output_path] = job
+
+        try:
+            try:
+                self._download_segments(manifest_url, segment_dir, temp_output, workers, job)
+            except UnsupportedStream as e:
+                self.logger.info(f"Letting ffmpeg fetch the stream ({str(e)})")
+                self._finish_ffmpeg(self._start_ffmpeg(["-i", manifest_url], temp_output, job, adts=True), job)
+            os.replace(temp_output, output_path)
+            shutil.rmtree(segment_dir, ignore_errors=True)
+            return True
+        except Exception as e:
+            if not self._is_cancelled(job):
+                self.logger.error(f"Stream download failed: {str(e)}")
+            return False
+        finally:
+            with self._lock:
+                self._jobs.pop(output_path, None)
+            if os.path.exists(temp_output):
+                os.remove(temp_output)
+
+    def _is_cancelled(self, job):
+        return self._cancelled.is_set() or job['cancelled'].is_set()
+
+    def _get(self, url):
+        response = self.session.get(url, timeout=30)
+        response.raise_for_status()
+        return response
+
+    def _download_segments(self, manifest_url, segment_dir, temp_output, workers, job):
+        response = self._get(manifest_url)
+        dash = urlparse(manifest_url).path.lower().endswith('.mpd')
+        if dash:
+            tracks = parse_dash(response.text, response.url)
+        else:
+            media_url, audio_url = parse_hls_master(response.text, response.url)
+            if media_url:
+                response = self._get(media_url)
+            tracks = [('video',) + parse_hls_media(response.text, response.url)]
+            if audio_url:
+                response = self._get(audio_url)
+                tracks.append(('audio',) + parse_hls_media(response.text, response.url))
+
+        if len(tracks) == 1:
+            # Single muxed track: stream segments straight into ffmpeg as they arrive in order
+            kind, init_url, segments = tracks[0]
+            process = self._start_ffmpeg(["-i", "pipe:0"], temp_output, job, stdin=subprocess.PIPE, adts=True)
+            try:
+                self._fetch_track(kind, init_url, segments, segment_dir, workers, process.stdin, job)
+                process.stdin.close()
+            except BaseException:
+                process.kill()
+                process.wait()
+                with self._lock:
+                    job['processes'].discard(process)
+                raise
+            self._finish_ffmpeg(process, job)
+            return
+
+        # Separate video and audio: assemble each track, then mux with stream copy
+        inputs = []
+        for kind, init_url, segments in tracks:
+            track_path = os.path.join(segment_dir, f"{kind}.mp4")
+            with open(track_path, 'wb') as track:
+                self._fetch_track(kind, init_url, segments, segment_dir, workers, track, job)
+            inputs += ["-i", track_path]
+        # HLS audio renditions are MPEG-TS with ADTS AAC as well
+        self._finish_ffmpeg(self._start_ffmpeg(inputs, temp_output, job, adts=not dash), job)
+
+    def _fetch_segment(self, url, path, job):
+        """Fetch one segment to disk unless an earlier run already did"""
+        if os.path.exists(path):
+            return path
+        if self._is_cancelled(job):
+            raise RuntimeError("cancelled")
+        with self.session.get(url, timeout=60, stream=True) as response:
+            response.raise_for_status()
+            with open(f"{path}.part", 'wb') as f:
+                for chunk in response.iter_content(1024 * 1024):
+                    if self._is_cancelled(job):
+                        raise RuntimeError("cancelled")
+                    if self.limiter:
+                        self.limiter.wait(len(chunk))
+                    f.write(chunk)
+        os.replace(f"{path}.part", path)
+        return path
+
+    def _fetch_track(self, kind, init_url, segments, segment_dir, workers, output, job):
+        """Fetch segments in parallel and write them to output in playlist order"""
+        urls = ([init_url] if init_url else []) + segments
+        paths = [os.path.join(segment_dir, f"{kind}_{i:06d}") for i in range(len(urls))]
+        self.logger.info(f"Fetching {len(segments)} {kind} segments with {workers} connections")
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(self._fetch_segment, url, path, job) for url, path in zip(urls, paths)]
+            try:
+                next_report = 0.1
+                for i, future in enumerate(futures, 1):
+                    with open(future.result(), 'rb') as segment:
+                        shutil.copyfileobj(segment, output, 1024 * 1024)
+                    if i / len(futures) >= next_report:
+                        self.logger.info(f"{kind.capitalize()} segments: {i}/{len(futures)}")
+                        next_report += 0.1
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+
+    def _start_ffmpeg(self, inputs, output_path, job, stdin=None, adts=False):
+        # Stream copy only; the ADTS filter makes AAC from MPEG-TS valid in mp4.
+        # With a separate audio input, audio is taken from it alone, so there is one audio track.
+        audio_input = 1 if inputs.count("-i") > 1 else 0
+        args = ["ffmpeg", "-y", "-loglevel", "error"] + inputs + \
+               ["-map", "0:v:0?", "-map", f"{audio_input}:a:0?"] + \
+               ["-c", "copy"] + (["-bsf:a", "aac_adtstoasc"] if adts else []) + ["-f", "mp4", output_path]
+        process = subprocess.Popen(args, stdin=stdin)
+        with self._lock:
+            job['processes'].add(process)
+            if self._is_cancelled(job):
+                process.terminate()
+        return process
+
+    def _finish_ffmpeg(self, process, job):
+        try:
+            returncode = process.wait()
+        finally:
+            with self._lock:
+                job['processes'].discard(process)
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, "ffmpeg")
+
@@ -0,0 +1,44 @@
+import asyncio
+import unittest
+
+from ordering import ReorderBuffer
+
+
+class ReorderBufferTest(unittest.TestCase):
+    def run_buffer(self, steps, stall_timeout=0.3, holds=None):
+        """Run (delay, method, *args) steps against a buffer; returns the committed sequence numbers"""
+        committed = []
+
+        async def commit(entry):
+            committed.append(entry)
+
+        async def main():
+            buffer = ReorderBuffer(commit, stall_timeout=stall_timeout, holds=holds)
+            task = buffer.start(asyncio.get_running_loop())
+            for delay, method, *args in steps:
+                await asyncio.sleep(delay)
+                getattr(buffer, method)(*args)
+            await asyncio.sleep(0.1)
+            task.cancel()
+
+        asyncio.run(main())
+        return committed
+
+    def test_idle_gap_does_not_skip_the_next_number(self):
+        # Nothing happens for longer than the timeout, then 3 arrives just before 2
+        committed = self.run_buffer([(0, 'ready', 1, 1), (0.6, 'ready', 3, 3), (0.1, 'ready', 2, 2)])
+        self.assertEqual(committed, [1, 2, 3])
+
+    def test_held_number_is_waited_for(self):
+        committed = self.run_buffer([(0, 'ready', 1, 1), (0, 'ready', 3, 3), (1, 'ready', 2, 2)],
+                                    holds=lambda seq: seq == 2)
+        self.assertEqual(committed, [1, 2, 3])
+
+    def test_dropped_number_is_given_up_on(self):
+        committed = self.run_buffer([(0, 'ready', 1, 1), (0, 'ready', 3, 3), (1, 'ready', 4, 4)],
+                                    holds=lambda seq: False)
+        self.assertEqual(committed, [1, 3, 4])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import re
+import time
+import logging
+import threading
+from datetime import datetime, timezone
+from urllib.parse import urlparse, parse_qs, parse_qsl, urlencode, urljoin
+from bs4 import BeautifulSoup
+
+
+class LinkExpired(Exception):
+    """A signed download URL was rejected by the CDN and has to be resolved again"""
+
+
+def find_video_source(html):
+    """Find the video source in a video page: a progressive mp4, or an HLS/DASH manifest"""
+    match = (
+        re.search(r'<source src="([^"]+)" type="video/mp4">', html)
+        or re.search(r'<source src="([^"]+)" type="(?:application/x-mpegurl|application/vnd\.apple\.mpegurl|application/dash\+xml)"', html, re.I)
+        or re.search(r'["\'](https?://[^"\']+\.(?:m3u8|mpd)(?:\?[^"\']*)?)["\']', html)
+    )
+    return match.group(1).replace("&amp;", "&") if match else None
+
+
+def find_pdf_link(html, base_url):
+    """Find the download button link in a note page"""
+    link = BeautifulSoup(html, 'html.parser').select_one("a.btn-success[href]")
+    return urljoin(base_url, link['href']) if link else None
+
+
+def parse_expiry(url):
+    """Expiry of a signed URL as a unix timestamp, or None if the query string doesn't carry one"""
+    params = {key.lower(): values[0] for key, values in parse_qs(urlparse(url).query).items()}
+
+    # AWS SigV4: signing time plus lifetime in seconds
+    if 'x-amz-date' in params and 'x-amz-expires' in params:
+        try:
+            signed = datetime.strptime(params['x-amz-date'], "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc)
+            return signed.timestamp() + int(params['x-amz-expires'])
+        except ValueError:
+            pass
+
+    # CloudFront/S3 v2 'Expires', generic 'exp'/'expires'/'expire'/'e'
+    for key in ('expires', 'expire', 'exp', 'e'):
+        if params.get(key, '').isdigit() and int(params[key]) > 1e9:
+            return int(params[key])
+
+    # Akamai-style tokens: hdnts=st=...~exp=...~acl=...
+    for value in params.values():
+        match = re.search(r'(?:^|~)exp=(\d+)', value)
+        if match:
+            return int(match.group(1))
+
+    return None
+
+
+# Query parameters that sign or time-limit a URL rather than pick the object
+SIGNATURE_PARAMS = {'expires', 'expire', 'exp', 'e', 'signature', 'sig', 'token', 'policy', 'key-pair-id',
+                    'hdnts', 'hdntl', 'st', 'md5', 'hash', 'auth', 'validfrom', 'validto'}
+
+
+def normalize_source(url):
+    """The URL with signing parameters dropped, so two signed links to one object compare equal"""
+    parsed = urlparse(url)
+    host = parsed.hostname or ''
+    if parsed.port and parsed.port not in (80, 443):
+        host = f"{host}:{parsed.port}"
+    params = sorted((key, value) for key, value in parse_qsl(parsed.query, keep_blank_values=True)
+                    if key.lower() not in SIGNATURE_PARAMS and not key.lower().startswith('x-amz-'))
+    return f"{host}{parsed.path}" + (f"?{urlencode(params)}" if params else "")
+
+
+class UrlResolver:
+    """Resolves download URLs just in time and tracks when signed URLs expire.
+
+    Tasks carry the card page URL ('page_url') and, once resolved, the signed
+    'url' with 'resolved_at' and 'expires_at'. Expiry comes from the query
+    string when present; otherwise it is learned from the age at which links
+    have been observed to fail. Failures younger than the margin are taken to
+    be unrelated to expiry and don't count.
+    """
+    def __init__(self, resolve_page, margin=120, logger=None):
+        self._resolve_page = resolve_page
+        self.margin = margin
+        self.logger = logger or logging.getLogger(__name__)
+        self.learned_ttl = None
+        self._lock = threading.Lock()
+
+    def is_fresh(self, task):
+        if not task.get('url'):
+            return False
+        expires_at = task.get('expires_at')
+        if expires_at is None and self.learned_ttl and task.get('resolved_at'):
+            expires_at = task['resolved_at'] + self.learned_ttl
+        return expires_at is None or time.time() < expires_at - self.margin
+
+    def ensure(self, task):
+        """Return a usable download URL for the task, resolving it again if it is missing or stale"""
+        if self.is_fresh(task) or not task.get('page_url'):
+            return task.get('url')
+
+        url = self._resolve_page(task['page_url'], task['file_type'])
+        task['url'] = url
+        task['resolved_at'] = time.time()
+        task['expires_at'] = parse_expiry(url) if url else None
+        return url
+
+    def mark_failed(self, task):
+        """Record that the task's URL was rejected, learning the link lifetime if it had no explicit expiry"""
+        if task.get('expires_at') is None and task.get('resolved_at'):
+            age = time.time() - task['resolved_at']
+            with self._lock:
+                # A quick 401/403 is an access error rather than an expired link; of several
+                # plausible lifetimes the larger is kept, so one early failure can't make
+                # every link look stale
+                if age > self.margin and (self.learned_ttl is None or age > self.learned_ttl):
+                    self.learned_ttl = age
+                    self.logger.info(f"Learned download link lifetime: {int(age)}s")
+        task['url'] = None